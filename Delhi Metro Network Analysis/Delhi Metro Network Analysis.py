@@ -7,13 +7,21 @@
 # In[5]:
 
 
+import os
+import sys
+
 import pandas as pd
-import folium
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import plotly.io as pio
-pio.templates.default = "plotly_white"
+
+# plotting libraries are imported on first use, and the figure code is skipped when ANALYSIS_HEADLESS=1;
+# the tables are recorded with output.result (and pickled to ANALYSIS_RESULTS when it is set)
+sys.path.append(os.path.abspath(os.pardir))
+from script_output import ScriptOutput
+
+output = ScriptOutput("delhi metro", plotly_template="plotly_white")
+folium = output.module('folium')
+px = output.module('plotly.express')
+go = output.module('plotly.graph_objects')
+make_subplots = output.function('plotly.subplots', 'make_subplots')
 
 metro_data = pd.read_csv("Delhi Metro Network")
 
@@ -39,6 +47,18 @@ from datetime import datetime
 metro_data['Opening Date'] = pd.to_datetime(metro_data['Opening Date'])
 
 
+# * The station records are not fully consistent: 'Violet line' is spelt 'Voilet line', station names carry interchange markers such as "[Conn: Red]", and an interchange station appears once per line. Normalizing them gives every row its physical station and canonical line, builds the interchange table, and validates coordinates and distances along each line. The graph and map code below reuse these normalized tables.
+
+# In[11]:
+
+
+from station_records import normalized
+
+station_records = normalized(metro_data)
+print(len(station_records.stations), 'stations,', len(station_records.interchanges), 'interchanges')
+station_records.report()
+
+
 # # Geospatial Analysis
 
 # * Now, I’ll start by visualizing the locations of the metro stations on a map. It will give us an insight into the geographical distribution of the stations across Delhi. We will use the latitude and longitude data to plot each station.
@@ -54,7 +74,7 @@ line_colors = {
     'Blue line': 'blue',
     'Yellow line': 'beige',
     'Green line': 'green',
-    'Voilet line': 'purple',
+    'Violet line': 'purple',
     'Pink line': 'pink',
     'Magenta line': 'darkred',
     'Orange line': 'orange',
@@ -65,23 +85,41 @@ line_colors = {
     'Gray line': 'lightgray'
 }
 
-delhi_map_with_line_tooltip = folium.Map(location=[28.7041, 77.1025], zoom_start=11)
+delhi_map_with_line_tooltip = None
+if output.plots:
+    delhi_map_with_line_tooltip = folium.Map(location=[28.7041, 77.1025], zoom_start=11)
 
-# adding colored markers for each metro station with line name in tooltip
-for index, row in metro_data.iterrows():
-    line = row['Line']
-    color = line_colors.get(line, 'black')  # Default color is black if line not found in the dictionary
-    folium.Marker(
-        location=[row['Latitude'], row['Longitude']],
-        popup=f"{row['Station Name']}",
-        tooltip=f"{row['Station Name']}, {line}",
-        icon=folium.Icon(color=color)
-    ).add_to(delhi_map_with_line_tooltip)
+    # adding one GeoJSON layer of circles coloured by line, with station name and line in the tooltip;
+    # nearby stations of a line are grouped into one circle when zoomed out (lines not in the dictionary are black)
+    from map_layers import add_point_layer
+
+    station_layer, station_clusters = add_point_layer(delhi_map_with_line_tooltip, station_records.stops, line_colors)
 
 # Displaying the updated map
 delhi_map_with_line_tooltip
 
 
+# * To relate other geo-tagged data (for example trip pickup points) to the network, a spatial index over the station coordinates answers nearest-station and within-radius queries for many points at once, with great-circle distances.
+
+# In[13]:
+
+
+from spatial_index import StationIndex
+
+station_index = StationIndex(station_records.stops)
+
+# Connaught Place and India Gate
+points = pd.DataFrame({'Latitude': [28.6315, 28.6129], 'Longitude': [77.2167, 77.2295]})
+output.result('nearest stations', station_index.nearest_stations(points['Latitude'], points['Longitude'], k=3))
+
+
+# In[14]:
+
+
+output.result('stations within 1 km', station_index.stations_within(points['Latitude'], points['Longitude'],
+                                                                    radius_km=1.0))
+
+
 # In[23]:
 
 
@@ -123,21 +161,49 @@ stations_per_year_df.columns = ['Year', 'Number of Stations']
 # In[31]:
 
 
-stations_per_year_df
+output.result('stations per year', stations_per_year_df)
 
 
 # In[32]:
 
 
-fig = px.bar(stations_per_year_df, x='Year', y='Number of Stations',
-             title="Number of Metro Stations Opened Each Year in Delhi",
-             labels={'Year': 'Year', 'Number of Stations': 'Number of Stations Opened'})
+if output.plots:
+    fig = px.bar(stations_per_year_df, x='Year', y='Number of Stations',
+                 title="Number of Metro Stations Opened Each Year in Delhi",
+                 labels={'Year': 'Year', 'Number of Stations': 'Number of Stations Opened'})
 
-fig.update_layout(xaxis_tickangle=-45, xaxis=dict(tickmode='linear'),
-                  yaxis=dict(title='Number of Stations Opened'),
-                  xaxis_title="Year")
+    fig.update_layout(xaxis_tickangle=-45, xaxis=dict(tickmode='linear'),
+                      yaxis=dict(title='Number of Stations Opened'),
+                      xaxis_title="Year")
 
-fig.show()
+    fig.show()
+
+
+# * Replaying the openings in date order rebuilds the network as it stood at any date. Consecutive open stations of a line are joined (trains ran through infill stations before they opened), and the shortest distances are updated as each segment opens, so the growth of the network's diameter and mean shortest path comes from one pass over the history.
+
+# In[33]:
+
+
+from metro_graph import MetroGraph
+from network_history import NetworkHistory
+
+network_history = NetworkHistory(MetroGraph(station_records))
+network_growth = output.result('network growth', network_history.yearly())
+
+if output.plots:
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(go.Scatter(x=network_growth['Year'], y=network_growth['Diameter (km)'],
+                             mode='lines+markers', name='Diameter (km)'))
+    fig.add_trace(go.Scatter(x=network_growth['Year'], y=network_growth['Mean Shortest Path (km)'],
+                             mode='lines+markers', name='Mean Shortest Path (km)'))
+    fig.add_trace(go.Bar(x=network_growth['Year'], y=network_growth['Stations'], name='Open Stations', opacity=0.3),
+                  secondary_y=True)
+    fig.update_layout(title="Growth of the Delhi Metro Network by Year", xaxis=dict(tickmode='linear'),
+                      xaxis_title="Year", yaxis_title="Distance (km)", template="plotly_white")
+    fig.update_yaxes(title_text="Open Stations", secondary_y=True)
+
+    fig.show()
+network_growth
 
 
 # # Line Analysis
@@ -151,10 +217,10 @@ metro_data.head()
 # In[40]:
 
 
-stations_per_line = metro_data['Line'].value_counts()
+stations_per_line = station_records.stops['Line'].value_counts()
 
 # calculating the total distance of each metro line (max distance from start)
-total_distance_per_line = metro_data.groupby('Line')['Distance from Start (km)'].max()
+total_distance_per_line = station_records.stops.groupby('Line')['Distance from Start (km)'].max()
 
 avg_distance_per_line = total_distance_per_line / (stations_per_line - 1)
 
@@ -168,43 +234,158 @@ line_analysis = pd.DataFrame({
 line_analysis = line_analysis.sort_values(by='Number of Stations', ascending=False)
 
 line_analysis.reset_index(drop=True, inplace=True)
-line_analysis
+output.result('line analysis', line_analysis)
 
 
 # In[41]:
 
 
-# creating subplots
-fig = make_subplots(rows=1, cols=2, subplot_titles=('Number of Stations Per Metro Line',
-                                                    'Average Distance Between Stations Per Metro Line'),
-                    horizontal_spacing=0.2)
+if output.plots:
+    # creating subplots
+    fig = make_subplots(rows=1, cols=2, subplot_titles=('Number of Stations Per Metro Line',
+                                                        'Average Distance Between Stations Per Metro Line'),
+                        horizontal_spacing=0.2)
+
+    # plot for Number of Stations per Line
+    fig.add_trace(
+        go.Bar(y=line_analysis['Line'], x=line_analysis['Number of Stations'],
+               orientation='h', name='Number of Stations', marker_color='crimson'),
+        row=1, col=1
+    )
+
+    # plot for Average Distance Between Stations
+    fig.add_trace(
+        go.Bar(y=line_analysis['Line'], x=line_analysis['Average Distance Between Stations (km)'],
+               orientation='h', name='Average Distance (km)', marker_color='navy'),
+        row=1, col=2
+    )
+
+    # update xaxis properties
+    fig.update_xaxes(title_text="Number of Stations", row=1, col=1)
+    fig.update_xaxes(title_text="Average Distance Between Stations (km)", row=1, col=2)
+
+    # update yaxis properties
+    fig.update_yaxes(title_text="Metro Line", row=1, col=1)
+    fig.update_yaxes(title_text="", row=1, col=2)
+
+    # update layout
+    fig.update_layout(height=600, width=1200, title_text="Metro Line Analysis", template="plotly_white")
+
+    fig.show()
+
+
+# # Network Analysis
+
+# * Stations are joined along each line in order of distance from the start, and rows of the same station on different lines are joined as interchanges. Shortest distances, interchange counts and routes between every pair of stations are precomputed, so journeys are simple lookups.
+
+# In[43]:
+
+
+from metro_graph import MetroGraph
 
-# plot for Number of Stations per Line
-fig.add_trace(
-    go.Bar(y=line_analysis['Line'], x=line_analysis['Number of Stations'],
-           orientation='h', name='Number of Stations', marker_color='crimson'),
-    row=1, col=1
-)
+metro_graph = MetroGraph(station_records)
 
-# plot for Average Distance Between Stations
-fig.add_trace(
-    go.Bar(y=line_analysis['Line'], x=line_analysis['Average Distance Between Stations (km)'],
-           orientation='h', name='Average Distance (km)', marker_color='navy'),
-    row=1, col=2
-)
+journey = metro_graph.journey('Rithala', 'Noida Sector 62')
+print(journey['Distance (km)'], 'km with', journey['Interchanges'], 'interchanges')
+output.result('journey', pd.DataFrame(journey['Route'], columns=['Station', 'Line']))
 
-# update xaxis properties
-fig.update_xaxes(title_text="Number of Stations", row=1, col=1)
-fig.update_xaxes(title_text="Average Distance Between Stations (km)", row=1, col=2)
 
-# update yaxis properties
-fig.update_yaxes(title_text="Metro Line", row=1, col=1)
-fig.update_yaxes(title_text="", row=1, col=2)
+# * The distance and interchange tables are exported to one memory-mapped file for services that only need lookups. Its header carries the Station IDs and a version hash of the station records, and opening it reads only the header, so a consumer gets the same answers without rebuilding the graph.
 
-# update layout
-fig.update_layout(height=600, width=1200, title_text="Metro Line Analysis", template="plotly_white")
+# In[50]:
 
-fig.show()
+
+from distance_matrix import DistanceMatrixFile, export_distance_matrix
+
+matrix_version = export_distance_matrix(metro_graph, "delhi_metro_distances.bin")
+with DistanceMatrixFile("delhi_metro_distances.bin") as distance_matrix:
+    print(distance_matrix.version == matrix_version,
+          distance_matrix.distance('Rithala', 'Noida Sector 62') == journey['Distance (km)'])
+
+
+# * Betweenness centrality shows which stations carry the most shortest paths. Articulation points and bridges are the stations and segments whose closure splits the network, and the closure sweep closes every segment in turn to see how travel distances change.
+
+# In[44]:
+
+
+from network_metrics import StationNetwork
+
+station_network = StationNetwork(metro_graph)
+
+betweenness = station_network.betweenness()
+articulation_points, bridges = station_network.articulation_points_and_bridges()
+print(len(articulation_points), 'articulation points and', len(bridges), 'bridges out of',
+      len(station_network.segments), 'segments')
+output.result('articulation points', articulation_points)
+output.result('bridges', bridges)
+output.result('betweenness', betweenness.sort_values(ascending=False).head(10))
+
+
+# In[45]:
+
+
+# process pools re-import this script in their workers where processes are spawned (Windows, macOS), so a pool is
+# only started when the script is the main program and never from a worker's import of it
+pool_processes = os.cpu_count() if __name__ == '__main__' else None
+
+segment_closures = station_network.closure_sweep('segment', processes=pool_processes)
+
+# segments that do not disconnect anything, by the increase in mean travel distance
+output.result('segment closures', segment_closures[segment_closures['Disconnected Pairs'] == 0].head(10))
+
+
+# * Catchments (isochrones) show how far the network reaches from a station within a distance or a travel time. Travel time assumes an average train speed of 32 km/h and 5 minutes for every change of line; the matrix counts the stations each station reaches within each threshold.
+
+# In[46]:
+
+
+from isochrones import Isochrones
+
+isochrones = Isochrones(metro_graph)
+
+# pool_processes (above) keeps the pool to runs of the script as the main program
+catchment_matrix = isochrones.matrix([15, 30, 45, 60], metric='minutes', processes=pool_processes)
+output.result('catchment matrix', catchment_matrix)
+catchment_matrix.sort_values(30, ascending=False).head(10)
+
+
+# In[47]:
+
+
+catchments = output.result('catchments', isochrones.catchments(['Rajiv Chowk', 'Noida Sector 62'], [15, 30, 45],
+                                                                 metric='minutes'))
+
+catchment_map = None
+if output.plots:
+    from map_layers import add_catchment_layer
+
+    catchment_map = folium.Map(location=[28.6139, 77.2090], zoom_start=11)
+    add_catchment_layer(catchment_map, catchments)
+catchment_map
+
+
+# * There is no ridership data, so segment loads are estimated from synthetic trips: a gravity model draws trips between stations in proportion to their weights (underground and interchange stations weigh more) and decays with the network distance between them, and every trip is assigned to its shortest route.
+
+# In[48]:
+
+
+from ridership import RidershipModel
+
+ridership = RidershipModel(metro_graph)
+od_trips, segment_loads, interchange_loads = ridership.simulate(5_000_000, seed=42)
+
+output.result('segment loads', segment_loads)
+output.result('interchange loads', interchange_loads)
+
+busiest_segments = segment_loads.sort_values('Trips', ascending=False).head(15)
+if output.plots:
+    fig = px.bar(busiest_segments, x='Trips', y=busiest_segments['From'] + ' - ' + busiest_segments['To'],
+                 color='Line', orientation='h', title='Busiest Segments for 5 Million Synthetic Trips',
+                 labels={'y': 'Segment'})
+    fig.update_layout(yaxis={'categoryorder': 'total ascending'}, template="plotly_white")
+    fig.show()
+
+interchange_loads.head(10)
 
 
 # # Station Layout Analysis
@@ -212,22 +393,23 @@ fig.show()
 # In[42]:
 
 
-layout_counts = metro_data['Station Layout'].value_counts()
+layout_counts = output.result('station layouts', metro_data['Station Layout'].value_counts())
 
-# creating the bar plot using Plotly
-fig = px.bar(x=layout_counts.index, y=layout_counts.values,
-             labels={'x': 'Station Layout', 'y': 'Number of Stations'},
-             title='Distribution of Delhi Metro Station Layouts',
-             color=layout_counts.index,
-             color_continuous_scale='pastel')
+if output.plots:
+    # creating the bar plot using Plotly
+    fig = px.bar(x=layout_counts.index, y=layout_counts.values,
+                 labels={'x': 'Station Layout', 'y': 'Number of Stations'},
+                 title='Distribution of Delhi Metro Station Layouts',
+                 color=layout_counts.index,
+                 color_continuous_scale='pastel')
 
-# updating layout for better presentation
-fig.update_layout(xaxis_title="Station Layout",
-                  yaxis_title="Number of Stations",
-                  coloraxis_showscale=False,
-                  template="plotly_white")
+    # updating layout for better presentation
+    fig.update_layout(xaxis_title="Station Layout",
+                      yaxis_title="Number of Stations",
+                      coloraxis_showscale=False,
+                      template="plotly_white")
 
-fig.show()
+    fig.show()
 
 
 # * The bar chart and the counts show the distribution of different station layouts in the Delhi Metro network.
@@ -237,6 +419,13 @@ fig.show()
 # * Underground Stations: The Underground stations are fewer compared to elevated ones. These are likely in densely populated or central areas where above-ground construction is less feasible.
 # * At-Grade Stations: There are only a few At-Grade (ground level) stations, suggesting they are less common in the network, possibly due to land and traffic considerations.
 
+# In[49]:
+
+
+# tables recorded above (pickled only when ANALYSIS_RESULTS is set)
+output.finish()
+
+
 # # Summary
 # * So, this is how you can perform Delhi Metro Network Analysis using Python. 
 # * Metro Network Analysis involves examining the network of metro systems to understand their structure, efficiency, and effectiveness. It typically includes analyzing routes, stations, traffic, connectivity, and other operational aspects.
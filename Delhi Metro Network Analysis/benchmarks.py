@@ -0,0 +1,471 @@
+# coding: utf-8
+
+# * Benchmarks for the metro network analysis, on Delhi-Metro-Network.csv and on synthetic networks shaped like it.
+# * Run one benchmark with `python benchmarks.py <name>`, or all of them with `python benchmarks.py`.
+
+import argparse
+import heapq
+import os
+import tempfile
+import time
+
+import folium
+import numpy as np
+import pandas as pd
+
+from distance_matrix import DistanceMatrixFile, export_distance_matrix
+from isochrones import Isochrones
+from map_layers import add_point_layer
+from metro_graph import INTERCHANGE_UNITS, TRANSFER, UNREACHABLE, MetroGraph
+from network_history import NetworkHistory, costs_summary
+from network_metrics import StationNetwork
+from ridership import RidershipModel
+from spatial_index import StationIndex, brute_force_nearest, haversine_km
+from station_records import StationRecords, normalized
+
+METRO_CSV = 'Delhi-Metro-Network.csv'
+LAYOUTS = ['Elevated', 'Underground', 'At-Grade']
+
+
+def make_synthetic_network(n_lines, stations_per_line, interchanges_per_line=3, seed=0):
+    # lines are random walks around central Delhi; each line after the first reuses a few stations of earlier lines,
+    # named with the same "[Conn: ...]" markers as the real table
+    rng = np.random.default_rng(seed)
+    rows = []
+    names = []
+    for line in range(n_lines):
+        line_name = f'Line {line}'
+        station_names = [f'Station {len(names) + i}' for i in range(stations_per_line)]
+        if line:
+            positions = rng.choice(stations_per_line, min(interchanges_per_line, stations_per_line), replace=False)
+            shared = rng.choice(len(names), len(positions), replace=False)
+            for position, station in zip(positions, shared):
+                station_names[position] = f'{names[station]} [Conn: Line {line - 1}]'
+        names.extend(name for name in station_names if '[Conn:' not in name)
+        distance = np.round(np.concatenate([[0.0], np.cumsum(rng.uniform(0.8, 2.5, stations_per_line - 1))]), 1)
+        step = rng.normal(0, 0.01, (stations_per_line, 2)).cumsum(axis=0)
+        for i, name in enumerate(station_names):
+            rows.append((name, distance[i], line_name, 28.6 + step[i, 0], 77.2 + step[i, 1]))
+    frame = pd.DataFrame(rows, columns=['Station Name', 'Distance from Start (km)', 'Line', 'Latitude', 'Longitude'])
+    frame.insert(0, 'Station ID', np.arange(1, len(frame) + 1))
+    frame['Opening Date'] = pd.Timestamp('2002-12-24') + pd.to_timedelta(rng.integers(0, 7500, len(frame)), 'D')
+    frame['Station Layout'] = rng.choice(LAYOUTS, len(frame))
+    return frame[['Station ID', 'Station Name', 'Distance from Start (km)', 'Line', 'Opening Date',
+                  'Station Layout', 'Latitude', 'Longitude']]
+
+
+def dijkstra_costs(graph, source):
+    # reference single-source search over the same lexicographic (metres, interchanges) cost, with a binary heap
+    neighbours = [[] for _ in range(len(graph.nodes))]
+    for source_node, target, metres, kind in graph.edges[['source', 'target', 'metres', 'kind']].itertuples(False):
+        weight = metres * INTERCHANGE_UNITS + (kind == TRANSFER)
+        neighbours[source_node].append((target, weight))
+        neighbours[target].append((source_node, weight))
+    best = {source: 0}
+    heap = [(0, source)]
+    while heap:
+        cost, node = heapq.heappop(heap)
+        if cost > best[node]:
+            continue
+        for target, weight in neighbours[node]:
+            if cost + weight < best.get(target, np.inf):
+                best[target] = cost + weight
+                heapq.heappush(heap, (cost + weight, target))
+    return best
+
+
+def random_points(stations, n_points, margin_degrees=0.05, seed=0):
+    # uniform over the box holding the central 98% of the stations, so a stray coordinate does not stretch it
+    rng = np.random.default_rng(seed)
+    latitude = stations['Latitude'].quantile([0.01, 0.99]).to_numpy() + [-margin_degrees, margin_degrees]
+    longitude = stations['Longitude'].quantile([0.01, 0.99]).to_numpy() + [-margin_degrees, margin_degrees]
+    return rng.uniform(*latitude, n_points), rng.uniform(*longitude, n_points)
+
+
+def points_near_stations(stations, n_points, spread_degrees=0.01, seed=0):
+    # points scattered around randomly chosen stations, keeping the station's line and name
+    rng = np.random.default_rng(seed)
+    chosen = stations.iloc[rng.integers(0, len(stations), n_points)].reset_index(drop=True)
+    chosen['Latitude'] = chosen['Latitude'] + rng.normal(0, spread_degrees, n_points)
+    chosen['Longitude'] = chosen['Longitude'] + rng.normal(0, spread_degrees, n_points)
+    return chosen
+
+
+def legacy_marker_map(points, line_colors):
+    # the original notebook cell: one folium.Marker per row via iterrows
+    delhi_map = folium.Map(location=[28.7041, 77.1025], zoom_start=11)
+    for index, row in points.iterrows():
+        line = row['Line']
+        color = line_colors.get(line, 'black')
+        folium.Marker(
+            location=[row['Latitude'], row['Longitude']],
+            popup=f"{row['Station Name']}",
+            tooltip=f"{row['Station Name']}, {line}",
+            icon=folium.Icon(color=color)
+        ).add_to(delhi_map)
+    return delhi_map.get_root().render()
+
+
+def clustered_map(points, line_colors):
+    delhi_map = folium.Map(location=[28.7041, 77.1025], zoom_start=11)
+    add_point_layer(delhi_map, points, line_colors)
+    return delhi_map.get_root().render()
+
+
+def rebuilt_summary(history, date):
+    # the network as of `date` built from scratch: its segments, then a heap Dijkstra from every station
+    segments = history.segments_at(date)
+    source = history.stations.get_indexer(segments['From'])
+    target = history.stations.get_indexer(segments['To'])
+    cost = np.where(segments['Line'] == 'Transfer', 1,
+                    np.rint(segments['Length (km)'].to_numpy() * 1000).astype(np.int64) * INTERCHANGE_UNITS)
+    neighbours = [[] for _ in range(len(history.stations))]
+    for u, v, weight in zip(source.tolist(), target.tolist(), cost.tolist()):
+        neighbours[u].append((v, weight))
+        neighbours[v].append((u, weight))
+    costs = np.full((len(neighbours), len(neighbours)), UNREACHABLE, dtype=np.int64)
+    for start in range(len(neighbours)):
+        best = costs[start]
+        best[start] = 0
+        heap = [(0, start)]
+        while heap:
+            value, node = heapq.heappop(heap)
+            if value > best[node]:
+                continue
+            for other, weight in neighbours[node]:
+                if value + weight < best[other]:
+                    best[other] = value + weight
+                    heapq.heappush(heap, (value + weight, other))
+    is_open = np.isin(history.stations, history.open_stations(date))
+    return costs, costs_summary(costs, is_open)
+
+
+def route_walk_loads(graph, od):
+    # reference assignment: walk the route of every OD pair with trips and add its trips to each hop
+    loads = np.zeros((len(graph.nodes), len(graph.nodes)), dtype=np.int64)
+    for origin, destination in zip(*np.nonzero(od)):
+        path = graph.route_nodes(graph.station_origin[origin, destination],
+                                 graph.station_destination[origin, destination])
+        loads[path[:-1], path[1:]] += od[origin, destination]
+    return loads
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _check_against_dijkstra(graph, sources):
+    for source in sources:
+        for target, cost in dijkstra_costs(graph, source).items():
+            if graph.distance_m[source, target] * INTERCHANGE_UNITS + graph.interchanges[source, target] != cost:
+                return False
+    return True
+
+
+def bench_routes(full=False, queries=100_000, sizes=((20, 50),)):
+    # Delhi first, then synthetic networks of (lines, stations per line); precomputation is cubic in the node count
+    if full:
+        sizes = sizes + ((40, 50),)
+    networks = [('delhi', pd.read_csv(METRO_CSV))]
+    networks += [(f'{lines}x{per_line}', make_synthetic_network(lines, per_line)) for lines, per_line in sizes]
+    rng = np.random.default_rng(0)
+    print(f"{'network':>10} {'nodes':>7} {'build (s)':>10} {'journeys/s':>11} {'distances/s':>12} "
+          f"{'batch lookups/s':>16} {'matches dijkstra':>17}")
+    for name, frame in networks:
+        graph, build_time = _timed(MetroGraph, frame)
+        stations = graph.station_index.to_numpy()
+        pairs = rng.integers(0, len(stations), (queries, 2))
+
+        journey_count = min(queries, 20_000)
+        start = time.perf_counter()
+        for origin, destination in pairs[:journey_count]:
+            graph.journey(stations[origin], stations[destination])
+        journeys_per_second = journey_count / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for origin, destination in pairs[:journey_count]:
+            graph.distance(stations[origin], stations[destination])
+        distances_per_second = journey_count / (time.perf_counter() - start)
+
+        origin_nodes = graph.station_origin[pairs[:, 0], pairs[:, 1]]
+        destination_nodes = graph.station_destination[pairs[:, 0], pairs[:, 1]]
+        _, batch_time = _timed(lambda: graph.distance_m[origin_nodes, destination_nodes])
+
+        sources = rng.choice(len(graph.nodes), min(len(graph.nodes), 20), replace=False)
+        matches = _check_against_dijkstra(graph, sources)
+        print(f"{name:>10} {len(graph.nodes):>7,} {build_time:>10.3f} {journeys_per_second:>11,.0f} "
+              f"{distances_per_second:>12,.0f} {queries / batch_time:>16,.0f} {str(matches):>17}")
+
+
+def bench_spatial(full=False, sizes=(1_000, 1_000_000), k=3, radius_km=1.0, synthetic=((10_000, 20_000),),
+                  block_elements=20_000_000):
+    # the metro stations against `sizes` query points, then synthetic station sets over the same area against
+    # (stations, points) pairs; the brute-force references are checked on every row, and --full adds 10M points on
+    # the metro stations and 100k synthetic stations
+    if full:
+        sizes = sizes + (10_000_000,)
+        synthetic = synthetic + ((100_000, 100_000),)
+    metro = pd.read_csv(METRO_CSV)
+    index, build_time = _timed(StationIndex, metro)
+    print(f"index over {len(index)} stations built in {build_time:.4f} s")
+    cases = [(index, n_points) for n_points in sizes]
+    for n_stations, n_points in synthetic:
+        latitude, longitude = random_points(metro, n_stations, seed=1)
+        cases.append((StationIndex(pd.DataFrame({'Latitude': latitude, 'Longitude': longitude})), n_points))
+    print(f"{'stations':>9} {'points':>12} {'nearest (s)':>12} {'brute (s)':>10} {'speedup':>8} {'match':>6} "
+          f"{'radius (s)':>11} {'brute (s)':>10} {'speedup':>8} {'hits':>10} {'match':>6}")
+    for index, n_points in cases:
+        block = max(1, block_elements // len(index))
+        latitude, longitude = random_points(index.stations, n_points)
+        (_, distance), nearest_time = _timed(index.nearest, latitude, longitude, k)
+        (_, brute_distance), brute_time = _timed(brute_force_nearest, index, latitude, longitude, k, block)
+        # ties between stations at the same spot may swap positions, so compare distances
+        nearest_match = np.allclose(distance, brute_distance, rtol=0, atol=1e-9)
+
+        (query, station, _), radius_time = _timed(index.within, latitude, longitude, radius_km)
+        start = time.perf_counter()
+        brute_hits = []
+        for first in range(0, n_points, block):
+            rows = slice(first, first + block)
+            hit_query, hit_station = np.nonzero(haversine_km(latitude[rows, None], longitude[rows, None],
+                                                             index.latitude, index.longitude) <= radius_km)
+            brute_hits.append((hit_query + first) * len(index) + hit_station)
+        brute_radius_time = time.perf_counter() - start
+        radius_match = np.array_equal(np.sort(query * len(index) + station), np.concatenate(brute_hits))
+        print(f"{len(index):>9,} {n_points:>12,} {nearest_time:>12.3f} {brute_time:>10.3f} "
+              f"{brute_time / nearest_time:>7.1f}x {str(nearest_match):>6} {radius_time:>11.3f} "
+              f"{brute_radius_time:>10.3f} {brute_radius_time / radius_time:>7.1f}x {len(query):>10,} "
+              f"{str(radius_match):>6}")
+
+
+def bench_map(full=False, sizes=(300, 100_000, 1_000_000)):
+    # the marker loop renders every point; it takes minutes past a few thousand points, so larger sizes need --full
+    legacy_max_points = 100_000 if full else 300
+    stations = pd.read_csv(METRO_CSV)
+    line_colors = dict(zip(stations['Line'].unique(), ['red', 'blue', 'beige', 'green', 'purple', 'pink', 'darkred',
+                                                        'orange', 'cadetblue', 'black', 'lightgreen', 'lightblue',
+                                                        'lightgray']))
+    print(f"{'points':>12} {'markers (s)':>12} {'markers (MB)':>13} {'clustered (s)':>14} {'clustered (MB)':>15}")
+    for n_points in sizes:
+        points = stations if n_points == len(stations) else points_near_stations(stations, n_points)
+        html, clustered_time = _timed(clustered_map, points, line_colors)
+        clustered_size = len(html.encode()) / 2 ** 20
+        if n_points > legacy_max_points:
+            print(f"{n_points:>12,} {'skipped':>12} {'-':>13} {clustered_time:>14.3f} {clustered_size:>15.2f}")
+            continue
+        html, legacy_time = _timed(legacy_marker_map, points, line_colors)
+        print(f"{n_points:>12,} {legacy_time:>12.3f} {len(html.encode()) / 2 ** 20:>13.2f} "
+              f"{clustered_time:>14.3f} {clustered_size:>15.2f}")
+
+
+def bench_closures(full=False, sizes=((10, 30),)):
+    # every segment and every station closed in turn: full reruns, incremental repair, and repair in a process pool
+    if full:
+        sizes = sizes + ((20, 50),)
+    networks = [('delhi', pd.read_csv(METRO_CSV))]
+    networks += [(f'{lines}x{per_line}', make_synthetic_network(lines, per_line)) for lines, per_line in sizes]
+    columns = ['Mean Distance (km)', 'Disconnected Pairs']
+    print(f"{'network':>10} {'closures':>9} {'stations':>9} {'betweenness (s)':>16} {'full (s)':>9} "
+          f"{'incremental (s)':>16} {'pool (s)':>9} {'speedup':>8} {'match':>6}")
+    for name, frame in networks:
+        network = StationNetwork(MetroGraph(frame))
+        _, betweenness_time = _timed(network.betweenness)
+        for kind in ('segment', 'station'):
+            rerun, full_time = _timed(network.closure_sweep, kind, incremental=False)
+            repaired, incremental_time = _timed(network.closure_sweep, kind)
+            pooled, pool_time = _timed(network.closure_sweep, kind, processes=os.cpu_count())
+            matches = (repaired[columns].equals(rerun[columns]) and pooled[columns].equals(rerun[columns]))
+            print(f"{name:>10} {kind:>9} {len(network):>9,} {betweenness_time:>16.3f} {full_time:>9.3f} "
+                  f"{incremental_time:>16.3f} {pool_time:>9.3f} {full_time / min(incremental_time, pool_time):>7.1f}x "
+                  f"{str(matches):>6}")
+
+
+def bench_history(full=False, sizes=((10, 30),)):
+    # the year-end series of the network's growth: one incremental sweep over every opening date against rebuilding
+    # the network and its all-pairs table at each year end; then random date queries served from the checkpoints
+    if full:
+        sizes = sizes + ((20, 50),)
+    networks = [('delhi', pd.read_csv(METRO_CSV))]
+    networks += [(f'{lines}x{per_line}', make_synthetic_network(lines, per_line)) for lines, per_line in sizes]
+    rng = np.random.default_rng(0)
+    print(f"{'network':>10} {'stations':>9} {'versions':>9} {'years':>6} {'sweep (s)':>10} {'rebuild (s)':>12} "
+          f"{'speedup':>8} {'query (ms)':>11} {'match':>6}")
+    for name, frame in networks:
+        graph = MetroGraph(frame)
+        history, sweep_time = _timed(NetworkHistory, graph)
+        yearly = history.yearly()
+        year_ends = [pd.Timestamp(year=year, month=12, day=31) for year in yearly['Year']]
+        rebuilt, rebuild_time = _timed(lambda: [rebuilt_summary(history, date) for date in year_ends])
+        columns = list(rebuilt[0][1])
+        matches = yearly[columns].equals(pd.DataFrame([summary for _, summary in rebuilt])[columns].astype(
+            yearly[columns].dtypes))
+        dates = history.dates[rng.integers(0, len(history.dates), 20)]
+        tables, query_time = _timed(lambda: [history.costs_at(date) for date in dates])
+        matches &= (tables[-1] == rebuilt_summary(history, dates[-1])[0]).all()
+        print(f"{name:>10} {len(history.stations):>9,} {len(history.versions):>9,} {len(yearly):>6} "
+              f"{sweep_time:>10.3f} {rebuild_time:>12.3f} {rebuild_time / sweep_time:>7.1f}x "
+              f"{query_time / len(dates) * 1000:>11.2f} {str(bool(matches)):>6}")
+
+
+def bench_isochrones(full=False, queries=5_000, thresholds=(2, 5, 10, 15, 20, 30, 40, 60), sizes=((20, 50),)):
+    # random (source, threshold) catchment queries: a full search per query filtered afterwards, the bounded search,
+    # and the banded cache filling up (cold) and once filled (warm); then the station x threshold matrix, serially
+    # and in a process pool
+    if full:
+        sizes = sizes + ((40, 50),)
+    networks = [('delhi', pd.read_csv(METRO_CSV))]
+    networks += [(f'{lines}x{per_line}', make_synthetic_network(lines, per_line)) for lines, per_line in sizes]
+    rng = np.random.default_rng(0)
+    print(f"{'network':>10} {'stations':>9} {'full (q/s)':>11} {'bounded (q/s)':>14} {'cold (q/s)':>11} "
+          f"{'warm (q/s)':>11} {'matrix (s)':>11} {'pool (s)':>9} {'match':>6}")
+    for name, frame in networks:
+        graph = MetroGraph(frame)
+        isochrones = Isochrones(graph)
+        sources = graph.station_index[rng.integers(0, len(graph.station_index), queries)]
+        limits = rng.choice(thresholds, queries)
+
+        def full_searches():
+            reachable = []
+            for source, limit in zip(sources[:queries // 10], limits[:queries // 10]):
+                stations, costs = isochrones.search(isochrones._sources(source), np.inf)
+                reachable.append(stations[costs <= limit])
+            return reachable
+
+        def bounded_searches():
+            return [isochrones.search(isochrones._sources(source), limit)[0]
+                    for source, limit in zip(sources, limits)]
+
+        def cached_queries():
+            return [isochrones.reachable(source, limit) for source, limit in zip(sources, limits)]
+
+        reference, full_time = _timed(full_searches)
+        bounded, bounded_time = _timed(bounded_searches)
+        isochrones.clear_cache()
+        cached, cached_time = _timed(cached_queries)
+        _, warm_time = _timed(cached_queries)
+        matches = all(np.array_equal(np.sort(a), np.sort(b)) for a, b in zip(reference, bounded))
+        matches &= all(np.array_equal(graph.station_index[b], c.index) for b, c in zip(bounded, cached))
+
+        isochrones.clear_cache()
+        matrix, matrix_time = _timed(isochrones.matrix, thresholds)
+        isochrones.clear_cache()
+        pooled, pool_time = _timed(isochrones.matrix, thresholds, processes=os.cpu_count())
+        distances = np.nan_to_num(graph.station_distances().to_numpy(), nan=np.inf)
+        expected = np.stack([(distances <= limit + 1e-9).sum(axis=1) - 1 for limit in thresholds], axis=1)
+        matches &= np.array_equal(matrix.to_numpy(), expected) and matrix.equals(pooled)
+        print(f"{name:>10} {len(graph.station_index):>9,} {queries // 10 / full_time:>11,.0f} "
+              f"{queries / bounded_time:>14,.0f} {queries / cached_time:>11,.0f} {queries / warm_time:>11,.0f} "
+              f"{matrix_time:>11.3f} {pool_time:>9.3f} {str(bool(matches)):>6}")
+
+
+def bench_ridership(full=False, trips=(1_000_000, 10_000_000), sizes=((20, 50),)):
+    # gravity-model OD generation and tree-level assignment against walking every route, for growing trip counts
+    if full:
+        trips = trips + (100_000_000,)
+        sizes = sizes + ((40, 50),)
+    networks = [('delhi', pd.read_csv(METRO_CSV))]
+    networks += [(f'{lines}x{per_line}', make_synthetic_network(lines, per_line)) for lines, per_line in sizes]
+    print(f"{'network':>10} {'stations':>9} {'trips':>12} {'model (s)':>10} {'generate (s)':>13} {'assign (s)':>11} "
+          f"{'routes (s)':>11} {'speedup':>8} {'match':>6}")
+    for name, frame in networks:
+        graph = MetroGraph(frame)
+        model, model_time = _timed(RidershipModel, graph)
+        for count in trips:
+            od, generate_time = _timed(model.generate, count, seed=0)
+            loads, assign_time = _timed(model.node_loads, od)
+            reference, walk_time = _timed(route_walk_loads, graph, od)
+            segments, _ = model.assign(od)
+            distances = np.nan_to_num(graph.station_distances().to_numpy())
+            # every trip is carried along its whole route: passenger-km on the segments equal those of the OD matrix
+            matches = (np.array_equal(loads, reference) and np.array_equal(od, model.generate(count, seed=0))
+                       and np.isclose((segments['Trips'] * segments['Length (km)']).sum(), (od * distances).sum()))
+            print(f"{name:>10} {len(model.stations):>9,} {count:>12,} {model_time:>10.3f} {generate_time:>13.3f} "
+                  f"{assign_time:>11.3f} {walk_time:>11.3f} {walk_time / assign_time:>7.0f}x {str(bool(matches)):>6}")
+
+
+def bench_records(full=False, sizes=((20, 50), (200, 500))):
+    # normalization and validation of growing station tables, and the cached lookup the graph and map code go through
+    if full:
+        sizes = sizes + ((1000, 500),)
+    networks = [('delhi', pd.read_csv(METRO_CSV))]
+    networks += [(f'{lines}x{per_line}', make_synthetic_network(lines, per_line)) for lines, per_line in sizes]
+    print(f"{'network':>10} {'stops':>9} {'stations':>9} {'interchanges':>13} {'issues':>7} {'normalize (s)':>14} "
+          f"{'cached (s)':>11} {'stops/s':>11}")
+    for name, frame in networks:
+        records, normalize_time = _timed(StationRecords, frame)
+        normalized(frame)
+        _, cached_time = _timed(normalized, frame)
+        print(f"{name:>10} {len(frame):>9,} {len(records.stations):>9,} {len(records.interchanges):>13,} "
+              f"{len(records.issues):>7,} {normalize_time:>14.3f} {cached_time:>11.4f} "
+              f"{len(frame) / normalize_time:>11,.0f}")
+
+
+def bench_matrix_file(full=False, lookups=20_000, sizes=((20, 50),)):
+    # random lookups in an exported matrix file against rebuilding the graph from the CSV; every batch lookup is
+    # checked against the graph, and 'cold speedup' compares open + one lookup with read_csv + build + one lookup
+    if full:
+        sizes = sizes + ((40, 50),)
+    rng = np.random.default_rng(0)
+    print(f"{'network':>10} {'nodes':>7} {'rebuild (s)':>12} {'export (s)':>11} {'file MB':>8} {'open (ms)':>10} "
+          f"{'file lookup (us)':>17} {'graph lookup (us)':>18} {'batch lookups/s':>16} {'cold speedup':>13} "
+          f"{'matches':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        networks = [('delhi', METRO_CSV)]
+        for lines, per_line in sizes:
+            name = f'{lines}x{per_line}'
+            networks.append((name, os.path.join(directory, f'{name}.csv')))
+            make_synthetic_network(lines, per_line).to_csv(networks[-1][1], index=False)
+        for name, csv in networks:
+            # StationRecords directly, so the normalized() cache of an earlier benchmark is not reused
+            graph, rebuild_time = _timed(lambda: MetroGraph(StationRecords(pd.read_csv(csv))))
+            path = os.path.join(directory, f'{name}.bin')
+            _, export_time = _timed(export_distance_matrix, graph, path)
+            matrix, open_time = _timed(DistanceMatrixFile, path)
+            pairs = rng.choice(graph.node_ids.to_numpy(), (lookups, 2))
+
+            start = time.perf_counter()
+            for origin, destination in pairs:
+                matrix.distance(origin, destination)
+            file_lookup = (time.perf_counter() - start) / lookups
+            start = time.perf_counter()
+            for origin, destination in pairs:
+                graph.distance(origin, destination)
+            graph_lookup = (time.perf_counter() - start) / lookups
+
+            batch, batch_time = _timed(matrix.node_distances, pairs[:, 0], pairs[:, 1])
+            metres = graph.distance_m[graph.node_ids.get_indexer(pairs[:, 0]), graph.node_ids.get_indexer(pairs[:, 1])]
+            matches = (np.array_equal(batch, np.where(metres >= 0, metres / 1000, np.nan), equal_nan=True)
+                       and matrix.station_distances().equals(graph.station_distances()))
+            matrix.close()
+            print(f"{name:>10} {len(graph.nodes):>7,} {rebuild_time:>12.3f} {export_time:>11.3f} "
+                  f"{os.path.getsize(path) / 2 ** 20:>8.1f} {open_time * 1000:>10.2f} {file_lookup * 1e6:>17.2f} "
+                  f"{graph_lookup * 1e6:>18.2f} {lookups / batch_time:>16,.0f} "
+                  f"{rebuild_time / (open_time + file_lookup):>12,.0f}x {str(matches):>8}")
+
+
+BENCHMARKS = {
+    'records': bench_records,
+    'routes': bench_routes,
+    'spatial': bench_spatial,
+    'map': bench_map,
+    'closures': bench_closures,
+    'history': bench_history,
+    'isochrones': bench_isochrones,
+    'ridership': bench_ridership,
+    'matrix_file': bench_matrix_file,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks for the metro network analysis.')
+    parser.add_argument('names', nargs='*', help=f"benchmarks to run, any of {', '.join(BENCHMARKS)}")
+    parser.add_argument('--full', action='store_true', help='also run the largest networks')
+    args = parser.parse_args()
+
+    for name in args.names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark {name!r}")
+        print(f"# {name}")
+        BENCHMARKS[name](full=args.full)
@@ -0,0 +1,179 @@
+# coding: utf-8
+
+# * Binary export of the all-pairs tables of a MetroGraph, for services that only need lookups and should not rebuild
+#   the graph from Delhi-Metro-Network.csv.
+# * Layout: MAGIC, the header length as a little-endian uint64, a JSON header, then each array starting on an
+#   ALIGNMENT-byte boundary:
+#     distance_m            nodes x nodes int32, metres along the shortest path (-1 when unconnected)
+#     interchanges          nodes x nodes int16, interchanges on that path (-1 when unconnected)
+#     station_origin        stations x stations int32, best pair of line nodes between two physical stations
+#     station_destination
+#   Nodes are the rows of the station records (one station on one line), as in MetroGraph.
+# * The header holds the 'Station ID' of every node, its station and line, the station names, the array offsets and
+#   the version: a hash of the normalized station records (and of FORMAT_VERSION), so a consumer can tell whether a
+#   file matches the data it has.
+# * Opening a file reads only the header. The arrays are read-only views of one memory map, so a lookup reads just
+#   the pages it touches and nothing is copied.
+
+import hashlib
+import json
+import mmap
+import os
+
+import numpy as np
+import pandas as pd
+
+from metro_graph import MetroGraph, StationLookup
+from station_records import StationRecords, frame_digest, normalized, station_names
+
+MAGIC = b'METRODM\x00'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+ARRAYS = {
+    'distance_m': '<i4',
+    'interchanges': '<i2',
+    'station_origin': '<i4',
+    'station_destination': '<i4',
+}
+
+
+def matrix_version(metro_data):
+    """Version hash of the tables computed from a station frame or its StationRecords."""
+    records = metro_data if isinstance(metro_data, StationRecords) else normalized(metro_data)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f'{FORMAT_VERSION}:'.encode())
+    digest.update(frame_digest(records.stops).encode())
+    return digest.hexdigest()
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def export_distance_matrix(metro_graph, path):
+    """Write the tables of `metro_graph` to `path` and return their version.
+
+    The file is written next to `path` and renamed over it, so a reader never opens a partial file.
+    """
+    arrays = {name: np.ascontiguousarray(getattr(metro_graph, name), dtype=dtype) for name, dtype in ARRAYS.items()}
+    version = matrix_version(metro_graph.records)
+    header = {
+        'format': FORMAT_VERSION,
+        'version': version,
+        'station_ids': metro_graph.node_ids.tolist(),
+        'stations': metro_graph.station_index.tolist(),
+        'node_station': metro_graph.node_station.tolist(),
+        'node_lines': metro_graph.nodes['Line'].tolist(),
+        'arrays': {},
+    }
+    # offsets are relative to the end of the header, so they do not depend on its own length
+    offset = 0
+    for name, array in arrays.items():
+        offset = _aligned(offset)
+        header['arrays'][name] = {'offset': offset, 'dtype': ARRAYS[name], 'shape': list(array.shape)}
+        offset += array.nbytes
+    encoded = json.dumps(header).encode()
+    start = _aligned(len(MAGIC) + 8 + len(encoded))
+
+    partial = f'{path}.partial'
+    with open(partial, 'wb') as file:
+        file.write(MAGIC)
+        file.write(len(encoded).to_bytes(8, 'little'))
+        file.write(encoded)
+        for name, array in arrays.items():
+            file.seek(start + header['arrays'][name]['offset'])
+            file.write(array.tobytes())
+    os.replace(partial, path)
+    return version
+
+
+class DistanceMatrixFile(StationLookup):
+    """Read-only, memory-mapped view of an exported distance matrix.
+
+    Lookups accept a 'Station ID' (which pins the line) or a station name, as MetroGraph queries do.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a distance matrix file")
+            length = int.from_bytes(file.read(8), 'little')
+            header = json.loads(file.read(length))
+            if header['format'] != FORMAT_VERSION:
+                raise ValueError(f"{path} has format {header['format']}, expected {FORMAT_VERSION}")
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        start = _aligned(len(MAGIC) + 8 + length)
+        self.version = header['version']
+        self.node_ids = pd.Index(header['station_ids'])
+        self.station_index = pd.Index(header['stations'])
+        self.node_station = np.asarray(header['node_station'], dtype=np.int32)
+        self.node_lines = np.asarray(header['node_lines'], dtype=object)
+        for name, spec in header['arrays'].items():
+            count = int(np.prod(spec['shape']))
+            array = np.frombuffer(self._map, dtype=spec['dtype'], count=count, offset=start + spec['offset'])
+            setattr(self, name, array.reshape(spec['shape']))
+        self._lookup = dict(zip(self.station_index, range(len(self.station_index))))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        """Drop the arrays and close the memory map.
+
+        Arrays the caller still holds that view the file (distance_m itself, or a row or slice of it) keep the map
+        open: it is then left to the garbage collector, which closes it once the last of them is gone.
+        """
+        for name in ARRAYS:
+            self.__dict__.pop(name, None)
+        try:
+            self._map.close()
+        except BufferError:
+            # mmap refuses to close while views of it exist
+            pass
+
+    def _stations(self, stations):
+        stations = pd.Index(stations)
+        numbers = self.station_index.get_indexer(stations)
+        if (numbers < 0).any():
+            cleaned = self.station_index.get_indexer(station_names(stations[numbers < 0]))
+            if (cleaned < 0).any():
+                raise KeyError(f"unknown stations {list(stations[numbers < 0][cleaned < 0])}")
+            numbers[numbers < 0] = cleaned
+        return numbers
+
+    def distances(self, origins, destinations):
+        """Distances in km between paired arrays of station names (NaN where unconnected)."""
+        o, d = self._stations(origins), self._stations(destinations)
+        metres = self.distance_m[self.station_origin[o, d], self.station_destination[o, d]]
+        return np.where(metres >= 0, metres / 1000, np.nan)
+
+    def node_distances(self, origin_ids, destination_ids):
+        """Distances in km between paired arrays of 'Station ID's (NaN where unconnected)."""
+        start, end = self.node_ids.get_indexer(origin_ids), self.node_ids.get_indexer(destination_ids)
+        if (start < 0).any() or (end < 0).any():
+            raise KeyError("unknown 'Station ID'")
+        metres = self.distance_m[start, end]
+        return np.where(metres >= 0, metres / 1000, np.nan)
+
+    def station_distances(self):
+        """Physical station x station distance matrix in km, as MetroGraph.station_distances."""
+        metres = self.distance_m[self.station_origin, self.station_destination]
+        km = np.where(metres >= 0, metres / 1000, np.nan)
+        return pd.DataFrame(km, index=self.station_index, columns=self.station_index)
+
+
+def cached_distance_matrix(metro_data, path):
+    """Open the export at `path`, first (re)building it from `metro_data` when it is missing or out of date."""
+    records = metro_data if isinstance(metro_data, StationRecords) else normalized(metro_data)
+    if os.path.exists(path):
+        matrix = DistanceMatrixFile(path)
+        if matrix.version == matrix_version(records):
+            return matrix
+        matrix.close()
+    export_distance_matrix(MetroGraph(records), path)
+    return DistanceMatrixFile(path)
@@ -0,0 +1,189 @@
+# coding: utf-8
+
+# * Isochrones (catchments): the stations reachable from a source within a distance in km or a travel time in minutes.
+# * Searches run on the line-level nodes of a MetroGraph, so a change of line costs INTERCHANGE_MINUTES of travel
+#   time (and nothing in km). Every node of the source stations starts at zero and the Dijkstra search stops at the
+#   threshold, so a small catchment only visits its own stations.
+# * Results are cached per (sources, metric, threshold band): a threshold is rounded up to the next multiple of the
+#   metric's band, the search runs to the band edge, and any smaller threshold is a filter over a cached search.
+# * The station x threshold matrix runs one search per station up to the largest threshold (optionally in a process
+#   pool) and counts the reachable stations for every threshold at once.
+
+import heapq
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from metro_graph import TRANSFER
+
+# average commercial speed of a train including its stops, and the time to change lines or use a walkway
+AVERAGE_SPEED_KMH = 32.0
+INTERCHANGE_MINUTES = 5.0
+
+# threshold band of each metric: searches run to the next multiple and are reused for every threshold below it
+BANDS = {'km': 5.0, 'minutes': 10.0}
+# distances are searched in whole metres, so sums are exact and match MetroGraph.station_distances
+_SCALE = {'km': 1000, 'minutes': 1}
+# float tolerance when comparing travel times with a threshold
+_TOLERANCE = 1e-9
+
+_worker_isochrones = None
+
+
+def _init_worker(isochrones):
+    global _worker_isochrones
+    _worker_isochrones = isochrones
+
+
+class Isochrones:
+    """Catchments of the stations of a MetroGraph, by distance ('km') or travel time ('minutes')."""
+
+    def __init__(self, metro_graph, speed_kmh=AVERAGE_SPEED_KMH, interchange_minutes=INTERCHANGE_MINUTES,
+                 bands=BANDS):
+        self.graph = metro_graph
+        self.stations = metro_graph.station_index
+        self.bands = dict(bands)
+        edges = metro_graph.edges
+        metres = edges['metres'].to_numpy().astype(np.float64)
+        transfer = edges['kind'].to_numpy() == TRANSFER
+        weights = {
+            'km': metres,
+            'minutes': np.where(transfer, interchange_minutes, metres / 1000 / speed_kmh * 60),
+        }
+        self._neighbours = {}
+        for metric, weight in weights.items():
+            neighbours = [[] for _ in range(len(metro_graph.nodes))]
+            for u, v, w in zip(edges['source'].tolist(), edges['target'].tolist(), weight.tolist()):
+                neighbours[u].append((v, w))
+                neighbours[v].append((u, w))
+            self._neighbours[metric] = neighbours
+        self._station_nodes = [np.flatnonzero(metro_graph.node_station == s).tolist()
+                               for s in range(len(self.stations))]
+        self._cache = {}
+
+        first = metro_graph.nodes.drop_duplicates('Station').set_index('Station')
+        self.coordinates = first.loc[self.stations, ['Latitude', 'Longitude']]
+
+    def __len__(self):
+        return len(self.stations)
+
+    def _check_metric(self, metric):
+        if metric not in self._neighbours:
+            raise ValueError(f"metric must be one of {', '.join(self._neighbours)}")
+
+    def _sources(self, sources):
+        # one station or several, as a sorted tuple of station numbers (the cache key)
+        if isinstance(sources, (str, int, np.integer)):
+            sources = [sources]
+        return tuple(sorted({self.graph.station_number(source) for source in sources}))
+
+    def search(self, sources, limit, metric='km'):
+        """Bounded multi-source Dijkstra: (stations, costs) of every station within `limit` of the nearest source,
+        by cost."""
+        self._check_metric(metric)
+        neighbours = self._neighbours[metric]
+        node_station = self.graph.node_station
+        best = {}
+        heap = [(0.0, node) for source in sources for node in self._station_nodes[source]]
+        for _, node in heap:
+            best[node] = 0.0
+        scale = _SCALE[metric]
+        bound = limit * scale + _TOLERANCE
+        station_cost = {}
+        while heap:
+            cost, node = heapq.heappop(heap)
+            if cost > best[node]:
+                continue
+            station_cost.setdefault(int(node_station[node]), cost)
+            for target, weight in neighbours[node]:
+                candidate = cost + weight
+                if candidate <= bound and candidate < best.get(target, np.inf):
+                    best[target] = candidate
+                    heapq.heappush(heap, (candidate, target))
+        # stations are settled in cost order, so the dictionary is already sorted
+        return (np.fromiter(station_cost, dtype=np.int64, count=len(station_cost)),
+                np.fromiter(station_cost.values(), dtype=np.float64, count=len(station_cost)) / scale)
+
+    def _band_edge(self, threshold, metric):
+        band = self.bands[metric]
+        return max(1, int(np.ceil(threshold / band - _TOLERANCE))) * band
+
+    def _cached_search(self, sources, threshold, metric):
+        searches = self._cache.setdefault((sources, metric), {})
+        edge = self._band_edge(threshold, metric)
+        wider = [limit for limit in searches if limit >= edge]
+        if wider:
+            stations, costs = searches[min(wider)]
+        else:
+            stations, costs = searches[edge] = self.search(sources, edge, metric)
+        end = np.searchsorted(costs, threshold + _TOLERANCE, side='right')
+        return stations[:end], costs[:end]
+
+    def reachable(self, sources, threshold, metric='km'):
+        """Stations within `threshold` km or minutes of the nearest of `sources` (one station or several), with their
+        cost, nearest first."""
+        self._check_metric(metric)
+        if threshold < 0:
+            raise ValueError("threshold must not be negative")
+        stations, costs = self._cached_search(self._sources(sources), threshold, metric)
+        return pd.Series(costs, index=self.stations[stations], name=_column(metric))
+
+    def catchments(self, sources, thresholds, metric='km'):
+        """Long table of the catchment of every source separately: one row per (source, reachable station), with the
+        smallest of `thresholds` that reaches it in 'Threshold'."""
+        self._check_metric(metric)
+        thresholds = np.sort(np.atleast_1d(np.asarray(thresholds, dtype=np.float64)))
+        if isinstance(sources, (str, int, np.integer)):
+            sources = [sources]
+        parts = []
+        for source in sources:
+            stations, costs = self._cached_search(self._sources(source), thresholds[-1], metric)
+            parts.append(pd.DataFrame({
+                'Source': self.stations[self.graph.station_number(source)],
+                'Station': self.stations[stations],
+                _column(metric): costs,
+                'Threshold': thresholds[np.searchsorted(thresholds, costs - _TOLERANCE)],
+            }))
+        table = pd.concat(parts, ignore_index=True)
+        return table.join(self.coordinates, on='Station')
+
+    def matrix(self, thresholds, metric='km', processes=None):
+        """Station x threshold counts of the other stations reachable within each threshold.
+
+        With `processes` > 1 the per-station searches are spread across a process pool; every search is also kept
+        in the cache.
+        """
+        self._check_metric(metric)
+        thresholds = np.sort(np.atleast_1d(np.asarray(thresholds, dtype=np.float64)))
+        edge = self._band_edge(thresholds[-1], metric)
+        missing = [s for s in range(len(self)) if not any(limit >= edge for limit in
+                                                           self._cache.get(((s,), metric), {}))]
+        if processes is not None and processes > 1 and len(missing) > 1:
+            chunksize = max(1, len(missing) // (4 * processes))
+            with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(self,)) as pool:
+                results = list(pool.map(_station_search, missing, [edge] * len(missing),
+                                        [metric] * len(missing), chunksize=chunksize))
+        else:
+            results = [_station_search(station, edge, metric, self) for station in missing]
+        for station, result in zip(missing, results):
+            self._cache.setdefault(((station,), metric), {})[edge] = result
+
+        costs = np.full((len(self), len(self)), np.inf)
+        for station in range(len(self)):
+            stations, station_costs = self._cached_search((station,), thresholds[-1], metric)
+            costs[station, stations] = station_costs
+        counts = (costs[:, :, None] <= thresholds[None, None, :] + _TOLERANCE).sum(axis=1) - 1
+        return pd.DataFrame(counts, index=self.stations, columns=pd.Index(thresholds, name=_column(metric)))
+
+    def clear_cache(self):
+        self._cache.clear()
+
+
+def _column(metric):
+    return 'Distance (km)' if metric == 'km' else 'Travel Time (min)'
+
+
+def _station_search(station, limit, metric, isochrones=None):
+    isochrones = _worker_isochrones if isochrones is None else isochrones
+    return isochrones.search((station,), limit, metric)
@@ -0,0 +1,197 @@
+# coding: utf-8
+
+# * Point layers for the folium maps, built from column arrays instead of one folium.Marker per row.
+# * Points are aggregated server-side into square grid cells of Web Mercator pixels for every zoom level of a
+#   pyramid: a cell holds one circle per line, placed at the members' centroid and sized by their count. The finest
+#   level is computed once and each coarser level merges the groups of the level below.
+# * The whole pyramid goes into a single GeoJSON layer, coloured per line from `line_colors` through each feature's
+#   style property (no per-feature Python style callback), and a small script swaps in the level matching the
+#   map's zoom. Each level is embedded once: the layer starts with the coarsest one, which the script reads back
+#   from it.
+# * Every zoom level is kept. A level with more than MAX_LEVEL_FEATURES clusters is drawn only inside the visible
+#   part of the map and redrawn as it moves. Clusters are grid cells of the screen, so the number in view is
+#   bounded by the window size whatever the number of points.
+# * Catchment layers colour the stations of an isochrones.Isochrones table by the smallest threshold that reaches
+#   them, in the same single-GeoJSON style.
+
+import json
+
+import folium
+import numpy as np
+import pandas as pd
+from folium.template import Template
+
+CELL_PIXELS = 48
+ZOOM_LEVELS = range(8, 17)
+# zoom levels with more clusters than this are only drawn inside the visible part of the map
+MAX_LEVEL_FEATURES = 20_000
+# the visible part is padded by this fraction of its size on every side, so small pans need no redraw
+VIEW_PADDING = 0.5
+TILE_PIXELS = 256
+# nearest band first
+CATCHMENT_COLORS = ['darkgreen', 'green', 'yellowgreen', 'orange', 'orangered', 'red', 'darkred']
+
+
+def mercator_pixels(latitude, longitude, zoom):
+    """Web Mercator pixel coordinates (x, y) at a zoom level, as used by Leaflet's tiles."""
+    scale = TILE_PIXELS * 2.0 ** zoom
+    lat = np.radians(np.clip(np.asarray(latitude, dtype=np.float64), -85.05112878, 85.05112878))
+    x = (np.asarray(longitude, dtype=np.float64) + 180) / 360 * scale
+    y = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2 * scale
+    return x, y
+
+
+def _aggregate(cell_x, cell_y, line, count, latitude_sum, longitude_sum, first):
+    # merge rows that share (cell, line); `first` keeps the row number of one member for its label
+    keys = (cell_x << np.int64(42)) | (cell_y << np.int64(16)) | line
+    _, start, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    n = len(start)
+    return (cell_x[start], cell_y[start], line[start], np.bincount(inverse, weights=count, minlength=n),
+            np.bincount(inverse, weights=latitude_sum, minlength=n),
+            np.bincount(inverse, weights=longitude_sum, minlength=n), first[start])
+
+
+def cluster_levels(latitude, longitude, lines, labels, zooms=ZOOM_LEVELS, cell_pixels=CELL_PIXELS):
+    """{zoom: clusters} with one row per (grid cell, line): 'Latitude', 'Longitude' (centroid), 'Line',
+    'Points' and 'Label' (the point's own label for single points, else the point count)."""
+    zooms = sorted(zooms)
+    latitude = np.asarray(latitude, dtype=np.float64)
+    longitude = np.asarray(longitude, dtype=np.float64)
+    line_codes, line_names = pd.factorize(pd.Series(lines), use_na_sentinel=False)
+    labels = np.asarray(labels, dtype=object)
+
+    # cell numbers at the finest zoom; at each coarser zoom a cell covers 2 x 2 cells of the one below
+    x, y = mercator_pixels(latitude, longitude, zooms[-1])
+    level = (np.floor(x / cell_pixels).astype(np.int64), np.floor(y / cell_pixels).astype(np.int64),
+             line_codes.astype(np.int64), np.ones(len(latitude)), latitude, longitude, np.arange(len(latitude)))
+    levels = {}
+    for zoom in reversed(zooms):
+        if zoom != zooms[-1]:
+            shift = np.int64(previous - zoom)
+            level = (level[0] >> shift, level[1] >> shift) + level[2:]
+        level = _aggregate(*level)
+        previous = zoom
+        _, _, line, count, latitude_sum, longitude_sum, first = level
+        points = count.astype(np.int64)
+        levels[zoom] = pd.DataFrame({
+            'Latitude': latitude_sum / count,
+            'Longitude': longitude_sum / count,
+            'Line': line_names.take(line),
+            'Points': points,
+            'Label': np.where(points == 1, labels[first], pd.Series(points).map('{:,} points'.format).to_numpy()),
+        })
+    return dict(sorted(levels.items()))
+
+
+def cluster_features(clusters, line_colors, default_color='black'):
+    """GeoJSON FeatureCollection of circles, with each feature's Leaflet style in its properties."""
+    colors = clusters['Line'].map(line_colors).fillna(default_color).tolist()
+    radius = np.round(4 + 2 * np.log2(clusters['Points'].to_numpy()), 1).tolist()
+    features = [
+        {'type': 'Feature',
+         'geometry': {'type': 'Point', 'coordinates': [round(lon, 6), round(lat, 6)]},
+         'properties': {'Label': label, 'Line': line, 'Points': points,
+                        'style': {'color': color, 'fillColor': color, 'radius': r}}}
+        for lat, lon, line, points, label, color, r in zip(
+            clusters['Latitude'].tolist(), clusters['Longitude'].tolist(), clusters['Line'].tolist(),
+            clusters['Points'].tolist(), clusters['Label'].tolist(), colors, radius)
+    ]
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+class ZoomLevels(folium.MacroElement):
+    """Replaces the features of a GeoJson layer with the pyramid level matching the map's zoom.
+
+    `levels` holds every level but `initial`, whose features the layer already has. Levels with more than
+    `max_features` features are drawn only inside the padded map bounds, again after every move.
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = {{ this.levels }};
+        {{ this.get_name() }}[{{ this.initial }}] = {{ this.layer.get_name() }}.toGeoJSON();
+        var {{ this.get_name() }}_shown = null;
+        function {{ this.get_name() }}_show() {
+            var map = {{ this.map.get_name() }}, zoom = map.getZoom();
+            var levels = Object.keys({{ this.get_name() }}).map(Number).sort(function(a, b) { return a - b; });
+            var chosen = levels[0];
+            levels.forEach(function(level) { if (level <= zoom) { chosen = level; } });
+            var data = {{ this.get_name() }}[chosen];
+            var capped = data.features.length > {{ this.max_features }};
+            if (chosen === {{ this.get_name() }}_shown && !capped) { return; }
+            {{ this.get_name() }}_shown = chosen;
+            if (capped) {
+                var bounds = map.getBounds().pad({{ this.padding }});
+                data = {type: 'FeatureCollection', features: data.features.filter(function(feature) {
+                    var coordinates = feature.geometry.coordinates;
+                    return bounds.contains([coordinates[1], coordinates[0]]);
+                })};
+            }
+            {{ this.layer.get_name() }}.clearLayers();
+            {{ this.layer.get_name() }}.addData(data);
+            {{ this.layer.get_name() }}.setStyle(function(feature) { return feature.properties.style; });
+        }
+        {{ this.map.get_name() }}.on('moveend', {{ this.get_name() }}_show);
+        {{ this.get_name() }}_show();
+        {% endmacro %}
+    """)
+
+    def __init__(self, map, layer, levels, initial, max_features=MAX_LEVEL_FEATURES, padding=VIEW_PADDING):
+        super().__init__()
+        self._name = 'ZoomLevels'
+        self.map = map
+        self.layer = layer
+        self.initial = int(initial)
+        self.levels = json.dumps({zoom: features for zoom, features in levels.items() if zoom != initial},
+                                 separators=(',', ':'))
+        self.max_features = int(max_features)
+        self.padding = float(padding)
+
+
+def add_point_layer(map, points, line_colors, label='Station Name', name='Stations', zooms=ZOOM_LEVELS,
+                    cell_pixels=CELL_PIXELS, max_level_features=MAX_LEVEL_FEATURES):
+    """Add `points` ('Latitude', 'Longitude', 'Line' and the `label` column) to `map` as one clustered GeoJSON
+    layer; returns the layer and the cluster tables that were embedded, by zoom. Levels with more than
+    `max_level_features` clusters are drawn only around the visible part of the map."""
+    levels = cluster_levels(points['Latitude'], points['Longitude'], points['Line'], points[label],
+                            zooms=zooms, cell_pixels=cell_pixels)
+    coarsest = min(levels)
+    features = {zoom: cluster_features(clusters, line_colors) for zoom, clusters in levels.items()}
+    # the layer starts with the small coarsest level, the only copy of it in the page; the tooltip checks its
+    # fields against these features
+    layer = folium.GeoJson(
+        features[coarsest],
+        name=name,
+        marker=folium.CircleMarker(radius=5, weight=1, fill=True, fill_opacity=0.8),
+        tooltip=folium.GeoJsonTooltip(fields=['Label', 'Line', 'Points'], aliases=[label, 'Line', 'Points']),
+    ).add_to(map)
+    ZoomLevels(map, layer, features, coarsest, max_level_features).add_to(map)
+    return layer, levels
+
+
+def add_catchment_layer(map, catchments, colors=CATCHMENT_COLORS, name='Catchments'):
+    """Add the stations of an Isochrones.catchments table to `map`, coloured by 'Threshold' (sources drawn larger);
+    returns the layer. The style is precomputed into each feature's properties and applied by folium's
+    feature.properties.style path, as for the point layer."""
+    cost_column = catchments.columns[2]
+    thresholds = np.sort(catchments['Threshold'].unique())
+    band_colors = dict(zip(thresholds, (colors[i % len(colors)] for i in range(len(thresholds)))))
+    is_source = (catchments['Station'] == catchments['Source']).to_numpy()
+    features = [
+        {'type': 'Feature',
+         'geometry': {'type': 'Point', 'coordinates': [round(lon, 6), round(lat, 6)]},
+         'properties': {'Source': source, 'Station': station, 'Cost': round(cost, 2), 'Threshold': threshold,
+                        'style': {'color': 'black' if origin else band_colors[threshold],
+                                  'fillColor': band_colors[threshold], 'radius': 9 if origin else 5}}}
+        for source, station, cost, threshold, lat, lon, origin in zip(
+            catchments['Source'].tolist(), catchments['Station'].tolist(), catchments[cost_column].tolist(),
+            catchments['Threshold'].tolist(), catchments['Latitude'].tolist(), catchments['Longitude'].tolist(),
+            is_source.tolist())
+    ]
+    return folium.GeoJson(
+        {'type': 'FeatureCollection', 'features': features},
+        name=name,
+        marker=folium.CircleMarker(radius=5, weight=1, fill=True, fill_opacity=0.8),
+        tooltip=folium.GeoJsonTooltip(fields=['Station', 'Source', 'Cost', 'Threshold'],
+                                      aliases=['Station', 'From', cost_column, 'Within']),
+    ).add_to(map)
@@ -0,0 +1,223 @@
+# coding: utf-8
+
+# * Graph engine for the Delhi metro network.
+# * Every row of Delhi-Metro-Network.csv is a node (a station on one line). Consecutive stations along a line, ordered
+#   by 'Distance from Start (km)', are joined by track edges; the interchanges of station_records (rows of the same
+#   physical station on different lines, and walkways) are transfer edges of zero length that count one interchange.
+# * All-pairs shortest paths are precomputed once (Floyd-Warshall over integer costs) into compact arrays: distance in
+#   metres, interchange counts and a next-hop table, so a journey query is a table lookup plus a walk along the route.
+# * Paths minimise distance first and interchanges second: the cost of a path is metres * INTERCHANGE_UNITS +
+#   interchanges, which keeps the search in exact integer arithmetic.
+
+import numpy as np
+import pandas as pd
+
+from station_records import StationRecords, normalized, station_names
+
+TRACK = 0
+TRANSFER = 1
+
+INTERCHANGE_UNITS = 1024
+UNREACHABLE = np.iinfo(np.int64).max // 4
+
+
+def all_pairs_shortest_paths(costs):
+    """Floyd-Warshall on a dense integer cost matrix (UNREACHABLE for no edge); returns (costs, next_hop)."""
+    costs = np.array(costs, dtype=np.int64)
+    n = len(costs)
+    np.fill_diagonal(costs, 0)
+    next_hop = np.where(costs < UNREACHABLE, np.arange(n, dtype=np.int32)[None, :], -1).astype(np.int32)
+    through = np.empty_like(costs)
+    better = np.empty(costs.shape, dtype=bool)
+    for k in range(n):
+        np.add(costs[:, k, None], costs[None, k, :], out=through)
+        np.less(through, costs, out=better)
+        np.minimum(costs, through, out=costs)
+        np.copyto(next_hop, next_hop[:, k, None], where=better)
+    return costs, next_hop
+
+
+class StationLookup:
+    """Station and journey lookups shared by MetroGraph and the exported DistanceMatrixFile.
+
+    Expects `node_ids`, `node_station`, `station_index`, `_lookup` (name -> station number, including every cleaned
+    name) and the `distance_m`, `interchanges`, `station_origin` and `station_destination` tables.
+    """
+
+    def node(self, station):
+        """Node positions of a station name or 'Station ID'."""
+        if isinstance(station, (int, np.integer)):
+            return np.array([self.node_ids.get_loc(station)])
+        return np.flatnonzero(self.node_station == self.station_number(station))
+
+    def station_number(self, station):
+        if isinstance(station, (int, np.integer)):
+            return int(self.node_station[self.node_ids.get_loc(station)])
+        number = self._lookup.get(station)
+        if number is None:
+            name = station_names([station]).iloc[0]
+            if name not in self._lookup:
+                raise KeyError(f"unknown station {station!r}")
+            number = self._lookup[station] = self._lookup[name]
+        return number
+
+    def _nearest_node(self, fixed, station):
+        # the node of `station` on the cheapest path from the node `fixed` (paths are symmetric)
+        candidates = self.node(station)
+        metres = self.distance_m[fixed, candidates].astype(np.int64)
+        costs = np.where(metres >= 0, metres * INTERCHANGE_UNITS + self.interchanges[fixed, candidates], UNREACHABLE)
+        return int(candidates[costs.argmin()])
+
+    def _endpoints(self, origin, destination):
+        # a 'Station ID' pins the line, a name lets the best line be chosen: for the pair when both are names,
+        # otherwise for the pinned node
+        origin_pinned = isinstance(origin, (int, np.integer))
+        destination_pinned = isinstance(destination, (int, np.integer))
+        if origin_pinned and destination_pinned:
+            return self.node_ids.get_loc(origin), self.node_ids.get_loc(destination)
+        if origin_pinned:
+            start = self.node_ids.get_loc(origin)
+            return int(start), self._nearest_node(start, destination)
+        if destination_pinned:
+            end = self.node_ids.get_loc(destination)
+            return self._nearest_node(end, origin), int(end)
+        o, d = self.station_number(origin), self.station_number(destination)
+        return int(self.station_origin[o, d]), int(self.station_destination[o, d])
+
+    def distance(self, origin, destination):
+        """Shortest distance in km, or NaN when the stations are not connected."""
+        start, end = self._endpoints(origin, destination)
+        metres = self.distance_m[start, end]
+        return metres / 1000 if metres >= 0 else np.nan
+
+    def interchange_count(self, origin, destination):
+        start, end = self._endpoints(origin, destination)
+        return int(self.interchanges[start, end])
+
+
+class MetroGraph(StationLookup):
+    """Metro network with precomputed all-pairs shortest paths.
+
+    `nodes` has one row per station on a line; `station_index` lists the physical stations. Queries accept a station
+    name (with or without interchange markers) or a 'Station ID'; between physical stations the best pair of line
+    nodes is used, so changing lines at the origin or destination is never counted.
+
+    Built from a station frame or from its StationRecords; `nodes` is the records' `stops` table.
+    """
+
+    def __init__(self, metro_data):
+        self.records = metro_data if isinstance(metro_data, StationRecords) else normalized(metro_data)
+        nodes = self.records.stops
+        self.nodes = nodes
+        self.station_index = pd.Index(nodes['Station'].unique())
+        self.node_station = self.station_index.get_indexer(nodes['Station']).astype(np.int32)
+        self.node_ids = pd.Index(nodes['Station ID'])
+        if not self.node_ids.is_unique:
+            raise ValueError("'Station ID' must be unique")
+        self._node_names = nodes['Station'].to_numpy()
+        self._node_lines = nodes['Line'].to_numpy()
+        # raw and cleaned names -> station number, so queries skip the string clean-up
+        self._lookup = dict(zip(nodes['Station Name'], self.node_station.tolist()))
+        self._lookup.update(zip(self.station_index, range(len(self.station_index))))
+
+        self.edges = self._build_edges()
+        self._compute()
+
+    def _build_edges(self):
+        nodes = self.nodes
+        metres = np.rint(nodes['Distance from Start (km)'].to_numpy() * 1000).astype(np.int64)
+        line = nodes['Line'].to_numpy()
+        same_line = line[1:] == line[:-1]
+        track_source = np.flatnonzero(same_line)
+        track = pd.DataFrame({'source': track_source, 'target': track_source + 1,
+                              'metres': metres[track_source + 1] - metres[track_source], 'kind': TRACK})
+        if (track['metres'] <= 0).any():
+            raise ValueError("stations on a line must have strictly increasing 'Distance from Start (km)'")
+
+        # the interchange table pairs rows sharing a physical station and the rows at both ends of a walkway
+        interchanges = self.records.interchanges
+        first = self.node_ids.get_indexer(interchanges['From Station ID'])
+        second = self.node_ids.get_indexer(interchanges['To Station ID'])
+        transfer = pd.DataFrame({'source': np.minimum(first, second), 'target': np.maximum(first, second),
+                                 'metres': 0, 'kind': TRANSFER}).sort_values(['source', 'target'])
+        return pd.concat([track, transfer], ignore_index=True)
+
+    def edge_costs(self, edges=None):
+        """Dense symmetric cost matrix of the given edges (default: all of them)."""
+        edges = self.edges if edges is None else edges
+        n = len(self.nodes)
+        costs = np.full((n, n), UNREACHABLE, dtype=np.int64)
+        weight = edges['metres'].to_numpy() * INTERCHANGE_UNITS + (edges['kind'].to_numpy() == TRANSFER)
+        source, target = edges['source'].to_numpy(), edges['target'].to_numpy()
+        np.minimum.at(costs, (source, target), weight)
+        np.minimum.at(costs, (target, source), weight)
+        return costs
+
+    def _compute(self):
+        costs, self.next_hop = all_pairs_shortest_paths(self.edge_costs())
+        reachable = costs < UNREACHABLE
+        self.distance_m = np.where(reachable, costs // INTERCHANGE_UNITS, -1).astype(np.int32)
+        self.interchanges = np.where(reachable, costs % INTERCHANGE_UNITS, -1).astype(np.int16)
+        self._station_pairs(costs)
+
+    def _station_pairs(self, costs):
+        # best (origin node, destination node) for every pair of physical stations: pad each station's nodes to
+        # the same count with a dummy unreachable node and take the argmin over the small node x node blocks
+        n_stations = len(self.station_index)
+        order = np.argsort(self.node_station, kind='stable')
+        counts = np.bincount(self.node_station, minlength=n_stations)
+        width = counts.max()
+        slot = np.arange(len(order)) - np.repeat(np.cumsum(counts) - counts, counts)
+        members = np.full((n_stations, width), len(self.nodes), dtype=np.int32)
+        members[self.node_station[order], slot] = order
+
+        padded = np.full((len(costs) + 1, len(costs) + 1), UNREACHABLE, dtype=np.int64)
+        padded[:-1, :-1] = costs
+        block = padded[members[:, :, None, None], members[None, None, :, :]]
+        block = block.transpose(0, 2, 1, 3).reshape(n_stations, n_stations, width * width)
+        best = block.argmin(axis=2)
+        self.station_origin = members[np.arange(n_stations)[:, None], best // width]
+        self.station_destination = members[np.arange(n_stations)[None, :], best % width]
+
+    def route_nodes(self, start, end):
+        """Node positions along the shortest path between two nodes; empty when unreachable."""
+        if self.next_hop[start, end] < 0:
+            return []
+        path = [start]
+        while start != end:
+            start = self.next_hop[start, end]
+            path.append(int(start))
+        return path
+
+    def route(self, origin, destination):
+        """Stations along the shortest path as (station, line) pairs; a change of line repeats the station."""
+        return self._describe(self.route_nodes(*self._endpoints(origin, destination)))
+
+    def _describe(self, path):
+        return [(self._node_names[i], self._node_lines[i]) for i in path]
+
+    def journey(self, origin, destination):
+        start, end = self._endpoints(origin, destination)
+        metres = self.distance_m[start, end]
+        return {
+            'Distance (km)': metres / 1000 if metres >= 0 else np.nan,
+            'Interchanges': int(self.interchanges[start, end]),
+            'Route': self._describe(self.route_nodes(start, end)),
+        }
+
+    def station_distances(self):
+        """Physical station x station distance matrix in km (NaN where unconnected)."""
+        metres = self.distance_m[self.station_origin, self.station_destination]
+        km = np.where(metres >= 0, metres / 1000, np.nan)
+        return pd.DataFrame(km, index=self.station_index, columns=self.station_index)
+
+    def components(self):
+        """Connected component number of every node."""
+        reachable = self.distance_m >= 0
+        # the first reachable node of each row is the same for every node in one component
+        first = reachable.argmax(axis=1)
+        return pd.factorize(first)[0]
+
+
+def load_metro_graph(path):
+    return MetroGraph(pd.read_csv(path))
@@ -0,0 +1,216 @@
+# coding: utf-8
+
+# * Temporal replay of the metro network in 'Opening Date' order.
+# * Stations are added date by date. On each line, consecutive open stations are linked when at most
+#   INFILL_MAX_STATIONS unopened stations lie between them: trains ran through infill stations such as Cyber City
+#   before they opened, while a longer unopened run is a section not yet built.
+# * The station-level all-pairs table is updated in place as each segment opens, relaxing only the rows and columns
+#   the new segment can improve, so the whole history is one incremental sweep. Every version records its
+#   connectivity and shortest-path metrics; full tables are checkpointed every CHECKPOINT_EVERY versions and rebuilt
+#   for any other date by replaying the few segments opened since the checkpoint.
+# * Costs are those of network_metrics: metres * INTERCHANGE_UNITS, one interchange for a walkway.
+
+import numpy as np
+import pandas as pd
+
+from metro_graph import INTERCHANGE_UNITS, TRANSFER, UNREACHABLE
+
+INFILL_MAX_STATIONS = 2
+CHECKPOINT_EVERY = 8
+
+
+def add_segment(costs, u, v, cost, changes=None):
+    """Shortest-path table update for a new undirected segment u-v, in place.
+
+    A path i -> u -> v -> j can only be shorter for the stations i that reach v faster through the segment and the
+    stations j that v reaches faster than u does, so only that block is relaxed. The (old, new) values of every
+    relaxed block are appended to `changes` when given.
+    """
+    for a, b in ((u, v), (v, u)):
+        rows = np.flatnonzero(costs[:, a] + cost < costs[:, b])
+        columns = np.flatnonzero(costs[b, :] + cost < costs[a, :])
+        if len(rows) and len(columns):
+            block = np.ix_(rows, columns)
+            old = costs[block]
+            new = np.minimum(old, costs[rows, a, None] + cost + costs[None, b, columns])
+            costs[block] = new
+            if changes is not None:
+                changes.append((old, new))
+    return costs
+
+
+def costs_summary(costs, is_open):
+    """Connectivity and distance metrics over the open stations of a station-level cost table, in which stations that
+    are not open have no segments."""
+    reachable = costs < UNREACHABLE
+    # each station reaches exactly the stations of its component, so a component of size s has s rows counting s
+    sizes = reachable.sum(axis=1)[is_open]
+    pairs = int(sizes.sum() - len(sizes)) // 2
+    metres = np.where(reachable, costs, 0) // INTERCHANGE_UNITS
+    return {
+        'Stations': len(sizes),
+        'Components': int(np.rint((1 / sizes).sum())),
+        'Largest Component': int(sizes.max(initial=0)),
+        'Connected Pairs': pairs,
+        'Diameter (km)': metres.max() / 1000 if pairs else np.nan,
+        'Mean Shortest Path (km)': metres.sum() / (2 * pairs) / 1000 if pairs else np.nan,
+    }
+
+
+class NetworkHistory:
+    """Versioned snapshots of the network, one per distinct opening date, built in one incremental sweep.
+
+    `versions` has one row per date with the metrics of the network as of that date.
+    """
+
+    def __init__(self, metro_graph, infill_max_stations=INFILL_MAX_STATIONS, checkpoint_every=CHECKPOINT_EVERY):
+        nodes = metro_graph.nodes
+        self.stations = metro_graph.station_index
+        self.node_station = metro_graph.node_station
+        self.checkpoint_every = checkpoint_every
+        self.infill_max_stations = infill_max_stations
+
+        opening = pd.to_datetime(nodes['Opening Date']).to_numpy()
+        self._node_opening = opening
+        self._node_metres = np.rint(nodes['Distance from Start (km)'].to_numpy() * 1000).astype(np.int64)
+        self._node_line = nodes['Line'].to_numpy()
+
+        # walkways between different stations open with the later of their two rows
+        edges = metro_graph.edges
+        walkways = edges[(edges['kind'] == TRANSFER).to_numpy()
+                         & (self.node_station[edges['source']] != self.node_station[edges['target']])]
+        self._walkways = [(self.node_station[a], self.node_station[b], max(opening[a], opening[b]))
+                          for a, b in walkways[['source', 'target']].itertuples(False)]
+
+        n = len(self.stations)
+        costs = np.full((n, n), UNREACHABLE, dtype=np.int64)
+        np.fill_diagonal(costs, 0)
+        linked = set()
+        self.dates = np.unique(opening)
+        self.segment_log = []
+        self.checkpoints = []
+        self._station_open = []
+        rows = []
+        # metrics kept up to date from the changed blocks: metres summed over ordered connected pairs, the number of
+        # those pairs, the diameter in metres, components and the largest component
+        total_metres = ordered_pairs = diameter = components = largest = 0
+        open_count = 0
+        for version, date in enumerate(self.dates):
+            node_open = opening <= date
+            station_open = np.zeros(n, dtype=bool)
+            station_open[self.node_station[node_open]] = True
+            components += int(station_open.sum()) - open_count
+            open_count = int(station_open.sum())
+            largest = max(largest, 1)
+            new_segments = []
+            for a, b in self._line_links(node_open):
+                if (a, b) not in linked:
+                    linked.add((a, b))
+                    new_segments.append((a, b))
+            segments = [(self.node_station[a], self.node_station[b],
+                         (self._node_metres[b] - self._node_metres[a]) * INTERCHANGE_UNITS, self._node_line[a])
+                        for a, b in new_segments]
+            segments += [(u, v, 1, 'Transfer') for u, v, opened in self._walkways if opened == date]
+            stale_diameter = False
+            for u, v, cost, _ in segments:
+                merges = costs[u, v] >= UNREACHABLE
+                changes = []
+                add_segment(costs, u, v, cost, changes)
+                for old, new in changes:
+                    was_connected = old < UNREACHABLE
+                    old_metres, new_metres = old // INTERCHANGE_UNITS, new // INTERCHANGE_UNITS
+                    total_metres += int(new_metres.sum() - old_metres[was_connected].sum())
+                    ordered_pairs += int((~was_connected).sum())
+                    # a shortcut on a pair at the diameter may shrink it; only then is the whole table searched
+                    stale_diameter |= bool((was_connected & (old_metres == diameter) & (new < old)).any())
+                    diameter = max(diameter, int(new_metres.max()))
+                if merges:
+                    components -= 1
+                    largest = max(largest, int((costs[u] < UNREACHABLE).sum()))
+            if stale_diameter:
+                diameter = int((np.where(costs < UNREACHABLE, costs, 0) // INTERCHANGE_UNITS).max())
+            self.segment_log.append(segments)
+
+            self._station_open.append(station_open)
+            if version % checkpoint_every == 0:
+                self.checkpoints.append(costs.copy())
+            pairs = ordered_pairs // 2
+            rows.append({
+                'Date': pd.Timestamp(date), 'Version': version, 'New Segments': len(segments),
+                'Stations': open_count, 'Components': components, 'Largest Component': largest,
+                'Connected Pairs': pairs,
+                'Diameter (km)': diameter / 1000 if pairs else np.nan,
+                'Mean Shortest Path (km)': total_metres / ordered_pairs / 1000 if pairs else np.nan,
+            })
+        self.versions = pd.DataFrame(rows)
+        self._costs = costs
+
+    def _line_links(self, node_open):
+        # consecutive open rows of the same line with at most infill_max_stations unopened rows between them;
+        # rows are sorted by line and distance, so positions give the order along each line
+        positions = np.flatnonzero(node_open)
+        first, second = positions[:-1], positions[1:]
+        keep = ((self._node_line[first] == self._node_line[second])
+                & (second - first - 1 <= self.infill_max_stations))
+        return list(zip(first[keep].tolist(), second[keep].tolist()))
+
+    def version_at(self, date):
+        """Number of the last version on or before `date`, or -1 before the first opening."""
+        return int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(date)), side='right')) - 1
+
+    def costs_at(self, date):
+        """Station-level cost table as of `date`, from the nearest checkpoint plus the segments opened since."""
+        version = self.version_at(date)
+        if version < 0:
+            costs = np.full((len(self.stations), len(self.stations)), UNREACHABLE, dtype=np.int64)
+            np.fill_diagonal(costs, 0)
+            return costs
+        checkpoint = version // self.checkpoint_every
+        costs = self.checkpoints[checkpoint].copy()
+        for segments in self.segment_log[checkpoint * self.checkpoint_every + 1:version + 1]:
+            for u, v, cost, _ in segments:
+                add_segment(costs, u, v, cost)
+        return costs
+
+    def open_stations(self, date):
+        version = self.version_at(date)
+        if version < 0:
+            return self.stations[:0]
+        return self.stations[self._station_open[version]]
+
+    def segments_at(self, date):
+        """Segments in service as of `date`, including links through infill stations that had not opened yet."""
+        version = self.version_at(date)
+        rows = []
+        if version >= 0:
+            rows = [(self.node_station[a], self.node_station[b], self._node_line[a],
+                     (self._node_metres[b] - self._node_metres[a]) / 1000)
+                    for a, b in self._line_links(self._node_opening <= self.dates[version])]
+            rows += [(u, v, 'Transfer', 0.0) for u, v, opened in self._walkways if opened <= self.dates[version]]
+        segments = pd.DataFrame(rows, columns=['From', 'To', 'Line', 'Length (km)']).astype({'Length (km)': float})
+        segments['From'] = self.stations[segments['From'].to_numpy(dtype=np.int64)]
+        segments['To'] = self.stations[segments['To'].to_numpy(dtype=np.int64)]
+        return segments
+
+    def distance(self, origin, destination, date):
+        """Shortest distance in km between two stations as of `date`; NaN when either is closed or unconnected."""
+        o, d = self.stations.get_loc(origin), self.stations.get_loc(destination)
+        version = self.version_at(date)
+        if version < 0 or not (self._station_open[version][o] and self._station_open[version][d]):
+            return np.nan
+        cost = self.costs_at(date)[o, d]
+        return cost // INTERCHANGE_UNITS / 1000 if cost < UNREACHABLE else np.nan
+
+    def summary_at(self, date):
+        version = self.version_at(date)
+        if version < 0:
+            raise KeyError(f"no station had opened by {date}")
+        return self.versions.iloc[version]
+
+    def yearly(self):
+        """Metrics of the network as it stood at the end of each year, from the first opening year to the last."""
+        years = range(self.versions['Date'].dt.year.min(), self.versions['Date'].dt.year.max() + 1)
+        rows = [self.summary_at(pd.Timestamp(year=year, month=12, day=31)) for year in years]
+        table = pd.DataFrame(rows).drop(columns=['Version', 'New Segments'])
+        table.insert(0, 'Year', list(years))
+        return table.reset_index(drop=True)
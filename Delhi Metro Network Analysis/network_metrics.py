@@ -0,0 +1,286 @@
+# coding: utf-8
+
+# * Structural metrics of the metro network at the level of physical stations: betweenness centrality (Brandes),
+#   articulation points and bridges (Tarjan), and closure sweeps that measure how travel distances degrade when one
+#   segment or one station is closed.
+# * Costs are the integers of metro_graph (metres * INTERCHANGE_UNITS + interchanges), so shortest-path ties are
+#   exact. Changing lines inside a station is free here; a walkway between two stations counts one interchange.
+# * A closure only lengthens the pairs whose shortest path uses the closed segment or passes through the closed
+#   station. Those pairs are found from the all-pairs table in one vectorized test, and each source re-runs Dijkstra
+#   over its affected targets only, seeded from its unaffected ones; the scenarios of a sweep are spread across a
+#   process pool.
+
+import heapq
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from metro_graph import INTERCHANGE_UNITS, TRANSFER, UNREACHABLE
+
+_worker_network = None
+
+
+def _init_worker(network):
+    global _worker_network
+    _worker_network = network
+
+
+class StationNetwork:
+    """Undirected weighted graph of physical stations built from a MetroGraph."""
+
+    def __init__(self, metro_graph):
+        self.stations = metro_graph.station_index
+        edges = metro_graph.edges
+        station = metro_graph.node_station
+        source, target = station[edges['source'].to_numpy()], station[edges['target'].to_numpy()]
+        segments = pd.DataFrame({
+            'source': np.minimum(source, target),
+            'target': np.maximum(source, target),
+            'cost': edges['metres'].to_numpy() * INTERCHANGE_UNITS + (edges['kind'].to_numpy() == TRANSFER),
+            'metres': edges['metres'].to_numpy(),
+            'Line': np.where(edges['kind'].to_numpy() == TRANSFER, 'Transfer',
+                             metro_graph.nodes['Line'].to_numpy()[edges['source'].to_numpy()]),
+        })
+        # transfers inside one station become self-loops and are dropped; parallel segments keep the shortest
+        segments = segments[segments['source'] != segments['target']]
+        segments = (segments.sort_values('cost', kind='stable')
+                    .groupby(['source', 'target'], as_index=False, sort=True)
+                    .agg(cost=('cost', 'first'), metres=('metres', 'first'), Line=('Line', ' / '.join)))
+        self.segments = segments
+
+        self.neighbours = [[] for _ in range(len(self.stations))]
+        for edge, (u, v, cost) in enumerate(segments[['source', 'target', 'cost']].itertuples(False)):
+            self.neighbours[u].append((v, cost, edge))
+            self.neighbours[v].append((u, cost, edge))
+        self.costs = np.array([self.shortest_costs(source) for source in range(len(self.stations))])
+
+    def __len__(self):
+        return len(self.stations)
+
+    def shortest_costs(self, source, closed_segment=-1, closed_station=-1):
+        """Costs from `source` to every station (UNREACHABLE where cut off), optionally with one segment or one
+        station closed."""
+        costs = [UNREACHABLE] * len(self.stations)
+        costs[source] = 0
+        heap = [(0, source)]
+        neighbours = self.neighbours
+        while heap:
+            cost, node = heapq.heappop(heap)
+            if cost > costs[node]:
+                continue
+            for target, weight, edge in neighbours[node]:
+                if edge == closed_segment or target == closed_station:
+                    continue
+                candidate = cost + weight
+                if candidate < costs[target]:
+                    costs[target] = candidate
+                    heapq.heappush(heap, (candidate, target))
+        return costs
+
+    def betweenness(self, normalized=True):
+        """Brandes betweenness centrality: the share of shortest paths between other stations passing through each
+        station, with ties split evenly; normalised by (n - 1)(n - 2) ordered pairs."""
+        n = len(self.stations)
+        centrality = np.zeros(n)
+        for source in range(n):
+            # single-source shortest paths, counting equal-cost paths (sigma) and recording predecessors
+            order = []
+            predecessors = [[] for _ in range(n)]
+            sigma = [0] * n
+            sigma[source] = 1
+            costs = {}
+            seen = {source: 0}
+            heap = [(0, source, source)]
+            while heap:
+                cost, previous, node = heapq.heappop(heap)
+                if node in costs:
+                    continue
+                sigma[node] += sigma[previous] if previous != node else 0
+                order.append(node)
+                costs[node] = cost
+                for target, weight, _ in self.neighbours[node]:
+                    candidate = cost + weight
+                    if target not in costs and (target not in seen or candidate < seen[target]):
+                        seen[target] = candidate
+                        heapq.heappush(heap, (candidate, node, target))
+                        sigma[target] = 0
+                        predecessors[target] = [node]
+                    elif candidate == seen.get(target):
+                        if target not in costs:
+                            sigma[target] += sigma[node]
+                            predecessors[target].append(node)
+            # dependencies accumulate back from the farthest station
+            delta = [0.0] * n
+            for node in reversed(order):
+                for previous in predecessors[node]:
+                    delta[previous] += sigma[previous] / sigma[node] * (1 + delta[node])
+                if node != source:
+                    centrality[node] += delta[node]
+        if normalized and n > 2:
+            centrality /= (n - 1) * (n - 2)
+        return pd.Series(centrality, index=self.stations, name='Betweenness')
+
+    def articulation_points_and_bridges(self):
+        """Stations whose closure disconnects the network, and segments (rows of `segments`) that are bridges."""
+        n = len(self.stations)
+        discovery = [-1] * n
+        low = [0] * n
+        articulation = set()
+        bridges = []
+        time = 0
+        for root in range(n):
+            if discovery[root] >= 0:
+                continue
+            discovery[root] = low[root] = time
+            time += 1
+            root_children = 0
+            # iterative depth-first search; each frame is (node, edge used to reach it, neighbour iterator)
+            stack = [(root, -1, iter(self.neighbours[root]))]
+            while stack:
+                node, parent_edge, neighbours = stack[-1]
+                advanced = False
+                for target, _, edge in neighbours:
+                    if edge == parent_edge:
+                        continue
+                    if discovery[target] < 0:
+                        discovery[target] = low[target] = time
+                        time += 1
+                        stack.append((target, edge, iter(self.neighbours[target])))
+                        advanced = True
+                        break
+                    low[node] = min(low[node], discovery[target])
+                if advanced:
+                    continue
+                stack.pop()
+                if stack:
+                    parent = stack[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                    if low[node] > discovery[parent]:
+                        bridges.append(parent_edge)
+                    if parent == root:
+                        root_children += 1
+                    elif low[node] >= discovery[parent]:
+                        articulation.add(parent)
+            if root_children > 1:
+                articulation.add(root)
+        points = pd.Index(self.stations[sorted(articulation)], name='Station')
+        return points, self.segments.loc[sorted(bridges)]
+
+    def _affected_pairs(self, segment=-1, station=-1):
+        """(sources, targets) matrix of the pairs with a shortest path over the closed segment or through the closed
+        station; every other pair keeps its distance."""
+        costs = self.costs
+        if segment >= 0:
+            u, v, cost = self.segments.iloc[segment][['source', 'target', 'cost']]
+            affected = (costs[:, u, None] + cost + costs[None, v, :] == costs)
+            affected |= (costs[:, v, None] + cost + costs[None, u, :] == costs)
+        else:
+            affected = costs[:, station, None] + costs[None, station, :] == costs
+            affected[:, station] = True
+            affected[station, :] = True
+        return affected
+
+    def _repair(self, source, affected, closed_segment=-1, closed_station=-1):
+        # Dijkstra over the affected targets only, seeded from their unaffected neighbours: a closure can only
+        # lengthen paths, so the unaffected distances are already final
+        costs = self.costs[source].tolist()
+        targets = np.flatnonzero(affected).tolist()
+        for target in targets:
+            costs[target] = UNREACHABLE
+        heap = []
+        for target in targets:
+            if target == closed_station:
+                continue
+            best = UNREACHABLE
+            for neighbour, weight, edge in self.neighbours[target]:
+                if edge != closed_segment and neighbour != closed_station and not affected[neighbour]:
+                    best = min(best, costs[neighbour] + weight)
+            if best < UNREACHABLE:
+                costs[target] = best
+                heap.append((best, target))
+        heapq.heapify(heap)
+        while heap:
+            cost, node = heapq.heappop(heap)
+            if cost > costs[node]:
+                continue
+            for target, weight, edge in self.neighbours[node]:
+                if edge == closed_segment or target == closed_station or not affected[target]:
+                    continue
+                candidate = cost + weight
+                if candidate < costs[target]:
+                    costs[target] = candidate
+                    heapq.heappush(heap, (candidate, target))
+        return costs
+
+    def closure_costs(self, segment=-1, station=-1, incremental=True):
+        """All-pairs costs with one segment or one station closed, and the number of (source, target) pairs searched.
+
+        Incrementally, only the affected pairs of each source are searched again; with `incremental` False every
+        source is re-run from scratch.
+        """
+        costs = self.costs.copy()
+        if not incremental:
+            for source in range(len(self.stations)):
+                if source != station:
+                    costs[source] = self.shortest_costs(source, closed_segment=segment, closed_station=station)
+            return costs, len(self.stations) ** 2
+        affected = self._affected_pairs(segment, station)
+        sources = np.flatnonzero(affected.any(axis=1))
+        for source in sources:
+            if source != station:
+                costs[source] = self._repair(source, affected[source], segment, station)
+        return costs, int(affected.sum())
+
+    def travel_summary(self, costs, excluded=-1):
+        """Mean shortest distance in km over connected station pairs and the number of disconnected pairs."""
+        keep = np.ones(len(self.stations), dtype=bool)
+        if excluded >= 0:
+            keep[excluded] = False
+        costs = costs[np.ix_(keep, keep)]
+        off_diagonal = ~np.eye(len(costs), dtype=bool)
+        connected = (costs < UNREACHABLE) & off_diagonal
+        metres = costs[connected] // INTERCHANGE_UNITS
+        return metres.mean() / 1000, int(((costs >= UNREACHABLE) & off_diagonal).sum() // 2)
+
+    def _closure_row(self, segment=-1, station=-1, incremental=True):
+        costs, rerun = self.closure_costs(segment, station, incremental)
+        mean_km, disconnected = self.travel_summary(costs, excluded=station)
+        return mean_km, disconnected, rerun
+
+    def closure_sweep(self, kind='segment', processes=None, incremental=True):
+        """Close every segment (kind='segment') or every station (kind='station') one at a time.
+
+        With `processes` > 1 the scenarios are spread across a process pool.
+        """
+        if kind not in ('segment', 'station'):
+            raise ValueError("kind must be 'segment' or 'station'")
+        count = len(self.segments) if kind == 'segment' else len(self.stations)
+        scenarios = list(range(count))
+        if processes is not None and processes > 1 and count > 1:
+            chunksize = max(1, count // (4 * processes))
+            with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(self,)) as pool:
+                rows = list(pool.map(_closure_scenario, scenarios, [kind] * count, [incremental] * count,
+                                     chunksize=chunksize))
+        else:
+            rows = [_closure_scenario(scenario, kind, incremental, self) for scenario in scenarios]
+
+        baseline_km, _ = self.travel_summary(self.costs)
+        if kind == 'segment':
+            table = self.segments.assign(**{
+                'From': self.stations[self.segments['source']],
+                'To': self.stations[self.segments['target']],
+                'Length (km)': self.segments['metres'] / 1000,
+            })[['From', 'To', 'Line', 'Length (km)']].reset_index(drop=True)
+        else:
+            table = pd.DataFrame({'Station': self.stations})
+        table['Mean Distance (km)'], table['Disconnected Pairs'], table['Recomputed Pairs'] = zip(*rows)
+        table['Increase (%)'] = (table['Mean Distance (km)'] / baseline_km - 1) * 100
+        return table.sort_values(['Disconnected Pairs', 'Increase (%)'], ascending=False).reset_index(drop=True)
+
+
+def _closure_scenario(scenario, kind, incremental, network=None):
+    network = _worker_network if network is None else network
+    if kind == 'segment':
+        return network._closure_row(segment=scenario, incremental=incremental)
+    return network._closure_row(station=scenario, incremental=incremental)
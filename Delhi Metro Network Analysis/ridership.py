@@ -0,0 +1,141 @@
+# coding: utf-8
+
+# * Synthetic ridership: origin-destination (OD) trip matrices from a gravity model, assigned all-or-nothing to the
+#   shortest paths of a MetroGraph to estimate the load on every segment and every interchange.
+# * A station's weight is the sum over its lines of LINE_WEIGHTS (1 by default, so interchange stations count once
+#   per line) times the mean of LAYOUT_WEIGHTS over its rows. Demand between two stations is proportional to the
+#   product of their weights and exp(-network distance / decay_km); trips are drawn from it with one seeded
+#   multinomial, so a seed reproduces the matrix exactly.
+# * Assignment never walks individual routes. For each destination node the next-hop table is a shortest-path tree,
+#   and the trips bound for it are pushed towards the root one tree level at a time, for all destinations at once.
+#   The cost depends on the network size, not on the number of trips.
+
+import numpy as np
+import pandas as pd
+
+from metro_graph import TRACK, TRANSFER
+
+LAYOUT_WEIGHTS = {'Underground': 1.5, 'Elevated': 1.0, 'At-Grade': 0.75}
+LINE_WEIGHTS = {}
+DECAY_KM = 10.0
+
+
+class RidershipModel:
+    """Gravity-model trip generator and all-or-nothing assignment on a MetroGraph."""
+
+    def __init__(self, metro_graph, layout_weights=LAYOUT_WEIGHTS, line_weights=LINE_WEIGHTS, decay_km=DECAY_KM):
+        if not decay_km > 0:
+            raise ValueError("decay_km must be positive")
+        self.graph = metro_graph
+        self.stations = metro_graph.station_index
+        nodes = metro_graph.nodes
+        n = len(self.stations)
+
+        layout = nodes['Station Layout'].map(layout_weights).fillna(1.0).to_numpy()
+        line = nodes['Line'].map(line_weights).fillna(1.0).to_numpy()
+        station = metro_graph.node_station
+        rows = np.bincount(station, minlength=n)
+        self.weights = pd.Series(np.bincount(station, weights=line, minlength=n)
+                                 * np.bincount(station, weights=layout, minlength=n) / rows,
+                                 index=self.stations, name='Weight')
+
+        distance_km = metro_graph.station_distances().to_numpy()
+        attraction = np.exp(-np.nan_to_num(distance_km, nan=np.inf) / decay_km)
+        np.fill_diagonal(attraction, 0)
+        demand = self.weights.to_numpy()[:, None] * self.weights.to_numpy()[None, :] * attraction
+        self.probabilities = demand / demand.sum()
+        self._tree_levels()
+
+    def _tree_levels(self):
+        # depth of every node in the shortest-path tree of every destination, and the (node, destination) entries of
+        # each depth as flat indices, deepest first
+        next_hop = self.graph.next_hop
+        n = len(next_hop)
+        destination = np.broadcast_to(np.arange(n), (n, n))
+        reachable = next_hop >= 0
+        parent = np.where(reachable, next_hop, 0).astype(np.int64) * n + destination
+        depth = np.where(np.eye(n, dtype=bool), 0, -1)
+        while True:
+            pending = reachable & (depth < 0)
+            parent_depth = depth.ravel()[parent]
+            ready = pending & (parent_depth >= 0)
+            if not ready.any():
+                break
+            depth[ready] = parent_depth[ready] + 1
+        flat_depth = depth.ravel()
+        order = np.argsort(-flat_depth, kind='stable')
+        boundaries = np.flatnonzero(np.diff(flat_depth[order])) + 1
+        self._levels = [level for level in np.split(order, boundaries) if flat_depth[level[0]] > 0]
+        self._parent = parent.ravel()
+
+    def generate(self, trips, seed=0):
+        """(stations x stations) matrix of `trips` trips drawn from the gravity model; the same seed gives the same
+        matrix."""
+        if trips < 0:
+            raise ValueError("trips must not be negative")
+        rng = np.random.default_rng(seed)
+        counts = rng.multinomial(trips, self.probabilities.ravel())
+        return counts.reshape(self.probabilities.shape)
+
+    def node_loads(self, od):
+        """(nodes x nodes) matrix of trips on every directed node-to-node hop of the shortest paths."""
+        graph = self.graph
+        n = len(graph.nodes)
+        od = np.asarray(od)
+        if od.shape != (len(self.stations),) * 2:
+            raise ValueError(f"od must be a {len(self.stations)} x {len(self.stations)} matrix")
+        # station pairs start and end on their best pair of line nodes
+        start = graph.station_origin.ravel().astype(np.int64)
+        end = graph.station_destination.ravel().astype(np.int64)
+        pending = np.bincount(start * n + end, weights=od.ravel(), minlength=n * n)
+        # trips bound for each destination flow up its tree: everything at a node moves to the node's parent
+        hops = np.zeros(n * n)
+        for level in self._levels:
+            through = pending[level]
+            hops[level] = through
+            np.add.at(pending, self._parent[level], through)
+        source = np.arange(n * n) // n
+        hop_target = self._parent // n
+        return np.rint(np.bincount(source * n + hop_target, weights=hops, minlength=n * n)).astype(np.int64) \
+            .reshape(n, n)
+
+    def assign(self, od):
+        """Loads of an OD matrix: (segment loads, interchange loads).
+
+        Segment loads have one row per track segment, with 'Outbound Trips' in the direction of increasing
+        'Distance from Start (km)' and 'Inbound Trips' against it. Interchange loads have one row per change of line
+        (or walkway) and direction.
+        """
+        loads = self.node_loads(od)
+        graph = self.graph
+        names, lines = graph._node_names, graph._node_lines
+        edges = graph.edges
+        track = edges[edges['kind'] == TRACK]
+        source, target = track['source'].to_numpy(), track['target'].to_numpy()
+        segments = pd.DataFrame({
+            'From': names[source],
+            'To': names[target],
+            'Line': lines[source],
+            'Length (km)': track['metres'].to_numpy() / 1000,
+            'Outbound Trips': loads[source, target],
+            'Inbound Trips': loads[target, source],
+        })
+        segments['Trips'] = segments['Outbound Trips'] + segments['Inbound Trips']
+
+        transfer = edges[edges['kind'] == TRANSFER]
+        first, second = transfer['source'].to_numpy(), transfer['target'].to_numpy()
+        source, target = np.concatenate([first, second]), np.concatenate([second, first])
+        interchanges = pd.DataFrame({
+            'Station': names[source],
+            'To Station': names[target],
+            'From Line': lines[source],
+            'To Line': lines[target],
+            'Trips': loads[source, target],
+        })
+        interchanges = interchanges.sort_values('Trips', ascending=False, kind='stable').reset_index(drop=True)
+        return segments, interchanges
+
+    def simulate(self, trips, seed=0):
+        """generate() then assign(): (OD matrix, segment loads, interchange loads)."""
+        od = self.generate(trips, seed)
+        return (od, *self.assign(od))
@@ -0,0 +1,280 @@
+# coding: utf-8
+
+# * Spatial index over station coordinates for batched nearest-k and radius queries.
+# * Latitude/longitude are projected onto the Earth's sphere in 3-D (km). Straight-line (chord) distance there orders
+#   points exactly as the great-circle distance does, so a uniform grid of cubic cells gives exact candidate bounds
+#   anywhere on the globe, with no projection error near the poles or across wide networks.
+# * Stations are bucketed by grid cell once, when the index is built. Queries are grouped by grid cell, and every
+#   cell looks only at the buckets of the cells around it: for a radius query, the cells the radius can reach; for
+#   nearest-k, a cube grown around the cell until it holds k stations, whose k-th smallest distance to the cell's
+#   farthest corner bounds how far the answers can be. The stations of those buckets that pass a box-to-point distance
+#   bound form the cell's candidate list; its queries are then resolved together against that short list, and the
+#   reported distances come from the haversine formula.
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_CELL_KM = 1.0
+# without an explicit cell size, cells grow until the occupied ones hold this many stations on average: large
+# enough that a query rarely searches empty cells, small enough to keep the candidate lists short
+STATIONS_PER_CELL = 1.5
+
+# query points resolved together; bounds the (queries x candidates) distance blocks
+QUERY_BATCH = 250_000
+# (cells x neighbouring or occupied cells) elements per bucket lookup
+_BOUND_BLOCK = 4_000_000
+# grid coordinates are packed into one int64 key, 21 bits per axis
+_AXIS_BITS = 21
+_AXIS_OFFSET = 1 << (_AXIS_BITS - 1)
+
+
+def _cell_keys(cells):
+    # grid coordinates packed into one int64 per cell
+    shifted = cells + _AXIS_OFFSET
+    return (shifted[..., 0] << (2 * _AXIS_BITS)) | (shifted[..., 1] << _AXIS_BITS) | shifted[..., 2]
+
+
+def haversine_km(latitude1, longitude1, latitude2, longitude2):
+    """Great-circle distance in km between points given in degrees; broadcasts like any NumPy expression."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(value, dtype=np.float64))
+                              for value in (latitude1, longitude1, latitude2, longitude2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def sphere_points(latitude, longitude):
+    """(n, 3) positions in km on the sphere of radius EARTH_RADIUS_KM."""
+    lat = np.radians(np.asarray(latitude, dtype=np.float64))
+    lon = np.radians(np.asarray(longitude, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return EARTH_RADIUS_KM * np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def grid_cell_km(points, stations_per_cell=STATIONS_PER_CELL):
+    """Cell edge (km), a power of two times DEFAULT_CELL_KM, at which the occupied cells hold about
+    `stations_per_cell` of the sphere_points `points` on average."""
+    smallest, largest = EARTH_RADIUS_KM / (_AXIS_OFFSET - 1), 4 * EARTH_RADIUS_KM
+    cell_km = DEFAULT_CELL_KM
+
+    def per_cell(size):
+        return len(points) / len(np.unique(_cell_keys(np.floor(points / size).astype(np.int64))))
+
+    while cell_km < largest and per_cell(cell_km) < stations_per_cell:
+        cell_km *= 2
+    while cell_km / 2 >= smallest and per_cell(cell_km / 2) >= stations_per_cell:
+        cell_km /= 2
+    return cell_km
+
+
+def chord_km(distance_km):
+    """Straight-line distance through the sphere between points `distance_km` apart along its surface."""
+    return 2 * EARTH_RADIUS_KM * np.sin(np.minimum(np.asarray(distance_km) / (2 * EARTH_RADIUS_KM), np.pi / 2))
+
+
+class StationIndex:
+    """Grid index over the rows of a station table with 'Latitude' and 'Longitude' columns.
+
+    The grid cells are `cell_km` wide, or sized to the station density by grid_cell_km when it is None.
+
+    Results refer to row positions in `stations`; `nearest_stations` and `stations_within` return them joined
+    with the station columns.
+    """
+
+    def __init__(self, stations, cell_km=None):
+        if cell_km is not None and not cell_km > 0:
+            raise ValueError("cell_km must be positive")
+        if cell_km is not None and EARTH_RADIUS_KM / cell_km >= _AXIS_OFFSET:
+            raise ValueError(f"cell_km must be at least {EARTH_RADIUS_KM / _AXIS_OFFSET:.4f}")
+        self.stations = stations.reset_index(drop=True)
+        if not len(self.stations):
+            raise ValueError("cannot index an empty station table")
+        self.latitude = self.stations['Latitude'].to_numpy(dtype=np.float64)
+        self.longitude = self.stations['Longitude'].to_numpy(dtype=np.float64)
+        if np.isnan(self.latitude).any() or np.isnan(self.longitude).any():
+            raise ValueError("station coordinates must not be missing")
+        self.points = sphere_points(self.latitude, self.longitude)
+        self.cell_km = grid_cell_km(self.points) if cell_km is None else cell_km
+        # buckets: the occupied cells by key, and the stations of each as a slice of _order
+        cells = np.floor(self.points / self.cell_km).astype(np.int64)
+        keys = _cell_keys(cells)
+        self._order = np.argsort(keys, kind='stable')
+        self._keys, first, counts = np.unique(keys[self._order], return_index=True, return_counts=True)
+        self._cells = cells[self._order[first]]
+        self._offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    def __len__(self):
+        return len(self.stations)
+
+    def _query_cells(self, points):
+        # unique cells of the query points and each query's cell number
+        cells = np.floor(points / self.cell_km).astype(np.int64)
+        _, first, inverse = np.unique(_cell_keys(cells), return_index=True, return_inverse=True)
+        return cells[first], inverse
+
+    def _gather(self, cells, reach):
+        """(cell, station) pairs of every station in the cube of `reach[i]` grid steps around cells[i]."""
+        cell_parts, bucket_parts = [], []
+        for steps in np.unique(reach):
+            group = np.flatnonzero(reach == steps)
+            offsets = np.arange(-steps, steps + 1)
+            if len(offsets) ** 3 <= len(self._keys):
+                # look every neighbouring cell up among the occupied ones
+                offsets = np.stack(np.meshgrid(offsets, offsets, offsets, indexing='ij'), axis=-1).reshape(-1, 3)
+                block = max(1, _BOUND_BLOCK // len(offsets))
+                for start in range(0, len(group), block):
+                    rows = group[start:start + block]
+                    neighbours = cells[rows, None, :] + offsets[None, :, :]
+                    inside = (np.abs(neighbours) < _AXIS_OFFSET).all(axis=2)
+                    keys = _cell_keys(np.where(inside[..., None], neighbours, 0))
+                    slots = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+                    row, column = np.nonzero(inside & (self._keys[slots] == keys))
+                    cell_parts.append(rows[row])
+                    bucket_parts.append(slots[row, column])
+            else:
+                # the cube has more cells than there are occupied ones: test each occupied cell instead
+                block = max(1, _BOUND_BLOCK // len(self._keys))
+                for start in range(0, len(group), block):
+                    rows = group[start:start + block]
+                    row, bucket = np.nonzero((np.abs(cells[rows, None, :] - self._cells[None, :, :]) <= steps)
+                                             .all(axis=2))
+                    cell_parts.append(rows[row])
+                    bucket_parts.append(bucket)
+        cell = np.concatenate(cell_parts) if cell_parts else np.zeros(0, dtype=np.int64)
+        bucket = np.concatenate(bucket_parts) if bucket_parts else np.zeros(0, dtype=np.int64)
+        # every bucket expands to its slice of _order
+        counts = self._offsets[bucket + 1] - self._offsets[bucket]
+        positions = np.repeat(self._offsets[bucket] - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+        return np.repeat(cell, counts), self._order[positions]
+
+    def _box_distances(self, cells, stations):
+        """Squared distances from each station to the nearest and to the farthest point of its paired cell."""
+        below = cells * self.cell_km - self.points[stations]
+        above = -self.cell_km - below
+        nearest = (np.maximum(np.maximum(below, above), 0) ** 2).sum(axis=1)
+        farthest = (np.maximum(np.abs(below), np.abs(above)) ** 2).sum(axis=1)
+        return nearest, farthest
+
+    def _candidates(self, cells, k=None, chord=None):
+        """CSR candidate lists (offsets, stations) per cell: all stations that can be a nearest-k or in-radius hit."""
+        if chord is None:
+            # grow a cube around each cell until it holds k stations: no station can be nearer than the k-th
+            # smallest of their distances to the cell's farthest corner
+            bound = np.empty(len(cells))
+            pending, steps = np.arange(len(cells)), 0
+            while len(pending):
+                cell, station = self._gather(cells[pending], np.full(len(pending), steps))
+                counts = np.bincount(cell, minlength=len(pending))
+                ready = counts >= k
+                if ready.any():
+                    keep = ready[cell]
+                    cell, station = cell[keep], station[keep]
+                    _, farthest = self._box_distances(cells[pending][cell], station)
+                    farthest = farthest[np.lexsort((farthest, cell))]
+                    starts = np.cumsum(counts[ready]) - counts[ready]
+                    bound[pending[ready]] = farthest[starts + k - 1]
+                pending, steps = pending[~ready], 2 * steps + 1
+        else:
+            bound = np.full(len(cells), chord ** 2)
+        # a station in a cell `steps` cells away along an axis is at least (steps - 1) cells away along it
+        reach = np.floor(np.sqrt(bound) / self.cell_km).astype(np.int64) + 1
+        cell, station = self._gather(cells, reach)
+        nearest, _ = self._box_distances(cells[cell], station)
+        keep = nearest <= bound[cell]
+        cell, station = cell[keep], station[keep]
+        counts = np.bincount(cell, minlength=len(cells))
+        return np.concatenate([[0], np.cumsum(counts)]), station[np.argsort(cell, kind='stable')]
+
+    def _batches(self, latitude, longitude, k=None, chord=None):
+        # yields (query positions, candidate stations, valid mask, squared chord distances) for queries with similar
+        # candidate counts, so one faraway query does not widen every block
+        points = sphere_points(latitude, longitude)
+        cells, inverse = self._query_cells(points)
+        offsets, stations = self._candidates(cells, k=k, chord=chord)
+        counts = np.diff(offsets)[inverse]
+        order = np.argsort(counts, kind='stable')
+        for start in range(0, len(order), QUERY_BATCH):
+            queries = order[start:start + QUERY_BATCH]
+            width = counts[queries].max(initial=0)
+            slots = np.arange(width)
+            valid = slots[None, :] < counts[queries, None]
+            positions = np.where(valid, offsets[inverse[queries], None] + slots[None, :], 0)
+            candidates = stations[positions] if len(stations) else np.zeros(positions.shape, dtype=np.int64)
+            distance = np.zeros(candidates.shape)
+            for axis in range(3):
+                distance += (points[queries, axis, None] - self.points[:, axis][candidates]) ** 2
+            distance[~valid] = np.inf
+            yield queries, candidates, valid, distance
+
+    def nearest(self, latitude, longitude, k=1):
+        """Row positions (n, k) of the k nearest stations to each query point, nearest first, and distances in km."""
+        if not 1 <= k <= len(self):
+            raise ValueError(f"k must be between 1 and the number of stations ({len(self)})")
+        latitude = np.atleast_1d(np.asarray(latitude, dtype=np.float64))
+        longitude = np.atleast_1d(np.asarray(longitude, dtype=np.float64))
+        result = np.empty((len(latitude), k), dtype=np.int64)
+        for queries, candidates, _, distance in self._batches(latitude, longitude, k=k):
+            if distance.shape[1] > k:
+                selected = np.argpartition(distance, k - 1, axis=1)[:, :k]
+            else:
+                selected = np.broadcast_to(np.arange(k), (len(queries), k))
+            ranked = np.take_along_axis(selected, np.argsort(np.take_along_axis(distance, selected, axis=1),
+                                                             axis=1, kind='stable'), axis=1)
+            result[queries] = np.take_along_axis(candidates, ranked, axis=1)
+        distance_km = haversine_km(latitude[:, None], longitude[:, None],
+                                   self.latitude[result], self.longitude[result])
+        return result, distance_km
+
+    def within(self, latitude, longitude, radius_km):
+        """(query, station, distance km) arrays for every station within `radius_km`, by query and then distance."""
+        latitude = np.atleast_1d(np.asarray(latitude, dtype=np.float64))
+        longitude = np.atleast_1d(np.asarray(longitude, dtype=np.float64))
+        # the chord bound is widened slightly so rounding can only add candidates; the haversine test decides
+        chord = chord_km(radius_km) * (1 + 1e-9) + 1e-9
+        query_parts, station_parts, distance_parts = [], [], []
+        for queries, candidates, valid, distance in self._batches(latitude, longitude, chord=chord):
+            rows, slots = np.nonzero(valid & (distance <= chord ** 2))
+            query, station = queries[rows], candidates[rows, slots]
+            distance_km = haversine_km(latitude[query], longitude[query], self.latitude[station],
+                                       self.longitude[station])
+            inside = distance_km <= radius_km
+            query_parts.append(query[inside])
+            station_parts.append(station[inside])
+            distance_parts.append(distance_km[inside])
+        query = np.concatenate(query_parts) if query_parts else np.zeros(0, dtype=np.int64)
+        station = np.concatenate(station_parts) if station_parts else np.zeros(0, dtype=np.int64)
+        distance_km = np.concatenate(distance_parts) if distance_parts else np.zeros(0)
+        order = np.lexsort((distance_km, query))
+        return query[order], station[order], distance_km[order]
+
+    def nearest_stations(self, latitude, longitude, k=1, columns=('Station ID', 'Station Name', 'Line')):
+        """Long-format nearest-k table: one row per (query, rank) with the station columns and 'Distance (km)'."""
+        stations, distance_km = self.nearest(latitude, longitude, k)
+        table = self.stations.loc[stations.ravel(), list(columns)].reset_index(drop=True)
+        table.insert(0, 'Query', np.repeat(np.arange(len(stations)), k))
+        table.insert(1, 'Rank', np.tile(np.arange(1, k + 1), len(stations)))
+        table['Distance (km)'] = distance_km.ravel()
+        return table
+
+    def stations_within(self, latitude, longitude, radius_km, columns=('Station ID', 'Station Name', 'Line')):
+        query, stations, distance_km = self.within(latitude, longitude, radius_km)
+        table = self.stations.loc[stations, list(columns)].reset_index(drop=True)
+        table.insert(0, 'Query', query)
+        table['Distance (km)'] = distance_km
+        return table
+
+
+def brute_force_nearest(index, latitude, longitude, k=1, block=20_000):
+    """Reference nearest-k by haversine to every station; (positions, distances) like StationIndex.nearest."""
+    latitude = np.atleast_1d(np.asarray(latitude, dtype=np.float64))
+    longitude = np.atleast_1d(np.asarray(longitude, dtype=np.float64))
+    positions = np.empty((len(latitude), k), dtype=np.int64)
+    distances = np.empty((len(latitude), k))
+    for start in range(0, len(latitude), block):
+        rows = slice(start, start + block)
+        distance = haversine_km(latitude[rows, None], longitude[rows, None], index.latitude, index.longitude)
+        selected = np.argpartition(distance, k - 1, axis=1)[:, :k] if k < len(index) else np.argsort(distance, axis=1)
+        selected = np.take_along_axis(selected, np.argsort(np.take_along_axis(distance, selected, axis=1), axis=1),
+                                      axis=1)
+        positions[rows] = selected
+        distances[rows] = np.take_along_axis(distance, selected, axis=1)
+    return positions, distances
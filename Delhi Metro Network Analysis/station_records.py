@@ -0,0 +1,292 @@
+# coding: utf-8
+
+# * Normalization and validation of metro station records (one row per station on a line, as in
+#   Delhi-Metro-Network.csv).
+# * Normalization gives every row its physical station (interchange markers and terminus notes removed, aliases
+#   applied) and its canonical line name, and builds three tables:
+#     - `stops`, the rows sorted by line and distance;
+#     - `stations`, one row per physical station;
+#     - `interchanges`, every pair of stops where passengers change lines, inside a station or over a walkway.
+# * Validation runs vectorized checks over whole columns: missing values, duplicate IDs, coordinates out of range or
+#   with latitude copied into longitude, distances that do not increase strictly along a line, consecutive stops
+#   farther apart than their track, rows of one station far apart, and interchange markers naming a line the
+#   station does not serve. Each finding is one row of the `issues` table.
+# * `normalized()` keeps the result per distinct input frame, so the graph and map code share one normalization.
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from spatial_index import haversine_km
+
+REQUIRED_COLUMNS = ['Station ID', 'Station Name', 'Distance from Start (km)', 'Line', 'Opening Date', 'Latitude',
+                    'Longitude']
+
+# interchange markers and terminus notes carried in 'Station Name', e.g. "Welcome [Conn: Red]", "Inderlok Conn:Red",
+# "Dwarka Sector 21(First station)", "Rithala(last station)"
+_NAME_NOISE = r'\s*\[Conn:[^\]]*\]|\s+Conn:\s*\w+$|\s*\((?:first|last) station\)'
+_MARKER = r'\[Conn:\s*([^\]]*)\]|Conn:\s*(\w+)$'
+
+# rows of one station complex whose names differ between lines
+STATION_ALIASES = {
+    'New Delhi-Airport Express': 'New Delhi',
+}
+
+LINE_ALIASES = {
+    'Voilet line': 'Violet line',
+}
+
+# separate stations connected by a walkway, counted as an interchange like any other transfer
+WALKWAY_TRANSFERS = [
+    ('Noida Sector 51', 'Noida Sector 52'),
+    ('Dhaula Kuan', 'Durgabai Deshmukh South Campus'),
+]
+
+# consecutive stops may be at most this much farther apart in a straight line than along their track
+DETOUR_SLACK_KM = 0.5
+# rows of one station farther than this from the station's median position
+STATION_SPREAD_KM = 1.0
+
+ERROR = 'error'
+WARNING = 'warning'
+INFO = 'info'
+
+ISSUE_COLUMNS = ['Check', 'Severity', 'Station ID', 'Station', 'Line', 'Detail']
+
+# normalized records of the most recent distinct frames, by content digest
+CACHE_SIZE = 8
+_cache = {}
+
+
+def station_names(names):
+    """Physical station name for each row: interchange markers and terminus notes removed, aliases applied."""
+    names = pd.Series(names).str.replace(_NAME_NOISE, '', regex=True, case=False).str.strip()
+    return names.replace(STATION_ALIASES)
+
+
+def line_names(lines):
+    return pd.Series(lines).replace(LINE_ALIASES)
+
+
+def _issues(check, severity, rows, detail):
+    # issue rows for the stops in `rows` (a frame of stops) with one detail string each
+    return pd.DataFrame({
+        'Check': check,
+        'Severity': severity,
+        'Station ID': rows['Station ID'].to_numpy(),
+        'Station': rows['Station'].to_numpy(),
+        'Line': rows['Line'].to_numpy(),
+        'Detail': np.asarray(detail, dtype=object) if not isinstance(detail, str) else detail,
+    }, columns=ISSUE_COLUMNS)
+
+
+class StationRecords:
+    """Normalized `stops`, `stations` and `interchanges` tables of a station frame, and the `issues` found in it.
+
+    The tables are shared through `normalized()` and should be treated as read-only.
+    """
+
+    def __init__(self, metro_data):
+        missing = [column for column in REQUIRED_COLUMNS if column not in metro_data.columns]
+        if missing:
+            raise KeyError(f"missing columns: {', '.join(missing)}")
+        stops = metro_data.copy()
+        stops['Station'] = station_names(stops['Station Name']).to_numpy()
+        stops['Line'] = line_names(stops['Line']).to_numpy()
+        stops['Opening Date'] = pd.to_datetime(stops['Opening Date'], errors='coerce')
+        self.stops = stops.sort_values(['Line', 'Distance from Start (km)'], kind='stable').reset_index(drop=True)
+        self.stations = self._stations()
+        self.interchanges = self._interchanges()
+        self.issues = self._validate(metro_data)
+
+    def _stations(self):
+        stops = self.stops
+        grouped = stops.groupby('Station', sort=False)
+        stations = grouped.agg(**{
+            'Stops': ('Line', 'size'),
+            'Latitude': ('Latitude', 'median'),
+            'Longitude': ('Longitude', 'median'),
+            'Opening Date': ('Opening Date', 'min'),
+        })
+        # only stations on several lines need their line names joined
+        served = stops[['Station', 'Line']].drop_duplicates()
+        lines = served.drop_duplicates('Station').set_index('Station')['Line']
+        shared = served[served['Station'].duplicated(keep=False)].sort_values('Line')
+        lines.update(shared.groupby('Station')['Line'].agg(' / '.join))
+        stations.insert(0, 'Lines', lines.reindex(stations.index))
+        if 'Station Layout' in stops.columns:
+            stations['Station Layout'] = grouped['Station Layout'].first()
+        return stations.reset_index()
+
+    def walkways(self):
+        """(station, station) pairs of WALKWAY_TRANSFERS present in the records."""
+        names = pd.Index([name for pair in WALKWAY_TRANSFERS for name in pair])
+        present = set(names[names.isin(self.stations['Station'])])
+        return [(a, b) for a, b in WALKWAY_TRANSFERS if a in present and b in present]
+
+    def _interchanges(self):
+        stops = self.stops[['Station', 'Line', 'Station ID']]
+        # stops of the same station pair with each other; a walkway pairs the stops of its two stations
+        links = [stops.assign(Link=stops['Station'], Kind='Interchange')]
+        for a, b in self.walkways():
+            links.append(stops[stops['Station'].isin([a, b])].assign(Link=a + ' / ' + b, Kind='Walkway'))
+        links = pd.concat(links, ignore_index=True)
+        pairs = links.merge(links, on=['Link', 'Kind'], suffixes=(' From', ' To'))
+        keep = pairs['Station ID From'] < pairs['Station ID To']
+        keep &= (pairs['Kind'] == 'Interchange') | (pairs['Station From'] != pairs['Station To'])
+        pairs = pairs[keep]
+        return pd.DataFrame({
+            'From Station': pairs['Station From'].to_numpy(),
+            'From Line': pairs['Line From'].to_numpy(),
+            'From Station ID': pairs['Station ID From'].to_numpy(),
+            'To Station': pairs['Station To'].to_numpy(),
+            'To Line': pairs['Line To'].to_numpy(),
+            'To Station ID': pairs['Station ID To'].to_numpy(),
+            'Kind': pairs['Kind'].to_numpy(),
+        })
+
+    def _validate(self, metro_data):
+        stops = self.stops
+        issues = []
+
+        incomplete = stops[REQUIRED_COLUMNS].isna()
+        rows = incomplete.any(axis=1).to_numpy()
+        if rows.any():
+            columns = np.array(REQUIRED_COLUMNS, dtype=object)
+            detail = [', '.join(columns[row]) for row in incomplete.to_numpy()[rows]]
+            issues.append(_issues('missing values', ERROR, stops[rows], detail))
+
+        duplicated = stops['Station ID'].duplicated(keep=False).to_numpy()
+        if duplicated.any():
+            issues.append(_issues('duplicate station ID', ERROR, stops[duplicated], 'Station ID is not unique'))
+
+        latitude, longitude = stops['Latitude'].to_numpy(), stops['Longitude'].to_numpy()
+        outside = (np.abs(latitude) > 90) | (np.abs(longitude) > 180)
+        if outside.any():
+            issues.append(_issues('coordinates out of range', ERROR, stops[outside],
+                                  [f'({lat}, {lon})' for lat, lon in zip(latitude[outside], longitude[outside])]))
+        copied = latitude == longitude
+        if copied.any():
+            issues.append(_issues('latitude copied into longitude', ERROR, stops[copied],
+                                  [f'both are {lat}' for lat in latitude[copied]]))
+
+        # along a line (stops are sorted by line, then distance)
+        line = stops['Line'].to_numpy()
+        distance = stops['Distance from Start (km)'].to_numpy()
+        same_line = line[1:] == line[:-1]
+        repeated = np.flatnonzero(same_line & (distance[1:] == distance[:-1])) + 1
+        if len(repeated):
+            issues.append(_issues('distance not increasing', ERROR, stops.iloc[repeated],
+                                  [f'{d} km repeats the previous stop' for d in distance[repeated]]))
+        first = np.flatnonzero(np.concatenate([[True], ~same_line]))
+        late_start = first[distance[first] != 0]
+        if len(late_start):
+            issues.append(_issues('line does not start at 0 km', WARNING, stops.iloc[late_start],
+                                  [f'first stop at {d} km' for d in distance[late_start]]))
+
+        # consecutive stops cannot be farther apart than the track between them; a stop whose hops to both of its
+        # neighbours are too long has bad coordinates, otherwise the pair's distances disagree with their positions
+        hop = np.flatnonzero(same_line)
+        straight_km = haversine_km(latitude[hop], longitude[hop], latitude[hop + 1], longitude[hop + 1])
+        track_km = distance[hop + 1] - distance[hop]
+        too_long = straight_km > track_km + DETOUR_SLACK_KM
+        bad_hops = np.zeros(len(stops) + 1, dtype=np.int64)
+        hop_count = np.zeros(len(stops) + 1, dtype=np.int64)
+        np.add.at(hop_count, np.concatenate([hop, hop + 1]), 1)
+        np.add.at(bad_hops, np.concatenate([hop[too_long], hop[too_long] + 1]), 1)
+        suspect = (bad_hops == hop_count) & (hop_count > 0)
+        if suspect.any():
+            positions = np.flatnonzero(suspect[:-1])
+            issues.append(_issues('suspect coordinates', WARNING, stops.iloc[positions],
+                                  [f'({latitude[p]}, {longitude[p]}) is too far from its neighbours on the line'
+                                   for p in positions]))
+        mismatched = too_long & ~suspect[hop] & ~suspect[hop + 1]
+        if mismatched.any():
+            issues.append(_issues('track shorter than straight line', WARNING, stops.iloc[hop[mismatched] + 1],
+                                  [f'{s:.1f} km from the previous stop over {t:.1f} km of track'
+                                   for s, t in zip(straight_km[mismatched], track_km[mismatched])]))
+
+        # rows of one station should be in one place
+        centre = self.stations.set_index('Station').loc[stops['Station'], ['Latitude', 'Longitude']].to_numpy()
+        spread_km = haversine_km(latitude, longitude, centre[:, 0], centre[:, 1])
+        spread = spread_km > STATION_SPREAD_KM
+        if spread.any():
+            issues.append(_issues('station rows far apart', WARNING, stops[spread],
+                                  [f'{km:.1f} km from the station\'s other rows' for km in spread_km[spread]]))
+
+        issues.append(self._marker_issues())
+
+        renamed = metro_data['Line'][metro_data['Line'].isin(list(LINE_ALIASES))].value_counts()
+        if len(renamed):
+            issues.append(pd.DataFrame({
+                'Check': 'line renamed', 'Severity': INFO, 'Station ID': pd.NA, 'Station': pd.NA,
+                'Line': renamed.index.map(LINE_ALIASES).to_numpy(),
+                'Detail': [f'{line!r} in {count} rows' for line, count in renamed.items()],
+            }, columns=ISSUE_COLUMNS))
+        return pd.concat(issues, ignore_index=True) if issues else pd.DataFrame(columns=ISSUE_COLUMNS)
+
+    def _marker_issues(self):
+        # "[Conn: Red]"-style markers name the lines reachable from a stop; every one should be served at the station
+        # or at the other end of one of its walkways
+        stops = self.stops
+        markers = stops['Station Name'].str.extract(_MARKER)
+        tokens = markers[0].fillna(markers[1]).str.split(',').explode().str.strip().dropna()
+        tokens = tokens[tokens != '']
+        if not len(tokens):
+            return pd.DataFrame(columns=ISSUE_COLUMNS)
+        # a token names every line whose leading words it matches: 'Blue' names 'Blue line' and 'Blue line branch'
+        prefixes = {}
+        for line in stops['Line'].unique():
+            words = line.split(' ')
+            for end in range(1, len(words) + 1):
+                prefixes.setdefault(' '.join(words[:end]), []).append(line)
+        candidates = {token: prefixes.get(LINE_ALIASES.get(token, token), []) for token in tokens.unique()}
+        marked = stops.loc[tokens.index, ['Station ID', 'Station']].assign(Token=tokens.to_numpy())
+        marked['Marker'] = np.arange(len(marked))
+        options = marked.assign(Line=marked['Token'].map(candidates)).explode('Line')
+
+        served = stops[['Station', 'Line']]
+        for a, b in self.walkways():
+            served = pd.concat([served, stops.loc[stops['Station'] == b, ['Line']].assign(Station=a),
+                                stops.loc[stops['Station'] == a, ['Line']].assign(Station=b)])
+        served = pd.MultiIndex.from_frame(served[['Station', 'Line']])
+        options['Found'] = pd.MultiIndex.from_frame(options[['Station', 'Line']].fillna('')).isin(served)
+        found = options.groupby('Marker')['Found'].any().to_numpy()
+        unresolved = marked[~found].join(stops['Line'])
+        return _issues('interchange marker not served', WARNING, unresolved,
+                       [f'marker {token!r} ' + (f'but no {token} line calls here' if candidates[token]
+                                                else 'names no known line')
+                        for token in unresolved['Token']])
+
+    @property
+    def valid(self):
+        """No issue of 'error' severity."""
+        return not (self.issues['Severity'] == ERROR).any()
+
+    def report(self):
+        """Number of issues by check and severity, errors first."""
+        order = {ERROR: 0, WARNING: 1, INFO: 2}
+        counts = self.issues.groupby(['Severity', 'Check'], sort=False).size().rename('Issues').reset_index()
+        return counts.sort_values(['Severity', 'Issues'], key=lambda column: column.map(order)
+                                  if column.name == 'Severity' else -column).reset_index(drop=True)
+
+
+def frame_digest(frame):
+    """Content hash of a frame: its columns, dtypes and values."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr([(column, str(dtype)) for column, dtype in frame.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def normalized(metro_data):
+    """StationRecords of `metro_data`, reused for any frame with the same content."""
+    key = frame_digest(metro_data)
+    records = _cache.pop(key, None)
+    if records is None:
+        records = StationRecords(metro_data)
+    _cache[key] = records
+    while len(_cache) > CACHE_SIZE:
+        _cache.pop(next(iter(_cache)))
+    return records
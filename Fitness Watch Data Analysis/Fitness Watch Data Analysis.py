@@ -8,11 +8,18 @@
 # In[2]:
 
 
+import os
+import sys
+
 import pandas as pd
-import plotly.io as pio
-import plotly.graph_objects as go
-pio.templates.default = "plotly_white"
-import plotly.express as px
+
+# plotly is imported on first use and the figures are skipped when ANALYSIS_HEADLESS=1; the tables are recorded
+# with output.result (and pickled to ANALYSIS_RESULTS when it is set)
+sys.path.append(os.path.abspath(os.pardir))
+from script_output import ScriptOutput
+
+output = ScriptOutput("fitness watch", plotly_template="plotly_white")
+px = output.module('plotly.express')
 
 data = pd.read_csv("Apple Fitness Data")
 data.head()
@@ -21,60 +28,66 @@ data.head()
 # In[3]:
 
 
-print(data.isnull().sum())
+print(output.result('missing values', data.isnull().sum()))
 
 
 # In[4]:
 
 
 # Step Count Over Time
-fig1 = px.line(data, x="Time",
-               y="Step Count",
-               title="Step Count Over Time")
-fig1.show()
+if output.plots:
+    fig1 = px.line(data, x="Time",
+                   y="Step Count",
+                   title="Step Count Over Time")
+    fig1.show()
 
 
 # In[5]:
 
 
 # Distance Covered Over Time
-fig2 = px.line(data, x="Time",
-               y="Distance",
-               title="Distance Covered Over Time")
-fig2.show()
+if output.plots:
+    fig2 = px.line(data, x="Time",
+                   y="Distance",
+                   title="Distance Covered Over Time")
+    fig2.show()
 
 
 # In[6]:
 
 
 # Energy Burned Over Time
-fig3 = px.line(data, x="Time",
-               y="Energy Burned",
-               title="Energy Burned Over Time")
-fig3.show()
+if output.plots:
+    fig3 = px.line(data, x="Time",
+                   y="Energy Burned",
+                   title="Energy Burned Over Time")
+    fig3.show()
 
 
 # In[7]:
 
 
 # Walking Speed Over Time
-fig4 = px.line(data, x="Time",
-               y="Walking Speed",
-               title="Walking Speed Over Time")
-fig4.show()
+if output.plots:
+    fig4 = px.line(data, x="Time",
+                   y="Walking Speed",
+                   title="Walking Speed Over Time")
+    fig4.show()
 
 
 # In[8]:
 
 
 # Calculate Average Step Count per Day
-average_step_count_per_day = data.groupby("Date")["Step Count"].mean().reset_index()
+average_step_count_per_day = output.result('average step count per day',
+                                           data.groupby("Date")["Step Count"].mean().reset_index())
 
-fig5 = px.bar(average_step_count_per_day, x="Date",
-              y="Step Count",
-              title="Average Step Count per Day")
-fig5.update_xaxes(type='category')
-fig5.show()
+if output.plots:
+    fig5 = px.bar(average_step_count_per_day, x="Date",
+                  y="Step Count",
+                  title="Average Step Count per Day")
+    fig5.update_xaxes(type='category')
+    fig5.show()
 
 
 # In[9]:
@@ -82,11 +95,13 @@ fig5.show()
 
 # Calculate Walking Efficiency
 data["Walking Efficiency"] = data["Distance"] / data["Step Count"]
+output.result('walking efficiency', data[["Date", "Time", "Walking Efficiency"]])
 
-fig6 = px.line(data, x="Time",
-               y="Walking Efficiency",
-               title="Walking Efficiency Over Time")
-fig6.show()
+if output.plots:
+    fig6 = px.line(data, x="Time",
+                   y="Walking Efficiency",
+                   title="Walking Efficiency Over Time")
+    fig6.show()
 
 
 # In[11]:
@@ -99,21 +114,23 @@ time_intervals = pd.cut(pd.to_datetime(data["Time"]).dt.hour,
                         right=False)
 
 data["Time Interval"] = time_intervals
+output.result('time intervals', data.groupby("Time Interval", observed=False)[["Step Count", "Walking Speed"]].mean())
 
-# Variations in Step Count and Walking Speed by Time Interval
-fig7 = px.scatter(data, x="Step Count",
-                  y="Walking Speed",
-                  color="Time Interval",
-                  title="Step Count and Walking Speed Variations by Time Interval",
-                  trendline='ols')
-fig7.show()
+if output.plots:
+    # Variations in Step Count and Walking Speed by Time Interval
+    fig7 = px.scatter(data, x="Step Count",
+                      y="Walking Speed",
+                      color="Time Interval",
+                      title="Step Count and Walking Speed Variations by Time Interval",
+                      trendline='ols')
+    fig7.show()
 
 
 # In[13]:
 
 
-# Reshape data for treemap
-daily_avg_metrics = data.groupby("Date").mean().reset_index()
+# Reshape data for treemap; only the numeric columns have a daily mean (the time of day is text)
+daily_avg_metrics = output.result('daily averages', data.groupby("Date").mean(numeric_only=True).reset_index())
 
 daily_avg_metrics_melted = daily_avg_metrics.melt(id_vars=["Date"], 
                                                   value_vars=["Step Count", "Distance", 
@@ -121,14 +138,15 @@ daily_avg_metrics_melted = daily_avg_metrics.melt(id_vars=["Date"],
                                                               "Walking Double Support Percentage", 
                                                               "Walking Speed"])
 
-# Treemap of Daily Averages for Different Metrics Over Several Weeks
-fig = px.treemap(daily_avg_metrics_melted,
-                 path=["variable"],
-                 values="value",
-                 color="variable",
-                 hover_data=["value"],
-                 title="Daily Averages for Different Metrics")
-fig.show()
+if output.plots:
+    # Treemap of Daily Averages for Different Metrics Over Several Weeks
+    fig = px.treemap(daily_avg_metrics_melted,
+                     path=["variable"],
+                     values="value",
+                     color="variable",
+                     hover_data=["value"],
+                     title="Daily Averages for Different Metrics")
+    fig.show()
 
 
 # In[17]:
@@ -141,13 +159,21 @@ metrics_to_visualize = ["Distance", "Energy Burned", "Flights Climbed",
 # Reshape data for treemap
 daily_avg_metrics_melted = daily_avg_metrics.melt(id_vars=["Date"], value_vars=metrics_to_visualize)
 
-fig = px.treemap(daily_avg_metrics_melted,
-                 path=["variable"],
-                 values="value",
-                 color="variable",
-                 hover_data=["value"],
-                 title="Daily Averages for Different Metrics (Excluding Step Count)")
-fig.show()
+if output.plots:
+    fig = px.treemap(daily_avg_metrics_melted,
+                     path=["variable"],
+                     values="value",
+                     color="variable",
+                     hover_data=["value"],
+                     title="Daily Averages for Different Metrics (Excluding Step Count)")
+    fig.show()
+
+
+# In[18]:
+
+
+# tables recorded above (pickled only when ANALYSIS_RESULTS is set)
+output.finish()
 
 
 # # Summary
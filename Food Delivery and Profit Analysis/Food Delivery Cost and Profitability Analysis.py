@@ -25,81 +25,83 @@
 # In[3]:
 
 
-import pandas as pd
-
-food_orders = pd.read_csv("food_orders_new_delhi")
-food_orders.head()
-
-
-# In[6]:
-
-
-print(food_orders.info())
-
+import os
+import sys
 
-# In[5]:
+import pandas as pd
+from discounts import LEGACY
+from order_cache import load_orders
 
+# stage timings (wall/CPU time, peak memory, rows) are recorded when ANALYSIS_PROFILE=1 and reported at the end
+sys.path.append(os.path.abspath(os.pardir))
+from stage_profiler import StageProfiler
 
-food_orders.isnull().sum()
+profiler = StageProfiler("food delivery")
 
+# matplotlib is imported on first use and the plots are skipped when ANALYSIS_HEADLESS=1; the tables are recorded
+# with output.result (and pickled to ANALYSIS_RESULTS when it is set)
+from script_output import ScriptOutput
 
-# In[33]:
+output = ScriptOutput("food delivery")
+plt = output.module('matplotlib.pyplot')
 
+# 'legacy' keeps the original rule (any value > 1 is a percentage of the order value, including "50 off");
+# use TYPED from discounts to charge fixed-amount offers as a flat INR discount
+discount_mode = LEGACY
 
-food_orders['Discounts and Offers'].unique()
+# the first run parses the CSV and caches the typed frame with its derived columns in .order_cache;
+# later runs load that cache directly until the CSV (or the derivation code) changes
+with profiler.stage('load orders') as stage:
+    food_orders = load_orders("food_orders_new_delhi", mode=discount_mode, profiler=profiler)
+    stage.rows = len(food_orders)
+food_orders.head()
 
 
-# * So there are no empty values in the dataset.
+# In[4]:
 
-# In[7]:
 
+# compact dtypes: the IDs and text columns become categoricals (the values are still the IDs, stored as small codes)
+# and integer money columns the narrowest type with room for their sums; everything below runs unchanged on it
+from compact import compact_orders, memory_report
 
-from datetime import datetime
+with profiler.stage('compact dtypes'):
+    compact_food_orders, id_dictionaries = compact_orders(food_orders)
+print(memory_report(food_orders, compact_food_orders))
+food_orders = compact_food_orders
 
-# convert date and time columns to datetime
-food_orders['Order Date and Time'] = pd.to_datetime(food_orders['Order Date and Time'])
-food_orders['Delivery Date and Time'] = pd.to_datetime(food_orders['Delivery Date and Time'])
 
+# In[6]:
 
-# In[9]:
 
+print(food_orders.info())
 
-# first, let's create a function to extract numeric values from the 'Discounts and Offers' string
-def extract_discount(discount_str):
-    if 'off' in discount_str:
-        # Fixed amount off
-        return float(discount_str.split(' ')[0])
-    elif '%' in discount_str:
-        # Percentage off
-        return float(discount_str.split('%')[0])
-    else:
-        # No discount
-        return 0.0
 
+# In[5]:
 
-# In[10]:
 
+food_orders.isnull().sum()
 
-# apply the function to create a new 'Discount Value' column
-food_orders['Discount Percentage'] = food_orders['Discounts and Offers'].apply(lambda x: extract_discount(x))
 
+# In[33]:
 
-# In[13]:
 
+food_orders['Discounts and Offers'].unique()
 
-food_orders.head(2)
 
+# * So there are no empty values in the dataset.
 
-# In[23]:
+# In[7]:
 
 
-# for percentage discounts, calculate the discount amount based on the order value
-food_orders['Discount Amount'] = food_orders.apply(lambda x: (x['Order Value'] * x['Discount Percentage'] / 100)
-                                                  if x['Discount Percentage'] > 1
-                                                  else x['Discount Percentage'], axis=1)
+# load_orders has already converted the date and time columns to datetime, made 'Payment Method' and
+# 'Discounts and Offers' categorical and derived the discount and cost columns; the uncached equivalent is
+# order_cache.parse_orders, which calls discounts.add_cost_columns:
+# * 'Discounts and Offers' is split into 'Discount Percentage' and 'Discount Fixed Amount' by parsing each
+#   distinct offer once, and 'Discount Amount', 'Total Costs', 'Revenue' and 'Profit' are column arithmetic
+food_orders.dtypes
 
 
-# In[24]:
+# In[13]:
 
 
 food_orders.head(2)
@@ -108,7 +110,7 @@ food_orders.head(2)
 # In[32]:
 
 
-food_orders[['Order Value', 'Discounts and Offers', 'Discount Percentage', 'Discount Amount']].head(), food_orders.dtypes
+food_orders[['Order Value', 'Discounts and Offers', 'Discount Percentage', 'Discount Fixed Amount', 'Discount Amount']].head(), food_orders.dtypes
 
 
 # The data is now ready with the following adjustments:
@@ -116,32 +118,39 @@ food_orders[['Order Value', 'Discounts and Offers', 'Discount Percentage', 'Disc
 # * Order Date and Time and Delivery Date and Time columns have been converted to datetime format.
 # * A new column, Discount Amount, has been calculated based on the Discounts and Offers column. 
 # * This was achieved by extracting percentage discounts or fixed amounts and applying them to the order value.
-# * Discount Percentage has been added to represent the discount rate or fixed amount discount directly.
+# * Discount Percentage and Discount Fixed Amount have been added to represent the discount rate or fixed amount discount directly.
 
 # # Cost and Profitability Analysis
 
 # In[34]:
 
 
-# calculate total costs and revenue per order
-food_orders['Total Costs'] = food_orders['Delivery Fee'] + food_orders['Payment Processing Fee'] + food_orders['Discount Amount']
-food_orders['Revenue'] = food_orders['Commission Fee']
-food_orders['Profit'] = food_orders['Revenue'] - food_orders['Total Costs']
+# total costs, revenue and profit per order were derived by add_cost_columns when the orders were loaded
 
-# aggregate data to get overall metrics
-total_orders = food_orders.shape[0]
-total_revenue = food_orders['Revenue'].sum()
-total_costs = food_orders['Total Costs'].sum()
-total_profit = food_orders['Profit'].sum()
+# aggregate data to get overall metrics; the accumulator sums exactly, so the same totals come out of streaming mode
+from streaming import ProfitAccumulator, stream_orders
 
-overall_metrics = {
-    "Total Orders": total_orders,
-    "Total Revenue": total_revenue,
-    "Total Costs": total_costs,
-    "Total Profit": total_profit
-}
+with profiler.stage('overall metrics'):
+    profit_accumulator = ProfitAccumulator().update(food_orders)
+    overall_metrics = profit_accumulator.overall_metrics()
 
-print(overall_metrics)
+total_orders = overall_metrics["Total Orders"]
+total_revenue = overall_metrics["Total Revenue"]
+total_costs = overall_metrics["Total Costs"]
+total_profit = overall_metrics["Total Profit"]
+
+print(output.result('overall metrics', overall_metrics))
+
+
+# In[35]:
+
+
+# streaming mode for order exports that do not fit in memory: the file is read in fixed-size chunks
+# and folded into the same accumulator, so memory stays bounded by the chunk size
+with profiler.stage('streaming metrics') as stage:
+    streamed_accumulator = stream_orders("food_orders_new_delhi", chunksize=250, mode=discount_mode)
+    stage.rows = streamed_accumulator.orders
+print(streamed_accumulator.overall_metrics() == overall_metrics)
 
 
 # # Based on the analysis, here are the overall metrics for the food delivery operations:
@@ -156,27 +165,32 @@ print(overall_metrics)
 # In[37]:
 
 
-import matplotlib.pyplot as plt
+# histogram of profits per order, drawn from the accumulator's histogram sketch so it also works in streaming mode
+profit_counts, profit_bins = profit_accumulator.profit_histogram.rebin(50)
+output.result('profit histogram', (profit_counts, profit_bins))
 
-# histogram of profits per order
-plt.figure(figsize=(10, 6))
-plt.hist(food_orders['Profit'], bins=50, color='skyblue', edgecolor='black')
-plt.title('Profit Distribution per Order in Food Delivery')
-plt.xlabel('Profit')
-plt.ylabel('Number of Orders')
-plt.axvline(food_orders['Profit'].mean(), color='red', linestyle='dashed', linewidth=1)
-plt.show()
+if output.plots:
+    with profiler.stage('plot: profit histogram'):
+        plt.figure(figsize=(10, 6))
+        plt.hist(profit_bins[:-1], bins=profit_bins, weights=profit_counts, color='skyblue', edgecolor='black')
+        plt.title('Profit Distribution per Order in Food Delivery')
+        plt.xlabel('Profit')
+        plt.ylabel('Number of Orders')
+        plt.axvline(profit_accumulator.mean_profit(), color='red', linestyle='dashed', linewidth=1)
+        plt.show()
 
 
 # In[38]:
 
 
 # pie chart for the proportion of total costs
-costs_breakdown = food_orders[['Delivery Fee', 'Payment Processing Fee', 'Discount Amount']].sum()
-plt.figure(figsize=(7, 7))
-plt.pie(costs_breakdown, labels=costs_breakdown.index, autopct='%1.1f%%', startangle=140, colors=['tomato', 'gold', 'lightblue'])
-plt.title('Proportion of Total Costs in Food Delivery')
-plt.show()
+costs_breakdown = output.result('costs breakdown', profit_accumulator.costs_breakdown())
+if output.plots:
+    with profiler.stage('plot: cost breakdown'):
+        plt.figure(figsize=(7, 7))
+        plt.pie(costs_breakdown, labels=costs_breakdown.index, autopct='%1.1f%%', startangle=140, colors=['tomato', 'gold', 'lightblue'])
+        plt.title('Proportion of Total Costs in Food Delivery')
+        plt.show()
 
 
 # In[39]:
@@ -186,11 +200,84 @@ plt.show()
 totals = ['Total Revenue', 'Total Costs', 'Total Profit']
 values = [total_revenue, total_costs, total_profit]
 
-plt.figure(figsize=(8, 6))
-plt.bar(totals, values, color=['green', 'red', 'blue'])
-plt.title('Total Revenue, Costs, and Profit')
-plt.ylabel('Amount (INR)')
-plt.show()
+if output.plots:
+    with profiler.stage('plot: totals'):
+        plt.figure(figsize=(8, 6))
+        plt.bar(totals, values, color=['green', 'red', 'blue'])
+        plt.title('Total Revenue, Costs, and Profit')
+        plt.ylabel('Amount (INR)')
+        plt.show()
+
+
+# # Delivery Time Analysis
+
+# In[39]:
+
+
+# delivery durations in whole minutes, summarised per hour of order, restaurant and payment method;
+# the per-group minute histograms merge across chunks and days (see delivery_times.stream_delivery_times)
+from delivery_times import DeliveryTimeStats
+
+with profiler.stage('delivery times'):
+    delivery_stats = DeliveryTimeStats().update(food_orders)
+output.result('delivery times by payment method', delivery_stats.table('Payment Method'))
+
+
+# In[40]:
+
+
+output.result('delivery times by hour', delivery_stats.table('Order Hour'))
+
+
+# In[41]:
+
+
+if output.plots:
+    with profiler.stage('plot: delivery times'):
+        delivery_stats.plot_distribution()
+        delivery_stats.plot_by_hour()
+
+
+# # Profitability by Restaurant, Customer, Payment Method and Hour
+
+# In[42]:
+
+
+# materialise the additive measures per (Restaurant ID, Customer ID, Payment Method, Order Hour) cell once;
+# roll-ups are then answered from the cube, and cube.refresh(new_orders) only merges orders with a higher 'Order ID'
+from cube import ProfitCube
+
+with profiler.stage('profit cube'):
+    profit_cube = ProfitCube.build(food_orders, mode=discount_mode)
+    profit_cube.save("food_orders_cube.npz")
+
+output.result('profit by payment method',
+              profit_cube.query(by='Payment Method', measures=['Orders', 'Revenue', 'Total Costs', 'Profit']))
+
+
+# In[43]:
+
+
+# profit by hour of the day for a single payment method
+output.result('cash on delivery profit by hour',
+              profit_cube.query(by='Order Hour', where={'Payment Method': 'Cash on Delivery'},
+                                measures=['Orders', 'Profit']))
+
+
+# # Order Anomalies
+
+# In[44]:
+
+
+# robust z-scores of profit, discount share and refund amount against each restaurant's median and MAD;
+# orders scoring above 3.5 on any of them are flagged (anomalies.score_orders_csv does the same over a chunked file)
+from anomalies import score_orders
+
+with profiler.stage('anomaly scoring'):
+    anomaly_report = score_orders(food_orders, mode=discount_mode)
+print(len(anomaly_report.flagged_order_ids), "flagged orders")
+output.result('flagged orders', anomaly_report.flagged)
+anomaly_report.flagged.head(10)
 
 
 # # A New Strategy for Profits
@@ -220,7 +307,7 @@ profitable_orders['Effective Discount Percentage'] = (profitable_orders['Discoun
 new_avg_commission_percentage = profitable_orders['Commission Percentage'].mean()
 new_avg_discount_percentage = profitable_orders['Effective Discount Percentage'].mean()
 
-print(new_avg_commission_percentage, new_avg_discount_percentage)
+print(*output.result('profitable order averages', (new_avg_commission_percentage, new_avg_discount_percentage)))
 
 
 # In[62]:
@@ -251,31 +338,65 @@ food_orders['Simulated Profit'] = (food_orders['Simulated Commission Fee'] -
                                    food_orders['Simulated Total Costs'])
 
 
+# In[66]:
+
+
+# sweep a whole grid of commission and discount rates under each delivery-fee policy in one broadcast pass;
+# the (30%, 6%, 'actual') row reproduces the 'Simulated Profit' column above
+import numpy as np
+from scenarios import simulate_grid
+
+with profiler.stage('scenario grid'):
+    scenario_results = simulate_grid(food_orders,
+                                     commission_percentages=np.arange(20.0, 40.5, 2.5),
+                                     discount_percentages=np.arange(0.0, 10.5, 1.0))
+output.result('scenario grid', scenario_results)
+scenario_results.sort_values('Total Profit', ascending=False).head(10)
+
+
 # In[67]:
 
 
 # visualizing the comparison
-import seaborn as sns
+# the KDE curves are computed by density.py (linear binning + FFT convolution, Scott's rule bandwidth as in
+# seaborn's kdeplot), so only 200-point curves reach matplotlib instead of every order's profit
+from density import density_accumulator, plot_kde
+
+with profiler.stage('profit densities'):
+    actual_profit_curve = density_accumulator(food_orders['Profit']).kde()
+    simulated_profit_curve = density_accumulator(food_orders['Simulated Profit']).kde()
+output.result('profit densities', (actual_profit_curve, simulated_profit_curve))
 
-plt.figure(figsize=(14, 7))
+if output.plots:
+    with profiler.stage('plot: profit densities'):
+        plt.figure(figsize=(14, 7))
 
-# actual profitability
-sns.kdeplot(food_orders['Profit'], label='Actual Profitability', fill=True, alpha=0.5, linewidth=2)
+        # actual profitability
+        plot_kde(actual_profit_curve, label='Actual Profitability', fill=True, alpha=0.5, linewidth=2)
 
-# simulated profitability
-sns.kdeplot(food_orders['Simulated Profit'], label='Estimated Profitability with Recommended Rates', fill=True, alpha=0.5, linewidth=2)
+        # simulated profitability
+        plot_kde(simulated_profit_curve, label='Estimated Profitability with Recommended Rates', fill=True, alpha=0.5, linewidth=2)
 
-plt.title('Comparison of Profitability in Food Delivery: Actual vs. Recommended Discounts and Commissions')
-plt.xlabel('Profit')
-plt.ylabel('Density')
-plt.legend(loc='upper left')
-plt.show()
+        plt.title('Comparison of Profitability in Food Delivery: Actual vs. Recommended Discounts and Commissions')
+        plt.xlabel('Profit')
+        plt.ylabel('Density')
+        plt.legend(loc='upper left')
+        plt.show()
 
 
 # The visualization compares the distribution of profitability per order using actual discounts and commissions versus the simulated scenario with recommended discounts (6%) and commissions (30%).
 # 
 # The actual profitability distribution shows a mix, with a significant portion of orders resulting in losses (profit < 0) and a broad spread of profit levels for orders. The simulated scenario suggests a shift towards higher profitability per order. The distribution is more skewed towards positive profit, indicating that the recommended adjustments could lead to a higher proportion of profitable orders.
 
+# In[68]:
+
+
+# stage timings for this run (printed and written to JSON only when ANALYSIS_PROFILE=1) and the recorded tables
+# (pickled only when ANALYSIS_RESULTS is set)
+profiler.finish("food_delivery_profile.json")
+output.finish()
+
+
 # # Summary
 # * So, this is how you can analyze the cost and profitability of a food delivery company. 
 # * Food Delivery Cost and Profitability Analysis involves examining all the costs associated with delivering food orders, from direct expenses like delivery fees and packaging to indirect expenses like discounts offered to customers and commission fees paid by restaurants. 
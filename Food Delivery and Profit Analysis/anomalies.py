@@ -0,0 +1,149 @@
+# coding: utf-8
+
+# * Order-level anomaly scoring: robust z-scores of profit, discount share and refund amount within each restaurant.
+# * Medians and MADs per restaurant come from a single sort of 64-bit keys packing the restaurant code above an
+#   order-preserving encoding of the float32 value, so no per-group Python work is done.
+# * A restaurant's own median and MAD are only used once it has MIN_GROUP_ORDERS orders; smaller restaurants are
+#   scored against the median and MAD of all orders. The global spread is also a floor on every restaurant's MAD, so
+#   a restaurant whose values are mostly identical (e.g. refunds that are mostly 0, a MAD of 0) does not turn every
+#   other value into an outlier. When even the global MAD is 0, the floor is the global standard deviation.
+# * Chunked input is read once; only the order IDs, restaurant codes and three float32 features are kept per order.
+
+import numpy as np
+import pandas as pd
+
+from discounts import LEGACY, add_cost_columns
+
+METRICS = ['Profit', 'Discount Share', 'Refund Amount']
+SCORE_COLUMNS = [f'{metric} Score' for metric in METRICS]
+
+# Iglewicz and Hoaglin's modified z-score: 0.6745 * (x - median) / MAD, flagged above 3.5
+MAD_SCALE = 0.6745
+DEFAULT_THRESHOLD = 3.5
+# restaurants with fewer orders are scored against all orders
+MIN_GROUP_ORDERS = 20
+
+_FEATURE_COLUMNS = ['Order ID', 'Restaurant ID', 'Order Value', 'Delivery Fee', 'Discounts and Offers',
+                    'Commission Fee', 'Payment Processing Fee', 'Refunds/Chargebacks']
+
+
+def order_features(orders, mode=LEGACY):
+    """Profit, discount share of the order value and refund amount per order, as float32 arrays."""
+    if 'Profit' not in orders:
+        orders = add_cost_columns(orders.copy(), mode=mode)
+    order_value = orders['Order Value'].to_numpy(dtype=np.float64)
+    return {
+        'Profit': orders['Profit'].to_numpy(dtype=np.float32),
+        'Discount Share': (orders['Discount Amount'].to_numpy(dtype=np.float64) / order_value).astype(np.float32),
+        'Refund Amount': orders['Refunds/Chargebacks'].to_numpy(dtype=np.float32),
+    }
+
+
+def _sortable_bits(values):
+    # float32 -> uint32 with the same ordering: flip all bits of negatives, only the sign bit of positives
+    bits = np.ascontiguousarray(values, dtype=np.float32).view(np.uint32)
+    return bits ^ np.where(bits >> 31, np.uint32(0xFFFFFFFF), np.uint32(0x80000000))
+
+
+def _float_from_sortable(bits):
+    bits = bits ^ np.where(bits >> 31, np.uint32(0x80000000), np.uint32(0xFFFFFFFF))
+    return bits.view(np.float32)
+
+
+def grouped_median(codes, values, counts, starts):
+    """Median of `values` within each group; `codes` are dense group numbers with the given counts and offsets."""
+    keys = (codes.astype(np.uint64) << np.uint64(32)) | _sortable_bits(values)
+    keys.sort()
+    ordered = _float_from_sortable((keys & np.uint64(0xFFFFFFFF)).astype(np.uint32))
+    nonempty = counts > 0
+    low = ordered[(starts + (counts - 1) // 2)[nonempty]]
+    high = ordered[(starts + counts // 2)[nonempty]]
+    medians = np.full(len(counts), np.nan)
+    medians[nonempty] = (low.astype(np.float64) + high) / 2
+    return medians
+
+
+def robust_scores(codes, values, n_groups, min_group=MIN_GROUP_ORDERS):
+    """Modified z-score of every value against its group's median and MAD.
+
+    Groups with fewer than `min_group` values use the median and MAD of all values, and no group's MAD is taken
+    below the global one (below the global standard deviation when the global MAD is 0).
+    """
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    small = counts < min_group
+
+    global_median = np.median(values.astype(np.float64))
+    global_mad = np.median(np.abs(values - global_median))
+    floor = global_mad / MAD_SCALE if global_mad > 0 else np.std(values, dtype=np.float64, ddof=1)
+
+    medians = np.where(small, global_median, grouped_median(codes, values, counts, starts))
+    deviation = values - medians[codes]
+    mad = grouped_median(codes, np.abs(deviation).astype(np.float32), counts, starts)
+    scale = np.maximum(np.where(small, 0.0, mad / MAD_SCALE), floor)[codes]
+    return np.divide(deviation, scale, out=np.zeros(len(values)), where=scale > 0)
+
+
+class AnomalyScorer:
+    """Buffers compact per-order features from any number of chunks and scores them in one vectorized pass."""
+
+    def __init__(self, mode=LEGACY):
+        self.mode = mode
+        self.restaurants = pd.Index([])
+        self._parts = []
+
+    def add(self, orders):
+        codes, labels = pd.factorize(orders['Restaurant ID'])
+        labels = pd.Index(np.asarray(labels))
+        new_labels = labels.difference(self.restaurants, sort=False)
+        if len(new_labels):
+            self.restaurants = self.restaurants.append(new_labels)
+        codes = self.restaurants.get_indexer(labels).astype(np.int32)[codes]
+
+        features = order_features(orders, self.mode)
+        self._parts.append((orders['Order ID'].to_numpy(dtype=np.int64), codes, features))
+        return self
+
+    def score(self, threshold=DEFAULT_THRESHOLD):
+        """Scores for every order and the flagged subset, as an AnomalyReport."""
+        order_ids = np.concatenate([part[0] for part in self._parts])
+        codes = np.concatenate([part[1] for part in self._parts])
+        scores = pd.DataFrame({'Order ID': order_ids,
+                               'Restaurant ID': pd.Categorical.from_codes(codes, self.restaurants)})
+        for metric, column in zip(METRICS, SCORE_COLUMNS):
+            values = np.concatenate([part[2][metric] for part in self._parts])
+            scores[column] = robust_scores(codes, values, len(self.restaurants))
+        return AnomalyReport(scores, threshold)
+
+
+class AnomalyReport:
+
+    def __init__(self, scores, threshold=DEFAULT_THRESHOLD):
+        self.scores = scores
+        self.threshold = threshold
+        self.scores['Max Abs Score'] = scores[SCORE_COLUMNS].abs().max(axis=1)
+        self.scores['Flagged'] = self.scores['Max Abs Score'] > threshold
+
+    @property
+    def flagged(self):
+        return self.scores[self.scores['Flagged']].sort_values('Max Abs Score', ascending=False)
+
+    @property
+    def flagged_order_ids(self):
+        """Sorted Order IDs of the flagged orders, the follow-up index."""
+        return np.sort(self.scores.loc[self.scores['Flagged'], 'Order ID'].to_numpy())
+
+    def save(self, path):
+        self.flagged.to_csv(path, index=False)
+
+
+def score_orders(orders, threshold=DEFAULT_THRESHOLD, mode=LEGACY):
+    return AnomalyScorer(mode).add(orders).score(threshold)
+
+
+def score_orders_csv(path, chunksize=1_000_000, threshold=DEFAULT_THRESHOLD, mode=LEGACY):
+    """Score an orders CSV read once in chunks of `chunksize` rows."""
+    scorer = AnomalyScorer(mode)
+    for chunk in pd.read_csv(path, usecols=_FEATURE_COLUMNS, chunksize=chunksize):
+        scorer.add(chunk)
+    return scorer.score(threshold)
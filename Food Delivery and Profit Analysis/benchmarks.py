@@ -0,0 +1,198 @@
+# coding: utf-8
+
+# * Benchmarks for the food delivery pipeline on synthetic orders shaped like food_orders_new_delhi.csv.
+# * Run one benchmark with `python benchmarks.py <name>`, or all of them with `python benchmarks.py`.
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from anomalies import AnomalyScorer
+from density import density_accumulator, exact_kde
+from discounts import LEGACY, TYPED, add_cost_columns, extract_discount
+from order_cache import load_orders, parse_orders
+from scenarios import simulate_grid
+
+OFFERS = ['5% on App', '10%', '15% New User', '50 off Promo', 'None']
+PAYMENT_METHODS = ['Credit Card', 'Digital Wallet', 'Cash on Delivery']
+
+
+def _categorical(codes, categories):
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+
+def make_synthetic_orders(n_rows, seed=0):
+    # same columns and value ranges as the New Delhi sample, drawn independently per column;
+    # text columns are categorical so 10M-row frames fit in memory
+    rng = np.random.default_rng(seed)
+    order_time = (pd.Timestamp('2024-01-01').value
+                  + rng.integers(0, 40 * 24 * 3600, n_rows, dtype=np.int64) * 1_000_000_000)
+    delivery_time = order_time + rng.integers(15, 120, n_rows, dtype=np.int64) * 60_000_000_000
+    return pd.DataFrame({
+        'Order ID': np.arange(1, n_rows + 1),
+        'Customer ID': _categorical(rng.integers(0, 9000, n_rows), [f'C{i}' for i in range(1000, 10000)]),
+        'Restaurant ID': _categorical(rng.integers(0, 1000, n_rows), [f'R{i}' for i in range(2000, 3000)]),
+        'Order Date and Time': pd.to_datetime(order_time),
+        'Delivery Date and Time': pd.to_datetime(delivery_time),
+        'Order Value': rng.integers(104, 2000, n_rows),
+        'Delivery Fee': rng.choice([0, 20, 30, 40, 50], n_rows),
+        'Payment Method': _categorical(rng.integers(0, len(PAYMENT_METHODS), n_rows), PAYMENT_METHODS),
+        'Discounts and Offers': _categorical(rng.integers(0, len(OFFERS), n_rows), OFFERS),
+        'Commission Fee': rng.integers(50, 201, n_rows),
+        'Payment Processing Fee': rng.integers(10, 51, n_rows),
+        'Refunds/Chargebacks': rng.choice([0, 0, 0, 0, 0, 0, 50, 100, 150], n_rows),
+    })
+
+
+def legacy_cost_columns(orders):
+    # the original notebook cells: per-row parsing and a row-wise apply for the discount amount
+    orders['Discount Percentage'] = orders['Discounts and Offers'].apply(lambda x: extract_discount(x))
+    orders['Discount Amount'] = orders.apply(lambda x: (x['Order Value'] * x['Discount Percentage'] / 100)
+                                             if x['Discount Percentage'] > 1
+                                             else x['Discount Percentage'], axis=1)
+    orders['Total Costs'] = orders['Delivery Fee'] + orders['Payment Processing Fee'] + orders['Discount Amount']
+    orders['Revenue'] = orders['Commission Fee']
+    orders['Profit'] = orders['Revenue'] - orders['Total Costs']
+    return orders
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_discounts(full=False, sizes=(1_000, 1_000_000, 10_000_000)):
+    # the row-wise apply takes minutes at 10M rows, so it only runs there with --full
+    legacy_max_rows = float('inf') if full else 1_000_000
+    print(f"{'rows':>12} {'apply (s)':>12} {'vectorized (s)':>15} {'typed (s)':>10} {'speedup':>9}")
+    for n_rows in sizes:
+        orders = make_synthetic_orders(n_rows)
+        vectorized, vectorized_time = _timed(add_cost_columns, orders.copy(), mode=LEGACY)
+        _, typed_time = _timed(add_cost_columns, orders.copy(), mode=TYPED)
+
+        if n_rows > legacy_max_rows:
+            print(f"{n_rows:>12,} {'skipped':>12} {vectorized_time:>15.3f} {typed_time:>10.3f} {'-':>9}")
+            continue
+
+        legacy, legacy_time = _timed(legacy_cost_columns, orders.copy())
+        for column in ['Discount Amount', 'Total Costs', 'Revenue', 'Profit']:
+            if not np.array_equal(legacy[column].to_numpy(), vectorized[column].to_numpy()):
+                raise AssertionError(f"vectorized '{column}' differs from the apply path at {n_rows} rows")
+        print(f"{n_rows:>12,} {legacy_time:>12.3f} {vectorized_time:>15.3f} {typed_time:>10.3f} "
+              f"{legacy_time / vectorized_time:>8.1f}x")
+
+
+def bench_scenarios(full=False, sizes=(1_000, 1_000_000), processes=os.cpu_count()):
+    commission_percentages = np.arange(10.0, 40.0, 1.0)
+    discount_percentages = np.arange(0.0, 10.0, 1.0)
+    if not full:
+        # keep the default run short at 1M orders: 10 x 5 x 3 scenarios
+        commission_percentages, discount_percentages = commission_percentages[::3], discount_percentages[::2]
+    n_scenarios = len(commission_percentages) * len(discount_percentages) * 3
+
+    print(f"{'orders':>12} {'scenarios':>10} {'serial (scen/s)':>16} {f'{processes} procs (scen/s)':>18}")
+    for n_rows in sizes:
+        orders = make_synthetic_orders(n_rows)
+        serial, serial_time = _timed(simulate_grid, orders, commission_percentages, discount_percentages)
+        pooled, pooled_time = _timed(simulate_grid, orders, commission_percentages, discount_percentages,
+                                     processes=processes)
+        pd.testing.assert_frame_equal(serial, pooled)
+        print(f"{n_rows:>12,} {n_scenarios:>10} {n_scenarios / serial_time:>16,.1f} {n_scenarios / pooled_time:>18,.1f}")
+
+
+def bench_cache(full=False, sizes=(1_000, 1_000_000)):
+    print(f"{'rows':>12} {'parse (s)':>10} {'cold (s)':>9} {'warm (s)':>9} {'speedup':>8}")
+    for n_rows in sizes:
+        workdir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(workdir, 'orders.csv')
+            make_synthetic_orders(n_rows).to_csv(path, index=False)
+            cache_dir = os.path.join(workdir, 'cache')
+
+            parsed, parse_time = _timed(parse_orders, path)
+            _, cold_time = _timed(load_orders, path, cache_dir=cache_dir)
+            cached, warm_time = _timed(load_orders, path, cache_dir=cache_dir)
+            pd.testing.assert_frame_equal(parsed, cached, check_dtype=False)
+            print(f"{n_rows:>12,} {parse_time:>10.3f} {cold_time:>9.3f} {warm_time:>9.3f} "
+                  f"{parse_time / warm_time:>7.1f}x")
+        finally:
+            shutil.rmtree(workdir)
+
+
+def bench_density(full=False, sizes=(1_000_000, 10_000_000), exact_sample=1_000_000):
+    # seaborn's kdeplot evaluates the exact KDE (samples x 200 points); at 10M rows it only runs with --full
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    seaborn_max_rows = float('inf') if full else 1_000_000
+    print(f"{'rows':>12} {'seaborn (s)':>12} {'binned (s)':>11} {'speedup':>8} {'max rel. error':>15}")
+    for n_rows in sizes:
+        orders = add_cost_columns(make_synthetic_orders(n_rows))
+        profit = orders['Profit'].to_numpy()
+
+        accumulator, binned_time = _timed(density_accumulator, profit)
+        support, curve = accumulator.kde()
+        binned_time += _timed(accumulator.kde)[1]
+
+        # accuracy against the direct sum over (a sample of) the same orders
+        sample = profit[:exact_sample]
+        sampled = density_accumulator(sample)
+        sample_support, sample_curve = sampled.kde()
+        exact = exact_kde(sample, sample_support, sampled.bandwidth())
+        error = np.abs(sample_curve - exact).max() / exact.max()
+
+        if n_rows > seaborn_max_rows:
+            print(f"{n_rows:>12,} {'skipped':>12} {binned_time:>11.3f} {'-':>8} {error:>15.2e}")
+            continue
+        plt.figure()
+        _, seaborn_time = _timed(sns.kdeplot, profit, fill=True)
+        plt.close('all')
+        print(f"{n_rows:>12,} {seaborn_time:>12.3f} {binned_time:>11.3f} {seaborn_time / binned_time:>7.1f}x "
+              f"{error:>15.2e}")
+
+
+def bench_anomalies(full=False, sizes=(1_000_000, 10_000_000), chunksize=1_000_000):
+    if full:
+        sizes = sizes + (30_000_000,)
+    print(f"{'rows':>12} {'features (s)':>13} {'scoring (s)':>12} {'orders/s':>12} {'flagged':>10}")
+    for n_rows in sizes:
+        scorer = AnomalyScorer()
+        features_time = 0.0
+        for start in range(0, n_rows, chunksize):
+            chunk = make_synthetic_orders(min(chunksize, n_rows - start), seed=start)
+            chunk['Order ID'] += start
+            features_time += _timed(scorer.add, chunk)[1]
+        report, scoring_time = _timed(scorer.score)
+        total_time = features_time + scoring_time
+        print(f"{n_rows:>12,} {features_time:>13.3f} {scoring_time:>12.3f} {n_rows / total_time:>12,.0f} "
+              f"{len(report.flagged_order_ids):>10,}")
+
+
+BENCHMARKS = {
+    'discounts': bench_discounts,
+    'scenarios': bench_scenarios,
+    'cache': bench_cache,
+    'density': bench_density,
+    'anomalies': bench_anomalies,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks for the food delivery pipeline.')
+    parser.add_argument('names', nargs='*', help=f"benchmarks to run, any of {', '.join(BENCHMARKS)}")
+    parser.add_argument('--full', action='store_true', help='also run the slow reference paths at every size')
+    args = parser.parse_args()
+
+    for name in args.names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark {name!r}")
+        print(f"# {name}")
+        BENCHMARKS[name](full=args.full)
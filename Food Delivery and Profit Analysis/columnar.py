@@ -0,0 +1,71 @@
+# coding: utf-8
+
+# * Column-per-array binary storage for typed DataFrames, built on NumPy's uncompressed .npz container.
+# * Categoricals are stored as integer codes plus their categories, datetimes as int64 nanoseconds and
+#   text columns are dictionary-encoded, so loading is a handful of array reads with no parsing.
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+_HEADER = '__header__'
+
+
+def _is_text(series):
+    return series.dtype == object or pd.api.types.is_string_dtype(series.dtype)
+
+
+def save_frame(frame, path, metadata=None):
+    """Write `frame` column by column to `path`, replacing any existing file atomically."""
+    arrays = {}
+    columns = []
+    for i, (name, series) in enumerate(frame.items()):
+        key = f'c{i}'
+        if isinstance(series.dtype, pd.CategoricalDtype) or _is_text(series):
+            kind = 'category' if isinstance(series.dtype, pd.CategoricalDtype) else 'text'
+            categorical = pd.Categorical(series)
+            arrays[f'{key}.codes'] = categorical.codes
+            arrays[f'{key}.categories'] = np.asarray(categorical.categories.astype(str), dtype=str)
+        elif pd.api.types.is_datetime64_any_dtype(series.dtype):
+            kind = 'datetime'
+            arrays[key] = series.to_numpy(dtype='datetime64[ns]').view(np.int64)
+        else:
+            kind = 'numeric'
+            arrays[key] = series.to_numpy()
+        columns.append({'name': name, 'kind': kind, 'key': key})
+
+    header = json.dumps({'columns': columns, 'metadata': metadata or {}})
+    arrays[_HEADER] = np.frombuffer(header.encode('utf-8'), dtype=np.uint8)
+
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as file:
+        np.savez(file, **arrays)
+    os.replace(temporary, path)
+
+
+def read_metadata(path):
+    with np.load(path) as arrays:
+        return json.loads(arrays[_HEADER].tobytes().decode('utf-8'))['metadata']
+
+
+def load_frame(path):
+    """Read a frame written by save_frame; returns (frame, metadata)."""
+    with np.load(path) as arrays:
+        header = json.loads(arrays[_HEADER].tobytes().decode('utf-8'))
+        data = {}
+        for column in header['columns']:
+            key = column['key']
+            if column['kind'] == 'category':
+                data[column['name']] = pd.Categorical.from_codes(arrays[f'{key}.codes'], arrays[f'{key}.categories'])
+            elif column['kind'] == 'text':
+                # missing values are stored as code -1, which picks up the trailing None
+                categories = np.append(arrays[f'{key}.categories'].astype(object), None)
+                data[column['name']] = categories[arrays[f'{key}.codes']]
+            elif column['kind'] == 'datetime':
+                data[column['name']] = arrays[key].view('datetime64[ns]')
+            else:
+                data[column['name']] = arrays[key]
+    # the arrays are freshly read, so the frame can own them without the block-consolidation copy
+    return pd.DataFrame(data, copy=False), header['metadata']
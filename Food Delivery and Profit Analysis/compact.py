@@ -0,0 +1,82 @@
+# coding: utf-8
+
+# * Compact dtypes for the food orders frame.
+# * 'Customer ID' / 'Restaurant ID' strings like C8270 / R2924 become categoricals: each row stores a small integer
+#   code, but the values are still the IDs, so filters such as {'Restaurant ID': 'R2924'} and frames of raw rows
+#   work on the compact frame unchanged. Low-cardinality text becomes categorical as well, and integer money columns
+#   get the narrowest integer type that still leaves room for the sums the notebook computes
+#   (e.g. 'Delivery Fee' + 'Payment Processing Fee').
+# * load_compact_orders reads a CSV with the categorical dtypes already set, so the default-dtype frame is never
+#   built; its memory report compares against a default read of the first REPORT_SAMPLE_ROWS rows.
+# * Float columns stay float64, so every cost and profit value is bit-for-bit the same as on the default frame.
+
+import numpy as np
+import pandas as pd
+
+ID_COLUMNS = ['Customer ID', 'Restaurant ID']
+CATEGORY_COLUMNS = ['Payment Method', 'Discounts and Offers']
+MONEY_COLUMNS = ['Order Value', 'Delivery Fee', 'Commission Fee', 'Payment Processing Fee',
+                 'Refunds/Chargebacks', 'Revenue']
+
+# integer columns must hold this many times their largest magnitude, so adding up to
+# this many money columns of the same type cannot overflow
+SUM_HEADROOM = 4
+
+REPORT_SAMPLE_ROWS = 10_000
+DATE_COLUMNS = ['Order Date and Time', 'Delivery Date and Time']
+
+_INTEGER_TYPES = [np.int8, np.int16, np.int32, np.int64]
+
+
+def narrowest_integer_type(values, headroom=SUM_HEADROOM):
+    largest = int(np.abs(np.asarray(values, dtype=np.int64)).max(initial=0)) * headroom
+    return next(t for t in _INTEGER_TYPES if largest <= np.iinfo(t).max)
+
+
+def id_dictionaries(compact):
+    """{column: Index} of the IDs behind each ID column's category codes (compact[column].cat.codes)."""
+    return {column: compact[column].cat.categories for column in ID_COLUMNS
+            if column in compact and isinstance(compact[column].dtype, pd.CategoricalDtype)}
+
+
+def compact_orders(orders):
+    """A compact copy of `orders` and the ID dictionaries, {column: Index}."""
+    compact = orders.copy()
+    for column in ID_COLUMNS + CATEGORY_COLUMNS:
+        if column in compact and not pd.api.types.is_integer_dtype(compact[column].dtype):
+            compact[column] = compact[column].astype('category')
+    if 'Order ID' in compact:
+        compact['Order ID'] = compact['Order ID'].astype(narrowest_integer_type(compact['Order ID'], headroom=1))
+    for column in MONEY_COLUMNS:
+        if column in compact and pd.api.types.is_integer_dtype(compact[column].dtype):
+            compact[column] = compact[column].astype(narrowest_integer_type(compact[column]))
+    return compact, id_dictionaries(compact)
+
+
+def bytes_per_row(frame):
+    return frame.memory_usage(index=False, deep=True).sum() / max(1, len(frame))
+
+
+def memory_report(before, after):
+    """Bytes per row for each column and in total, before and after compaction (the frames may differ in length)."""
+    report = pd.DataFrame({
+        'Before (bytes/row)': before.memory_usage(index=False, deep=True) / max(1, len(before)),
+        'After (bytes/row)': after.memory_usage(index=False, deep=True).reindex(before.columns) / max(1, len(after)),
+        'Before dtype': before.dtypes.astype(str),
+        'After dtype': after.dtypes.reindex(before.columns).astype(str),
+    })
+    report.loc['Total'] = [bytes_per_row(before), bytes_per_row(after), '', '']
+    return report
+
+
+def load_compact_orders(path):
+    """Read an orders CSV straight into the compact layout; returns (orders, dictionaries, memory report)."""
+    header = pd.read_csv(path, nrows=0).columns
+    categories = {column: 'category' for column in ID_COLUMNS + CATEGORY_COLUMNS if column in header}
+    dates = [column for column in DATE_COLUMNS if column in header]
+    orders = pd.read_csv(path, dtype=categories, parse_dates=dates)
+    # only the integer columns are narrowed after the read, one column at a time
+    compact, dictionaries = compact_orders(orders)
+    del orders
+    sample = pd.read_csv(path, nrows=REPORT_SAMPLE_ROWS, parse_dates=dates)
+    return compact, dictionaries, memory_report(sample, compact)
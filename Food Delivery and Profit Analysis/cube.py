@@ -0,0 +1,154 @@
+# coding: utf-8
+
+# * Materialised profitability cube keyed on Restaurant ID, Customer ID, Payment Method and order hour.
+# * The base cells hold additive measures, so any roll-up of the dimensions is a group-by over the cells
+#   instead of a re-read and re-derivation of the raw orders; roll-ups are memoised until the next refresh.
+# * Customer ID makes the base cells nearly as many as the orders, so coarser cuboids without it are materialised
+#   as well and each query is answered from the smallest cuboid that holds all of its dimensions.
+# * The cube remembers the highest 'Order ID' it has seen and a refresh only processes newer orders. A chunked refresh
+#   from a CSV filters every chunk against the value from before the call, so the file need not be sorted by Order ID.
+
+import numpy as np
+import pandas as pd
+
+from columnar import load_frame, save_frame
+from discounts import LEGACY, add_cost_columns
+
+DIMENSIONS = ['Restaurant ID', 'Customer ID', 'Payment Method', 'Order Hour']
+# materialised cuboids, from the base cells down; each one is aggregated from the previous one
+CUBOIDS = [DIMENSIONS,
+           ['Restaurant ID', 'Payment Method', 'Order Hour'],
+           ['Payment Method', 'Order Hour']]
+MEASURES = ['Orders', 'Order Value', 'Delivery Fee', 'Payment Processing Fee', 'Discount Amount',
+            'Total Costs', 'Revenue', 'Profit']
+
+
+def _aggregate(orders, mode):
+    if 'Profit' not in orders:
+        orders = add_cost_columns(orders.copy(), mode=mode)
+    cells = pd.DataFrame({
+        'Restaurant ID': orders['Restaurant ID'].to_numpy(),
+        'Customer ID': orders['Customer ID'].to_numpy(),
+        'Payment Method': orders['Payment Method'].to_numpy(),
+        'Order Hour': pd.to_datetime(orders['Order Date and Time']).dt.hour.to_numpy(dtype=np.int8),
+        'Orders': np.ones(len(orders), dtype=np.int64),
+    })
+    for measure in MEASURES[1:]:
+        cells[measure] = orders[measure].to_numpy(dtype=np.float64)
+    return _group_cells(cells)
+
+
+def _group_cells(cells, dimensions=DIMENSIONS):
+    cells = cells.groupby(dimensions, sort=False, observed=True)[MEASURES].sum().reset_index()
+    for dimension in dimensions:
+        if dimension != 'Order Hour':
+            cells[dimension] = cells[dimension].astype('category')
+    return cells
+
+
+class ProfitCube:
+    """Additive measures per (Restaurant ID, Customer ID, Payment Method, Order Hour) cell."""
+
+    def __init__(self, cells=None, last_order_id=0, mode=LEGACY):
+        self.cells = cells if cells is not None else _group_cells(
+            pd.DataFrame({column: pd.Series(dtype=object if column in DIMENSIONS[:3] else np.int64)
+                          for column in DIMENSIONS + MEASURES}))
+        self.last_order_id = last_order_id
+        self.mode = mode
+        self._rollups = {}
+        self._materialise()
+
+    def _materialise(self):
+        self.cuboids = [self.cells]
+        for dimensions in CUBOIDS[1:]:
+            self.cuboids.append(_group_cells(self.cuboids[-1], dimensions))
+        self._rollups.clear()
+
+    @classmethod
+    def build(cls, orders, mode=LEGACY):
+        cube = cls(mode=mode)
+        cube.refresh(orders)
+        return cube
+
+    def _new_orders(self, orders, watermark):
+        return orders[orders['Order ID'] > watermark]
+
+    def _merge(self, partials, last_order_id):
+        # the existing cells are regrouped once with all the new partial aggregates
+        if len(self.cells):
+            partials = [self.cells] + partials
+        # categoricals with different categories concatenate as plain values, which are re-encoded on grouping
+        self.cells = partials[0] if len(partials) == 1 else _group_cells(pd.concat(partials, ignore_index=True))
+        self.last_order_id = max(self.last_order_id, int(last_order_id))
+        self._materialise()
+
+    def refresh(self, orders):
+        """Merge orders newer than the last seen 'Order ID' into the cells; returns the number of new orders."""
+        new_orders = self._new_orders(orders, self.last_order_id)
+        if len(new_orders) == 0:
+            return 0
+        self._merge([_aggregate(new_orders, self.mode)], new_orders['Order ID'].max())
+        return len(new_orders)
+
+    def refresh_from_csv(self, path, chunksize=1_000_000):
+        """refresh() from a CSV read in chunks, which may come in any 'Order ID' order.
+
+        Every chunk is filtered against the last seen 'Order ID' as it was before the call and aggregated on its own;
+        the partial aggregates are merged into the cells once, at the end.
+        """
+        watermark = self.last_order_id
+        partials, newest, count = [], watermark, 0
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            new_orders = self._new_orders(chunk, watermark)
+            if len(new_orders):
+                partials.append(_aggregate(new_orders, self.mode))
+                newest = max(newest, int(new_orders['Order ID'].max()))
+                count += len(new_orders)
+        if partials:
+            self._merge(partials, newest)
+        return count
+
+    def query(self, by=(), where=None, measures=None):
+        """Roll the cells up to the dimensions in `by`, optionally filtered first.
+
+        `where` maps a dimension to a value or a list of values, e.g. {'Payment Method': 'Credit Card'}.
+        The result also carries 'Average Profit' per order.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        measures = MEASURES if measures is None else list(measures)
+        unknown = (set(by) | set(where or {})) - set(DIMENSIONS)
+        if unknown:
+            raise KeyError(f"unknown cube dimensions {sorted(unknown)}, expected any of {DIMENSIONS}")
+
+        key = (tuple(by), tuple(measures)) if not where else None
+        if key in self._rollups:
+            # a copy, so a caller changing the result does not change the memoised roll-up
+            return self._rollups[key].copy()
+
+        needed = set(by) | set(where or {})
+        cells = next(cuboid for dimensions, cuboid in zip(reversed(CUBOIDS), reversed(self.cuboids))
+                     if needed <= set(dimensions))
+        for dimension, values in (where or {}).items():
+            values = values if isinstance(values, (list, tuple, set, np.ndarray)) else [values]
+            cells = cells[cells[dimension].isin(values)]
+
+        if by:
+            result = cells.groupby(by, observed=True)[measures].sum()
+        else:
+            # one column at a time, so 'Orders' stays an integer count
+            result = pd.DataFrame({measure: [cells[measure].sum()] for measure in measures})
+        if 'Orders' in result and 'Profit' in result:
+            result['Average Profit'] = result['Profit'] / result['Orders']
+
+        if key is not None:
+            self._rollups[key] = result
+            return result.copy()
+        return result
+
+    def save(self, path):
+        save_frame(self.cells, path, metadata={'last_order_id': self.last_order_id, 'mode': self.mode})
+
+    @classmethod
+    def load(cls, path):
+        cells, metadata = load_frame(path)
+        return cls(cells, last_order_id=metadata['last_order_id'], mode=metadata['mode'])
@@ -0,0 +1,170 @@
+# coding: utf-8
+
+# * Delivery-time (SLA) analytics for the food orders: per-order delivery duration and p50/p90/p99 by
+#   hour of day, restaurant and payment method.
+# * Durations are whole minutes computed on the int64 datetime arrays. Per group they are kept in a
+#   minute-resolution histogram, which is an exact and mergeable quantile sketch: chunks, files or days
+#   combine by adding counts, and percentiles never need the individual durations.
+# * Durations are clipped to [0, MAX_MINUTES] once, and both the histogram and the mean use the clipped values. The
+#   last bin holds every duration of MAX_MINUTES or more, so a percentile that falls in it is only known to be at least
+#   MAX_MINUTES: quantiles() returns inf for it and the tables show '>= 360'.
+# * matplotlib is imported by the plotting methods only, so headless runs never load it.
+
+import numpy as np
+import pandas as pd
+
+GROUPINGS = ['Order Hour', 'Restaurant ID', 'Payment Method']
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+
+# durations at or above this many minutes share the last histogram bin
+MAX_MINUTES = 360
+
+_NANOSECONDS_PER_MINUTE = 60 * 1_000_000_000
+
+
+def _as_int64_ns(values):
+    return pd.to_datetime(values).to_numpy(dtype='datetime64[ns]').view(np.int64)
+
+
+def delivery_minutes(orders):
+    """Whole minutes from 'Order Date and Time' to 'Delivery Date and Time' as an int64 array."""
+    elapsed = _as_int64_ns(orders['Delivery Date and Time']) - _as_int64_ns(orders['Order Date and Time'])
+    return elapsed // _NANOSECONDS_PER_MINUTE
+
+
+class DurationSketch:
+    """Minute-resolution duration histograms for a growing set of group labels."""
+
+    def __init__(self, max_minutes=MAX_MINUTES):
+        self.max_minutes = max_minutes
+        self.labels = pd.Index([])
+        self.counts = np.zeros((0, max_minutes + 1), dtype=np.int64)
+        self.total_minutes = np.zeros(0, dtype=np.int64)
+
+    def _align(self, labels):
+        # extend the label set with unseen labels and return the row of each label in `labels`
+        labels = pd.Index(labels)
+        new_labels = labels.difference(self.labels, sort=False)
+        if len(new_labels):
+            self.labels = self.labels.append(new_labels)
+            self.counts = np.vstack([self.counts, np.zeros((len(new_labels), self.max_minutes + 1), dtype=np.int64)])
+            self.total_minutes = np.concatenate([self.total_minutes, np.zeros(len(new_labels), dtype=np.int64)])
+        return self.labels.get_indexer(labels)
+
+    def add(self, groups, minutes):
+        codes, labels = pd.factorize(np.asarray(groups))
+        rows = self._align(labels)[codes]
+        # negative durations count as 0 and long ones as max_minutes, in the bins and in the mean alike
+        minutes = np.clip(np.asarray(minutes, dtype=np.int64), 0, self.max_minutes)
+
+        n_bins = self.max_minutes + 1
+        cells = rows * n_bins + minutes
+        self.counts += np.bincount(cells, minlength=len(self.labels) * n_bins).reshape(len(self.labels), n_bins)
+        self.total_minutes += np.bincount(rows, weights=minutes, minlength=len(self.labels)).astype(np.int64)
+        return self
+
+    def merge(self, other):
+        if other.max_minutes != self.max_minutes:
+            raise ValueError("cannot merge sketches with different max_minutes")
+        rows = self._align(other.labels)
+        self.counts[rows] += other.counts
+        self.total_minutes[rows] += other.total_minutes
+        return self
+
+    def quantiles(self, quantiles=DEFAULT_QUANTILES):
+        """Exact per-group quantiles in minutes (smallest duration whose CDF reaches q), groups x quantiles.
+
+        A quantile in the last bin is inf: it is max_minutes or more.
+        """
+        cumulative = np.cumsum(self.counts, axis=1)
+        totals = cumulative[:, -1:]
+        result = np.empty((len(self.labels), len(quantiles)))
+        for i, q in enumerate(quantiles):
+            # first bin whose cumulative count reaches the target rank, per group
+            targets = np.maximum(np.ceil(q * totals), 1)
+            result[:, i] = (cumulative >= targets).argmax(axis=1)
+        result[result == self.max_minutes] = np.inf
+        result[totals[:, 0] == 0] = np.nan
+        return result
+
+    def table(self, name, quantiles=DEFAULT_QUANTILES):
+        # 'Mean Minutes' is the mean of the clipped durations; a percentile in the last bin reads '>= max_minutes'
+        orders = self.counts.sum(axis=1)
+        table = pd.DataFrame({
+            'Orders': orders,
+            'Mean Minutes': np.divide(self.total_minutes, orders, out=np.full(len(orders), np.nan), where=orders > 0),
+        }, index=pd.Index(self.labels, name=name))
+        for q, column in zip(quantiles, self.quantiles(quantiles).T):
+            overflow = np.isinf(column)
+            if overflow.any():
+                column = np.where(overflow, f'>= {self.max_minutes}', column.astype(object))
+            table[f'p{q * 100:g}'] = column
+        return table.sort_index()
+
+
+class DeliveryTimeStats:
+    """Duration sketches per hour of day, restaurant and payment method, plus the overall distribution."""
+
+    def __init__(self, max_minutes=MAX_MINUTES):
+        self.sketches = {grouping: DurationSketch(max_minutes) for grouping in GROUPINGS + ['All Orders']}
+
+    def update(self, orders):
+        minutes = delivery_minutes(orders)
+        groups = {
+            'Order Hour': pd.to_datetime(orders['Order Date and Time']).dt.hour.to_numpy(),
+            'Restaurant ID': orders['Restaurant ID'].to_numpy(),
+            'Payment Method': orders['Payment Method'].to_numpy(),
+            'All Orders': np.zeros(len(orders), dtype=np.int64),
+        }
+        for grouping, sketch in self.sketches.items():
+            sketch.add(groups[grouping], minutes)
+        return self
+
+    def merge(self, other):
+        for grouping, sketch in self.sketches.items():
+            sketch.merge(other.sketches[grouping])
+        return self
+
+    def table(self, by='Order Hour', quantiles=DEFAULT_QUANTILES):
+        """Orders, mean and quantiles of delivery minutes per group of `by`."""
+        if by not in self.sketches:
+            raise KeyError(f"unknown grouping {by!r}, expected one of {list(self.sketches)}")
+        return self.sketches[by].table(by, quantiles)
+
+    def plot_by_hour(self, quantiles=DEFAULT_QUANTILES):
+        import matplotlib.pyplot as plt
+
+        sketch = self.sketches['Order Hour']
+        order = np.argsort(sketch.labels.to_numpy())
+        # percentiles of max_minutes or more are drawn at max_minutes
+        values = np.minimum(sketch.quantiles(quantiles), sketch.max_minutes)[order]
+        plt.figure(figsize=(10, 6))
+        for i, q in enumerate(quantiles):
+            plt.plot(sketch.labels[order], values[:, i], marker='o', label=f'p{q * 100:g}')
+        plt.title('Delivery Time Percentiles by Hour of Order')
+        plt.xlabel('Hour of Order')
+        plt.ylabel('Delivery Time (minutes)')
+        plt.xticks(range(24))
+        plt.legend(loc='upper left')
+        plt.show()
+
+    def plot_distribution(self):
+        import matplotlib.pyplot as plt
+
+        counts = self.sketches['All Orders'].counts[0]
+        plt.figure(figsize=(10, 6))
+        plt.bar(np.arange(len(counts)), counts, width=1.0, color='skyblue', edgecolor='black')
+        plt.title('Delivery Time Distribution')
+        plt.xlabel('Delivery Time (minutes)')
+        plt.ylabel('Number of Orders')
+        plt.xlim(0, np.flatnonzero(counts).max() + 1 if counts.any() else 1)
+        plt.show()
+
+
+def stream_delivery_times(path, chunksize=1_000_000, max_minutes=MAX_MINUTES):
+    """Fold an orders CSV into DeliveryTimeStats, holding at most `chunksize` rows in memory."""
+    stats = DeliveryTimeStats(max_minutes)
+    columns = ['Restaurant ID', 'Order Date and Time', 'Delivery Date and Time', 'Payment Method']
+    for chunk in pd.read_csv(path, usecols=columns, chunksize=chunksize):
+        stats.update(chunk)
+    return stats
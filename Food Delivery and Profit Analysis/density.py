@@ -0,0 +1,184 @@
+# coding: utf-8
+
+# * Density backend for the profit distribution plots.
+# * Samples are linearly binned onto a fixed fine grid (two bincounts) and the Gaussian KDE is the FFT convolution
+#   of those bin weights with the kernel, so its cost depends on the grid size rather than the number of orders.
+# * The binned weights, the floor-binned histogram counts and the moments used for the bandwidth all merge across
+#   chunks, and the plots receive precomputed curves instead of raw samples.
+# * The grid must resolve the kernel: density_accumulator uses at least STEPS_PER_BANDWIDTH grid steps per
+#   bandwidth (more than GRID_POINTS when outliers stretch the range, up to MAX_GRID_POINTS), and grid_density warns
+#   when a step is longer than 1/MIN_STEPS_PER_BANDWIDTH of the bandwidth, where the binned KDE is several percent
+#   off the exact one.
+# * Defaults follow seaborn's kdeplot: Scott's rule bandwidth, evaluated on 200 points spanning 3 bandwidths
+#   beyond the data. matplotlib is only imported when a curve is drawn.
+
+import warnings
+
+import numpy as np
+
+GRID_POINTS = 4096
+MAX_GRID_POINTS = 1 << 22
+STEPS_PER_BANDWIDTH = 16
+MIN_STEPS_PER_BANDWIDTH = 4
+CURVE_POINTS = 200
+CUT = 3
+# kernel is truncated this many bandwidths from its centre
+KERNEL_SUPPORT = 5
+
+
+def scott_bandwidth(count, std):
+    return std * count ** (-1 / 5)
+
+
+def histogram(values, bins=50, value_range=None):
+    """np.histogram-compatible counts and edges from a single bincount."""
+    values = np.asarray(values, dtype=np.float64)
+    low, high = value_range if value_range is not None else (values.min(), values.max())
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    edges = np.linspace(low, high, bins + 1)
+    inside = values[(values >= low) & (values <= high)]
+    index = ((inside - low) * (bins / (high - low))).astype(np.int64)
+    # the last edge is inclusive, as in np.histogram
+    index = np.minimum(index, bins - 1)
+    return np.bincount(index, minlength=bins), edges
+
+
+class DensityAccumulator:
+    """Mergeable binned sample summary on a fixed grid over [low, high].
+
+    Values outside the grid are clamped to its end points and counted in `clamped`; pick a range that covers the
+    data, e.g. from a first pass or from streaming.ProfitHistogram.
+    """
+
+    def __init__(self, low, high, grid_points=GRID_POINTS):
+        if not high > low:
+            raise ValueError("density grid needs high > low")
+        self.grid = np.linspace(low, high, grid_points)
+        self.spacing = self.grid[1] - self.grid[0]
+        self.weights = np.zeros(grid_points)
+        self.floor_counts = np.zeros(grid_points, dtype=np.int64)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = np.inf
+        self.maximum = -np.inf
+        self.clamped = 0
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+
+        position = (values - self.grid[0]) / self.spacing
+        self.clamped += int(((position < 0) | (position > len(self.grid) - 1)).sum())
+        position = np.clip(position, 0, len(self.grid) - 1)
+
+        # linear binning: each sample splits its unit weight between the two neighbouring grid points
+        left = np.minimum(position.astype(np.int64), len(self.grid) - 2)
+        right_share = position - left
+        n = len(self.grid)
+        self.weights += np.bincount(left, weights=1 - right_share, minlength=n)
+        self.weights += np.bincount(left + 1, weights=right_share, minlength=n)
+        self.floor_counts += np.bincount(left, minlength=n)
+
+        # Chan et al. parallel update of count, mean and sum of squared deviations
+        chunk_mean = values.mean()
+        chunk_m2 = ((values - chunk_mean) ** 2).sum()
+        self._combine(values.size, chunk_mean, chunk_m2)
+        self.minimum = min(self.minimum, values.min())
+        self.maximum = max(self.maximum, values.max())
+        return self
+
+    def _combine(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta ** 2 * self.count * count / total
+        self.count = total
+
+    def merge(self, other):
+        if len(other.grid) != len(self.grid) or not np.allclose(other.grid[[0, -1]], self.grid[[0, -1]]):
+            raise ValueError("cannot merge density accumulators on different grids")
+        if other.count == 0:
+            return self
+        self.weights += other.weights
+        self.floor_counts += other.floor_counts
+        self.clamped += other.clamped
+        self._combine(other.count, other.mean, other.m2)
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        return self
+
+    def std(self):
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def bandwidth(self, bw_adjust=1.0):
+        return scott_bandwidth(self.count, self.std()) * bw_adjust
+
+    def grid_density(self, bandwidth):
+        """KDE evaluated at every grid point, by FFT convolution of the binned weights with the Gaussian kernel."""
+        if self.spacing > bandwidth / MIN_STEPS_PER_BANDWIDTH:
+            warnings.warn(f"density grid spacing {self.spacing:.3g} is more than 1/{MIN_STEPS_PER_BANDWIDTH} of the "
+                          f"bandwidth {bandwidth:.3g}; the KDE is inaccurate, use more grid points", RuntimeWarning)
+        n = len(self.grid)
+        half_width = min(n - 1, int(np.ceil(KERNEL_SUPPORT * bandwidth / self.spacing)))
+        offsets = np.arange(-half_width, half_width + 1) * self.spacing
+        kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+
+        size = 1 << int(np.ceil(np.log2(n + len(kernel) - 1)))
+        convolved = np.fft.irfft(np.fft.rfft(self.weights, size) * np.fft.rfft(kernel, size), size)
+        return np.maximum(convolved[half_width:half_width + n], 0.0) / self.count
+
+    def kde(self, bw_adjust=1.0, cut=CUT, points=CURVE_POINTS):
+        """(x, density) over [min - cut * bw, max + cut * bw], like seaborn's kdeplot."""
+        bandwidth = self.bandwidth(bw_adjust)
+        if bandwidth <= 0:
+            raise ValueError("need at least two distinct values for a KDE")
+        support = np.linspace(self.minimum - cut * bandwidth, self.maximum + cut * bandwidth, points)
+        return support, np.interp(support, self.grid, self.grid_density(bandwidth), left=0.0, right=0.0)
+
+    def histogram(self, bins=50):
+        """Counts and edges over [min, max] re-binned from the fine floor-binned counts (edges within one grid step)."""
+        edges = np.linspace(self.minimum, self.maximum, bins + 1)
+        coarse = np.clip(np.searchsorted(edges, self.grid, side='right') - 1, 0, bins - 1)
+        return np.bincount(coarse, weights=self.floor_counts, minlength=bins).astype(np.int64), edges
+
+
+def density_accumulator(values, grid_points=GRID_POINTS, cut=CUT):
+    """An accumulator over the whole sample, with a grid wide enough for the default KDE support and fine enough
+    for its bandwidth (at least `grid_points` points)."""
+    values = np.asarray(values, dtype=np.float64)
+    low, high = np.nanmin(values), np.nanmax(values)
+    bandwidth = scott_bandwidth(np.count_nonzero(~np.isnan(values)), np.nanstd(values, ddof=1))
+    margin = (cut + KERNEL_SUPPORT) * bandwidth
+    margin = margin if margin > 0 else 1.0
+    if bandwidth > 0:
+        needed = int(np.ceil((high - low + 2 * margin) / bandwidth * STEPS_PER_BANDWIDTH)) + 1
+        grid_points = max(grid_points, min(needed, MAX_GRID_POINTS))
+    return DensityAccumulator(low - margin, high + margin, grid_points).add(values)
+
+
+def exact_kde(values, support, bandwidth, block=1_000_000):
+    """Direct O(samples x points) Gaussian KDE, the reference for the binned estimate."""
+    values = np.asarray(values, dtype=np.float64)
+    density = np.zeros(len(support))
+    step = max(1, block // len(support))
+    for start in range(0, len(values), step):
+        chunk = values[start:start + step]
+        density += np.exp(-0.5 * ((support[:, None] - chunk[None, :]) / bandwidth) ** 2).sum(axis=1)
+    return density / (len(values) * bandwidth * np.sqrt(2 * np.pi))
+
+
+def plot_kde(curve, label=None, fill=True, alpha=0.5, linewidth=2, ax=None):
+    """Draw a precomputed (x, density) curve in the style of seaborn's kdeplot(fill=True)."""
+    import matplotlib.pyplot as plt
+
+    ax = plt.gca() if ax is None else ax
+    x, y = curve
+    line, = ax.plot(x, y, label=label, linewidth=linewidth)
+    if fill:
+        ax.fill_between(x, y, color=line.get_color(), alpha=alpha, linewidth=0)
+    ax.set_ylim(bottom=0)
+    return ax
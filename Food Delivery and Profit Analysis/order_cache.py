@@ -0,0 +1,114 @@
+# coding: utf-8
+
+# * Cache of the cleaned, typed food orders frame so repeated runs skip CSV parsing, datetime conversion
+#   and discount parsing.
+# * The cache file is keyed by a hash of the source CSV's bytes, the derivation code (this module and discounts.py)
+#   and the discount mode, so editing the CSV or the derivation invalidates it automatically.
+# * The CSV digest is remembered next to the cache together with the file's size and modification time,
+#   so an untouched source is not re-hashed on every run.
+# * Frames are stored with columnar.save_frame: datetimes as int64, 'Payment Method' and 'Discounts and Offers' as
+#   categoricals, the IDs dictionary-encoded and the derived cost columns as float64 arrays.
+
+import hashlib
+import json
+import os
+from contextlib import nullcontext
+
+import pandas as pd
+
+import discounts
+from columnar import load_frame, save_frame
+from discounts import LEGACY, add_cost_columns
+
+DATETIME_COLUMNS = ['Order Date and Time', 'Delivery Date and Time']
+CATEGORICAL_COLUMNS = ['Payment Method', 'Discounts and Offers']
+
+_HASH_BLOCK = 1 << 20
+_SOURCES_INDEX = 'sources.json'
+
+
+def _file_digest(path, digest=None):
+    digest = hashlib.blake2b(digest_size=16) if digest is None else digest
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(_HASH_BLOCK), b''):
+            digest.update(block)
+    return digest
+
+
+def source_digest(path, cache_dir=None):
+    """Content hash of `path`, reused from `cache_dir` while the file's size and mtime are unchanged."""
+    stat = os.stat(path)
+    fingerprint = [stat.st_size, stat.st_mtime_ns]
+    index_path = os.path.join(cache_dir, _SOURCES_INDEX) if cache_dir else None
+    index = {}
+    if index_path and os.path.exists(index_path):
+        with open(index_path) as file:
+            index = json.load(file)
+
+    entry = index.get(os.path.abspath(path))
+    if entry and entry['fingerprint'] == fingerprint:
+        return entry['digest']
+
+    digest = _file_digest(path).hexdigest()
+    if index_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        index[os.path.abspath(path)] = {'fingerprint': fingerprint, 'digest': digest}
+        with open(index_path, 'w') as file:
+            json.dump(index, file)
+    return digest
+
+
+def cache_key(path, mode=LEGACY, cache_dir=None):
+    """Hash of the source file, the derivation code and the discount mode."""
+    digest = hashlib.blake2b(digest_size=16)
+    for source in [__file__, discounts.__file__]:
+        _file_digest(source, digest)
+    digest.update(mode.encode('utf-8'))
+    digest.update(source_digest(path, cache_dir).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _stage(profiler, name):
+    # `profiler` is an optional stage_profiler.StageProfiler
+    return profiler.stage(name) if profiler is not None else nullcontext()
+
+
+def parse_orders(path, mode=LEGACY, profiler=None):
+    """The uncached path: read the CSV, convert the datetimes and categoricals and derive the cost columns."""
+    with _stage(profiler, 'csv load') as stage:
+        orders = pd.read_csv(path)
+        if stage is not None:
+            stage.rows = len(orders)
+    with _stage(profiler, 'datetime conversion'):
+        for column in DATETIME_COLUMNS:
+            orders[column] = pd.to_datetime(orders[column])
+    with _stage(profiler, 'categorical conversion'):
+        for column in CATEGORICAL_COLUMNS:
+            orders[column] = orders[column].astype('category')
+    with _stage(profiler, 'discount parsing and cost derivation'):
+        return add_cost_columns(orders, mode=mode)
+
+
+def load_orders(path, mode=LEGACY, cache_dir='.order_cache', profiler=None):
+    """Typed orders frame with the cost columns, served from `cache_dir` when the source is unchanged."""
+    with _stage(profiler, 'cache lookup'):
+        key = cache_key(path, mode, cache_dir)
+    stem = os.path.basename(path)
+    cache_path = os.path.join(cache_dir, f'{stem}.{key}.npz')
+
+    if os.path.exists(cache_path):
+        with _stage(profiler, 'cache load') as stage:
+            orders, _ = load_frame(cache_path)
+            if stage is not None:
+                stage.rows = len(orders)
+        return orders
+
+    orders = parse_orders(path, mode=mode, profiler=profiler)
+    with _stage(profiler, 'cache write'):
+        os.makedirs(cache_dir, exist_ok=True)
+        # drop caches of older versions of the same source before writing the new one
+        for name in os.listdir(cache_dir):
+            if name.startswith(f'{stem}.') and name.endswith('.npz'):
+                os.remove(os.path.join(cache_dir, name))
+        save_frame(orders, cache_path, metadata={'source': stem, 'key': key, 'mode': mode})
+    return orders
@@ -0,0 +1,93 @@
+# coding: utf-8
+
+# * What-if simulation over a grid of commission rates, discount rates and delivery-fee policies.
+# * Per-order profits for a block of scenarios are one 2-D (scenarios x orders) broadcast of the order arrays, so no
+#   'Simulated ...' columns are materialised; large grids are split into blocks and spread across a process pool.
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+# share of each order's 'Delivery Fee' borne by the platform
+FEE_POLICIES = {
+    'actual': 1.0,
+    'shared': 0.5,
+    'customer pays': 0.0,
+}
+
+DEFAULT_QUANTILES = (0.1, 0.5, 0.9)
+
+# scenarios x orders cells per block, about 64 MB of float64 per intermediate array
+_BLOCK_CELLS = 8_000_000
+
+_worker_orders = None
+
+
+def _order_arrays(orders):
+    return {column: orders[column].to_numpy(dtype=np.float64)
+            for column in ['Order Value', 'Delivery Fee', 'Payment Processing Fee']}
+
+
+def _init_worker(arrays):
+    global _worker_orders
+    _worker_orders = arrays
+
+
+def _evaluate_block(block, arrays=None, quantiles=DEFAULT_QUANTILES):
+    arrays = _worker_orders if arrays is None else arrays
+    commission_rates, discount_rates, fee_shares = (values[:, None] for values in block)
+    order_value = arrays['Order Value'][None, :]
+
+    # same operation order as the notebook's 'Simulated ...' columns, so the (30%, 6%, actual) row matches them exactly
+    commission = order_value * (commission_rates / 100)
+    discount = order_value * (discount_rates / 100)
+    costs = fee_shares * arrays['Delivery Fee'] + arrays['Payment Processing Fee'] + discount
+    profit = commission - costs
+
+    return (profit.sum(axis=1),
+            (profit > 0).mean(axis=1),
+            np.quantile(profit, quantiles, axis=1).T)
+
+
+def scenario_grid(commission_percentages, discount_percentages, fee_policies=None):
+    """All (commission %, discount %, fee policy) combinations as a frame, one row per scenario."""
+    fee_policies = FEE_POLICIES if fee_policies is None else fee_policies
+    rows = list(product(commission_percentages, discount_percentages, fee_policies))
+    return pd.DataFrame(rows, columns=['Commission Percentage', 'Discount Percentage', 'Delivery Fee Policy'])
+
+
+def simulate_grid(orders, commission_percentages, discount_percentages, fee_policies=None,
+                  quantiles=DEFAULT_QUANTILES, processes=None):
+    """Total profit, share of profitable orders and per-order profit quantiles for every scenario in the grid.
+
+    `fee_policies` maps a policy name to the share of 'Delivery Fee' the platform pays (default FEE_POLICIES).
+    With `processes` > 1 the scenario blocks are evaluated in a process pool.
+    """
+    fee_policies = FEE_POLICIES if fee_policies is None else fee_policies
+    grid = scenario_grid(commission_percentages, discount_percentages, fee_policies)
+    arrays = _order_arrays(orders)
+
+    parameters = (grid['Commission Percentage'].to_numpy(dtype=np.float64),
+                  grid['Discount Percentage'].to_numpy(dtype=np.float64),
+                  grid['Delivery Fee Policy'].map(fee_policies).to_numpy(dtype=np.float64))
+    block_size = max(1, _BLOCK_CELLS // max(1, len(orders)))
+    if processes is not None and processes > 1:
+        # a few blocks per worker so the pool stays balanced
+        block_size = min(block_size, -(-len(grid) // (4 * processes)))
+    blocks = [tuple(values[start:start + block_size] for values in parameters)
+              for start in range(0, len(grid), block_size)]
+
+    if processes is not None and processes > 1 and len(blocks) > 1:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(arrays,)) as pool:
+            results = list(pool.map(_evaluate_block, blocks, [None] * len(blocks), [quantiles] * len(blocks)))
+    else:
+        results = [_evaluate_block(block, arrays, quantiles) for block in blocks]
+
+    total_profit, profitable_share, profit_quantiles = (np.concatenate(parts) for parts in zip(*results))
+    grid['Total Profit'] = total_profit
+    grid['Profitable Share'] = profitable_share
+    for i, q in enumerate(quantiles):
+        grid[f'Profit p{q * 100:g}'] = profit_quantiles[:, i]
+    return grid
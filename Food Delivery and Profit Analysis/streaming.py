@@ -0,0 +1,170 @@
+# coding: utf-8
+
+# * Streaming profitability aggregation for order files that do not fit in memory.
+# * The orders CSV is read in fixed-size chunks, each chunk goes through the same cost/revenue/profit derivation as the
+#   notebook (discounts.add_cost_columns), and the results are folded into mergeable accumulators.
+# * Sums are exact (independent of chunk size and merge order), so the streamed overall_metrics equal the in-memory ones.
+
+import numpy as np
+import pandas as pd
+
+from discounts import LEGACY, add_cost_columns
+
+# columns needed for the cost/revenue/profit derivation; the datetime columns are not parsed in streaming mode
+COST_COLUMNS = ['Order Value', 'Delivery Fee', 'Discounts and Offers', 'Commission Fee', 'Payment Processing Fee']
+COST_BREAKDOWN = ['Delivery Fee', 'Payment Processing Fee', 'Discount Amount']
+
+# every finite float64 is a 53-bit integer mantissa times 2**e with e >= -1127
+_SCALE = 1127
+_HALF_BITS = 26
+
+# ProfitHistogram.add counts with a dense bincount while the occupied bin range is at most this many times the
+# number of values, and with np.unique beyond that
+DENSE_RANGE_FACTOR = 8
+
+
+class ExactSum:
+    """Exact running sum of float64/int64 values, rounded once when read.
+
+    Each float is split into an integer mantissa and an exponent. Mantissas are summed per exponent in int64 and the
+    per-exponent totals are combined in an arbitrary-precision Python int, so adding values in any order or chunking
+    gives the same, correctly rounded result. NaNs are skipped like in pandas' sum.
+    """
+
+    def __init__(self):
+        self._scaled_total = 0
+        self._integer = True
+
+    def add(self, values):
+        values = np.asarray(values)
+        if values.dtype.kind in 'iub':
+            self._scaled_total += int(values.sum(dtype=np.int64)) << _SCALE
+            return self
+
+        self._integer = False
+        values = values.astype(np.float64, copy=False)
+        values = values[~np.isnan(values)]
+        if not np.isfinite(values).all():
+            raise ValueError("cannot sum infinite values exactly")
+        if values.size == 0:
+            return self
+
+        mantissa, exponent = np.frexp(values)
+        mantissa = (mantissa * 2.0 ** 53).astype(np.int64)
+        shift = exponent.astype(np.int64) - 53 + _SCALE
+
+        # sum mantissas per exponent, split in two halves so int64 cannot overflow
+        order = np.argsort(shift, kind='stable')
+        shift, mantissa = shift[order], mantissa[order]
+        starts = np.flatnonzero(np.r_[True, shift[1:] != shift[:-1]])
+        high = np.add.reduceat(mantissa >> _HALF_BITS, starts)
+        low = np.add.reduceat(mantissa & ((1 << _HALF_BITS) - 1), starts)
+        for group_shift, group_high, group_low in zip(shift[starts].tolist(), high.tolist(), low.tolist()):
+            scaled = (group_high << _HALF_BITS) + group_low
+            self._scaled_total += scaled << group_shift
+        return self
+
+    def merge(self, other):
+        self._scaled_total += other._scaled_total
+        self._integer = self._integer and other._integer
+        return self
+
+    @property
+    def value(self):
+        if self._integer:
+            return self._scaled_total >> _SCALE
+        # int / int is correctly rounded in CPython
+        return self._scaled_total / (1 << _SCALE)
+
+
+class ProfitHistogram:
+    """Sparse fixed-width histogram sketch; bins are aligned to multiples of `bin_width`, so sketches merge by adding counts."""
+
+    def __init__(self, bin_width=1.0):
+        self.bin_width = bin_width
+        self.bins = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+
+    def _fold(self, bins, counts):
+        bins, inverse = np.unique(np.concatenate([self.bins, bins]), return_inverse=True)
+        self.counts = np.bincount(inverse, weights=np.concatenate([self.counts, counts]),
+                                  minlength=len(bins)).astype(np.int64)
+        self.bins = bins
+        return self
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        bins = np.floor(values / self.bin_width).astype(np.int64)
+        first = bins.min()
+        if bins.max() - first > DENSE_RANGE_FACTOR * bins.size:
+            # sparse values (e.g. a few outliers far from the rest): sort instead of allocating the whole range
+            return self._fold(*np.unique(bins, return_counts=True))
+        # one bincount over the occupied bin range, then keep the non-empty bins
+        counts = np.bincount(bins - first)
+        occupied = np.flatnonzero(counts)
+        return self._fold(occupied + first, counts[occupied])
+
+    def merge(self, other):
+        if other.bin_width != self.bin_width:
+            raise ValueError("cannot merge histograms with different bin widths")
+        return self._fold(other.bins, other.counts)
+
+    def rebin(self, n_bins=50):
+        """Counts and edges over `n_bins` equal-width bins spanning the data, ready for plt.hist(weights=...)."""
+        if len(self.bins) == 0:
+            return np.zeros(n_bins, dtype=np.int64), np.linspace(0.0, 1.0, n_bins + 1)
+        low = self.bins[0] * self.bin_width
+        high = (self.bins[-1] + 1) * self.bin_width
+        edges = np.linspace(low, high, n_bins + 1)
+        centers = (self.bins + 0.5) * self.bin_width
+        coarse = np.clip(np.searchsorted(edges, centers, side='right') - 1, 0, n_bins - 1)
+        return np.bincount(coarse, weights=self.counts, minlength=n_bins).astype(np.int64), edges
+
+
+class ProfitAccumulator:
+    """Mergeable order count, revenue/cost/profit totals, cost breakdown and profit histogram."""
+
+    def __init__(self, bin_width=1.0):
+        self.orders = 0
+        self.sums = {column: ExactSum() for column in ['Revenue', 'Total Costs', 'Profit'] + COST_BREAKDOWN}
+        self.profit_histogram = ProfitHistogram(bin_width)
+
+    def update(self, orders):
+        # `orders` must already carry the derived cost columns (see discounts.add_cost_columns)
+        self.orders += len(orders)
+        for column, total in self.sums.items():
+            total.add(orders[column].to_numpy())
+        self.profit_histogram.add(orders['Profit'].to_numpy())
+        return self
+
+    def merge(self, other):
+        self.orders += other.orders
+        for column, total in self.sums.items():
+            total.merge(other.sums[column])
+        self.profit_histogram.merge(other.profit_histogram)
+        return self
+
+    def mean_profit(self):
+        return self.sums['Profit'].value / self.orders if self.orders else float('nan')
+
+    def costs_breakdown(self):
+        return pd.Series({column: self.sums[column].value for column in COST_BREAKDOWN})
+
+    def overall_metrics(self):
+        return {
+            "Total Orders": self.orders,
+            "Total Revenue": self.sums['Revenue'].value,
+            "Total Costs": self.sums['Total Costs'].value,
+            "Total Profit": self.sums['Profit'].value
+        }
+
+
+def stream_orders(path, chunksize=1_000_000, mode=LEGACY, bin_width=1.0):
+    """Fold an orders CSV into a ProfitAccumulator, holding at most `chunksize` rows in memory."""
+    accumulator = ProfitAccumulator(bin_width)
+    for chunk in pd.read_csv(path, usecols=COST_COLUMNS, chunksize=chunksize):
+        accumulator.update(add_cost_columns(chunk, mode=mode))
+    return accumulator
@@ -24,12 +24,20 @@
 # In[4]:
 
 
+import os
+import sys
+
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import plotly.io as pio
-pio.templates.default = "plotly_white"
+
+# plotly is imported on first use and the figures are skipped when ANALYSIS_HEADLESS=1; the tables are recorded
+# with output.result (and pickled to ANALYSIS_RESULTS when it is set)
+sys.path.append(os.path.abspath(os.pardir))
+from script_output import ScriptOutput
+
+output = ScriptOutput("stock market", plotly_template="plotly_white")
+px = output.module('plotly.express')
+go = output.module('plotly.graph_objects')
+make_subplots = output.function('plotly.subplots', 'make_subplots')
 
 # Load the dataset
 stocks_data = pd.read_csv("stocks")
@@ -70,7 +78,7 @@ stocks_data['Ticker'].unique()
 # In[9]:
 
 
-descriptive_stats = stocks_data.groupby('Ticker')['Close'].describe()
+descriptive_stats = output.result('descriptive statistics', stocks_data.groupby('Ticker')['Close'].describe())
 
 
 # In[10]:
@@ -99,6 +107,17 @@ descriptive_stats
 # * NFLX (Netflix Inc.)
 #     * NFLX shows the highest mean closing price (327.61) among these stocks and the highest standard deviation (18.55), indicating the most significant price fluctuation.
 
+# * The per-ticker risk figures used below (price volatility, mean and standard deviation of daily returns, start-to-end change) come from one grouped pass over the long rows, so they never need the prices pivoted into a Date x Ticker matrix and the same code runs over thousands of tickers. The pivot below only feeds the time series plot and the correlation matrix.
+
+# In[11]:
+
+
+from risk_engine import risk_table
+
+risk_metrics = output.result('risk metrics', risk_table(stocks_data))
+risk_metrics
+
+
 # # Time Series Analysis
 
 # In[12]:
@@ -106,29 +125,30 @@ descriptive_stats
 
 # Time Series Analysis
 stocks_data['Date'] = pd.to_datetime(stocks_data['Date'])
-pivot_data = stocks_data.pivot(index='Date', columns='Ticker', values='Close')
-
-# Create a subplot
-fig = make_subplots(rows=1, cols=1)
-
-# Add traces for each stock ticker
-for column in pivot_data.columns:
-    fig.add_trace(
-        go.Scatter(x=pivot_data.index, y=pivot_data[column], name=column),
-        row=1, col=1
+pivot_data = output.result('closing prices', stocks_data.pivot(index='Date', columns='Ticker', values='Close'))
+
+if output.plots:
+    # Create a subplot
+    fig = make_subplots(rows=1, cols=1)
+
+    # Add traces for each stock ticker
+    for column in pivot_data.columns:
+        fig.add_trace(
+            go.Scatter(x=pivot_data.index, y=pivot_data[column], name=column),
+            row=1, col=1
+        )
+
+    # Update layout
+    fig.update_layout(
+        title_text='Time Series of Closing Prices',
+        xaxis_title='Date',
+        yaxis_title='Closing Price',
+        legend_title='Ticker',
+        showlegend=True
     )
 
-# Update layout
-fig.update_layout(
-    title_text='Time Series of Closing Prices',
-    xaxis_title='Date',
-    yaxis_title='Closing Price',
-    legend_title='Ticker',
-    showlegend=True
-)
-
-# Show the plot
-fig.show()
+    # Show the plot
+    fig.show()
 
 
 # * The above plot displays the time series of the closing prices for each stock (AAPL, GOOG, MSFT, NFLX) over the observed period. Here are some key observations:
@@ -143,16 +163,17 @@ fig.show()
 
 
 # Volatility Analysis
-volatility = pivot_data.std().sort_values(ascending=False)
+volatility = output.result('volatility', risk_metrics['Price Volatility'].sort_values(ascending=False))
 
-fig = px.bar(volatility,
-             x=volatility.index,
-             y=volatility.values,
-             labels={'y': 'Standard Deviation', 'x': 'Ticker'},
-             title='Volatility of Closing Prices (Standard Deviation)')
+if output.plots:
+    fig = px.bar(volatility,
+                 x=volatility.index,
+                 y=volatility.values,
+                 labels={'y': 'Standard Deviation', 'x': 'Ticker'},
+                 title='Volatility of Closing Prices (Standard Deviation)')
 
-# Show the figure
-fig.show()
+    # Show the figure
+    fig.show()
 
 
 # # Correlation Analysis
@@ -160,26 +181,40 @@ fig.show()
 # In[19]:
 
 
-# Correlation Analysis
-correlation_matrix = pivot_data.corr()
-
-fig = go.Figure(data=go.Heatmap(
-                    z=correlation_matrix,
-                    x=correlation_matrix.columns,
-                    y=correlation_matrix.columns,
-                    colorscale='blues',
-                    colorbar=dict(title='Correlation'),
-                    ))
+# Correlation Analysis: the matrix is computed in blocks of tickers (pairwise-complete over missing dates, as
+# pivot_data.corr()) and written to a memory-mapped file, so it scales to thousands of tickers
+from correlation import correlation_matrix as blocked_correlation, heatmap_view
+
+# process pools re-import this script in their workers where processes are spawned (Windows, macOS), so a pool is
+# only started when the script is the main program and never from a worker's import of it
+pool_processes = os.cpu_count() if __name__ == '__main__' else None
+correlation_file = blocked_correlation(stocks_data, "stocks_correlation.npy", processes=pool_processes)
+correlation_matrix = output.result('correlation matrix', correlation_file.to_frame())
+output.result('most correlated with AAPL', correlation_file.top_k('AAPL', k=3))
+
+if output.plots:
+    # tickers in hierarchical-cluster order; with more than 100 tickers, neighbouring tickers are averaged together
+    heatmap = heatmap_view(correlation_file)
+    fig = go.Figure(data=go.Heatmap(
+                        z=heatmap,
+                        x=heatmap.columns,
+                        y=heatmap.index,
+                        colorscale='blues',
+                        colorbar=dict(title='Correlation'),
+                        ))
+
+    # Update layout
+    fig.update_layout(
+        title='Correlation Matrix of Closing Prices',
+        xaxis_title='Ticker',
+        yaxis_title='Ticker'
+    )
 
-# Update layout
-fig.update_layout(
-    title='Correlation Matrix of Closing Prices',
-    xaxis_title='Ticker',
-    yaxis_title='Ticker'
-)
+    # Show the figure
+    fig.show()
 
-# Show the figure
-fig.show()
+# the tables above are copies, so the memory map can go
+correlation_file.close()
 
 
 # * Values close to +1 indicate a strong positive correlation, meaning that as one stock’s price increases, the other tends to increase as well.
@@ -198,16 +233,17 @@ pivot_data.tail()
 
 
 # Calculating the percentage change in closing prices
-percentage_change = ((pivot_data.iloc[-1] - pivot_data.iloc[0]) / pivot_data.iloc[0]) * 100
+percentage_change = output.result('percentage change', risk_metrics['Percentage Change'])
 
-fig = px.bar(percentage_change,
-             x=percentage_change.index,
-             y=percentage_change.values,
-             labels={'y': 'Percentage Change (%)', 'x': 'Ticker'},
-             title='Percentage Change in Closing Prices')
+if output.plots:
+    fig = px.bar(percentage_change,
+                 x=percentage_change.index,
+                 y=percentage_change.values,
+                 labels={'y': 'Percentage Change (%)', 'x': 'Ticker'},
+                 title='Percentage Change in Closing Prices')
 
-# Show the plot
-fig.show()
+    # Show the plot
+    fig.show()
 
 
 # * The bar chart and the accompanying data show the percentage change in the closing prices of the stocks from the start to the end of the observed period:
@@ -222,14 +258,13 @@ fig.show()
 # In[29]:
 
 
-daily_returns = pivot_data.pct_change().dropna()
-
-# Recalculating average daily return and standard deviation (risk)
-avg_daily_return = daily_returns.mean()
-risk = daily_returns.std()
+# average daily return and standard deviation (risk) of the daily returns of each ticker
+avg_daily_return = risk_metrics['Average Daily Return']
+risk = risk_metrics['Risk']
 
 # Creating a DataFrame for plotting
-risk_return_df = pd.DataFrame({'Risk': risk, 'Average Daily Return': avg_daily_return})
+risk_return_df = output.result('risk and return',
+                               pd.DataFrame({'Risk': risk, 'Average Daily Return': avg_daily_return}))
 
 
 # In[36]:
@@ -241,34 +276,82 @@ risk_return_df
 # In[37]:
 
 
-fig = go.Figure()
-
-# Add scatter plot points
-fig.add_trace(go.Scatter(
-    x=risk_return_df['Risk'],
-    y=risk_return_df['Average Daily Return'],
-    mode='markers+text',
-    text=risk_return_df.index,
-    textposition="top center",
-    marker=dict(size=10)
-))
-
-# Update layout
-fig.update_layout(
-    title='Risk vs. Return Analysis',
-    xaxis_title='Risk (Standard Deviation)',
-    yaxis_title='Average Daily Return',
-    showlegend=False
-)
+if output.plots:
+    fig = go.Figure()
+
+    # Add scatter plot points
+    fig.add_trace(go.Scatter(
+        x=risk_return_df['Risk'],
+        y=risk_return_df['Average Daily Return'],
+        mode='markers+text',
+        text=risk_return_df.index,
+        textposition="top center",
+        marker=dict(size=10)
+    ))
+
+    # Update layout
+    fig.update_layout(
+        title='Risk vs. Return Analysis',
+        xaxis_title='Risk (Standard Deviation)',
+        yaxis_title='Average Daily Return',
+        showlegend=False
+    )
 
-# Show the plot
-fig.show()
+    # Show the plot
+    fig.show()
 
 
 # So, AAPL shows the lowest risk combined with a positive average daily return, suggesting a more stable investment with consistent returns. GOOG has higher volatility than AAPL and, on average, a slightly negative daily return, indicating a riskier and less rewarding investment during this period.
 # 
 # MSFT shows moderate risk with the highest average daily return, suggesting a potentially more rewarding investment, although with higher volatility compared to AAPL. NFLX exhibits the highest risk and a negative average daily return, indicating it was the most volatile and least rewarding investment among these stocks over the analyzed period.
 
+# # Rolling Indicators
+
+# In[39]:
+
+
+# Rolling indicators over one week, two weeks and one month of trading days: moving average of the closing price,
+# volatility of the daily returns, their beta and correlation against the average daily return of the four stocks,
+# and drawdown from the highest close in the window. All window lengths come from one pass over pivot_data
+from indicators import LiveIndicators, rolling_indicators
+
+indicator_windows = (5, 10, 21)
+indicators = output.result('rolling indicators', rolling_indicators(pivot_data, windows=indicator_windows))
+
+if output.plots:
+    rolling_volatility = indicators['volatility'][21]
+    fig = go.Figure()
+    for column in rolling_volatility.columns:
+        fig.add_trace(go.Scatter(x=rolling_volatility.index, y=rolling_volatility[column], name=column))
+
+    fig.update_layout(
+        title='21-Day Rolling Volatility of Daily Returns',
+        xaxis_title='Date',
+        yaxis_title='Standard Deviation',
+        legend_title='Ticker'
+    )
+
+    # Show the plot
+    fig.show()
+
+
+# In[40]:
+
+
+# The same indicators kept up to date one bar at a time, as for live prices: the state after all but the last date,
+# then the last date appended. The result equals the last row of the table above
+live_indicators = LiveIndicators.from_history(pivot_data.iloc[:-1], windows=indicator_windows)
+live_indicators.append(pivot_data.iloc[-1])
+output.result('latest indicators', live_indicators.latest())
+
+
+# In[38]:
+
+
+# tables recorded above (pickled only when ANALYSIS_RESULTS is set)
+output.finish()
+
+
 # In[ ]:
 
 
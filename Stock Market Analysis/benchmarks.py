@@ -0,0 +1,212 @@
+# coding: utf-8
+
+# * Benchmarks for the stock market analysis, on stocks.csv and on synthetic long-format price panels shaped like it.
+# * Run one benchmark with `python benchmarks.py <name>`, or all of them with `python benchmarks.py`.
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from correlation import correlation_matrix, heatmap_view
+from indicators import INDICATORS, LiveIndicators, rolling_indicators
+from risk_engine import risk_table, stream_risk
+
+STOCKS_CSV = 'stocks.csv'
+TRADING_DAYS = 252
+INDICATOR_WINDOWS = (5, 10, 21, 42, 63, 84, 105, 126, 189, 252)
+
+
+def make_synthetic_prices(n_tickers, n_days, start='2004-01-02', seed=0):
+    # one geometric random walk per ticker over business days, in the long layout of stocks.csv sorted by ticker
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start, periods=n_days)
+    drift = rng.normal(0.0003, 0.0002, (n_tickers, 1))
+    volatility = rng.uniform(0.01, 0.03, (n_tickers, 1))
+    log_returns = drift + volatility * rng.standard_normal((n_tickers, n_days))
+    close = rng.uniform(20, 500, (n_tickers, 1)) * np.exp(np.cumsum(log_returns, axis=1))
+    spread = np.abs(rng.normal(0, 0.01, close.shape)) * close
+    open_ = close * (1 + rng.normal(0, 0.005, close.shape))
+    return pd.DataFrame({
+        'Ticker': np.repeat([f'T{i:05d}' for i in range(n_tickers)], n_days),
+        'Date': np.tile(dates.to_numpy(), n_tickers),
+        'Open': open_.ravel(),
+        'High': (np.maximum(open_, close) + spread).ravel(),
+        'Low': (np.minimum(open_, close) - spread).ravel(),
+        'Close': close.ravel(),
+        'Adj Close': close.ravel(),
+        'Volume': rng.integers(100_000, 50_000_000, close.size),
+    })
+
+
+def pivot_risk(stocks_data):
+    # the notebook's wide path: pivot to Date x Ticker, then whole-matrix pct_change / mean / std
+    pivot_data = stocks_data.pivot(index='Date', columns='Ticker', values='Close')
+    daily_returns = pivot_data.pct_change().dropna()
+    return pd.DataFrame({
+        'Mean Price': pivot_data.mean(),
+        'Price Volatility': pivot_data.std(),
+        'Average Daily Return': daily_returns.mean(),
+        'Risk': daily_returns.std(),
+        'Percentage Change': (pivot_data.iloc[-1] - pivot_data.iloc[0]) / pivot_data.iloc[0] * 100,
+    })
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def _traced(func, *args, **kwargs):
+    # (result, seconds, peak traced MB) of one call
+    tracemalloc.start()
+    try:
+        result, seconds = _timed(func, *args, **kwargs)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak / 2 ** 20
+
+
+def bench_risk(full=False, sizes=(4, 500, 5_000), days=TRADING_DAYS, chunksize=1_000_000):
+    # stocks.csv, then complete synthetic panels of `days` trading days; --full uses five years of days.
+    # Times and peak traced memory of the pivot path, the long-format engine and the engine streaming a CSV;
+    # 'max rel diff' compares every column of the engine with the pivot path
+    if full:
+        days = 5 * TRADING_DAYS
+    panels = [('stocks.csv', pd.read_csv(STOCKS_CSV))]
+    panels += [(f'{n}x{days}', make_synthetic_prices(n, days)) for n in sizes]
+    print(f"{'panel':>12} {'rows':>11} {'pivot (s)':>10} {'pivot MB':>9} {'engine (s)':>11} {'engine MB':>10} "
+          f"{'stream (s)':>11} {'stream MB':>10} {'speedup':>8} {'max rel diff':>13}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, prices in panels:
+            reference, pivot_time, pivot_peak = _traced(pivot_risk, prices.assign(Date=pd.to_datetime(prices['Date'])))
+            table, engine_time, engine_peak = _traced(risk_table, prices)
+            path = os.path.join(directory, 'prices.csv')
+            prices.to_csv(path, index=False)
+            streamed, stream_time, stream_peak = _traced(stream_risk, path, chunksize=chunksize)
+            # the CSV round trip may move the last bit of a price, so the stream is checked against the same file
+            if not streamed.equals(risk_table(pd.read_csv(path))):
+                raise AssertionError(f"{name}: streamed and in-memory risk tables differ")
+            columns = list(reference.columns)
+            difference = (np.abs(table[columns] - reference[columns]) / np.abs(reference[columns])).max().max()
+            print(f"{name:>12} {len(prices):>11,} {pivot_time:>10.3f} {pivot_peak:>9.1f} {engine_time:>11.3f} "
+                  f"{engine_peak:>10.1f} {stream_time:>11.3f} {stream_peak:>10.1f} "
+                  f"{pivot_time / engine_time:>7.1f}x {difference:>13.1e}")
+
+
+def bench_correlation(full=False, sizes=(4, 500, 5_000), days=TRADING_DAYS, missing=0.02, lookups=1_000):
+    # pivot().corr() against the blocked engine (pool of os.cpu_count() processes, float32 file) on synthetic panels
+    # with a share of the rows removed and the same share of the remaining Close prices set to NaN, so the
+    # pairwise-complete path and the masking of missing prices are exercised; --full uses five years of days.
+    # Also the mean top-10 lookup time and the time of a clustered 100 x 100 heatmap view
+    if full:
+        days = 5 * TRADING_DAYS
+    rng = np.random.default_rng(0)
+    print(f"{'panel':>12} {'rows':>11} {'pivot corr (s)':>15} {'pivot MB':>9} {'engine (s)':>11} {'engine MB':>10} "
+          f"{'file MB':>8} {'top-10 (ms)':>12} {'heatmap (s)':>12} {'speedup':>8} {'max abs diff':>13}")
+    with tempfile.TemporaryDirectory() as directory:
+        for n in sizes:
+            prices = make_synthetic_prices(n, days)
+            prices = prices[rng.random(len(prices)) >= missing].reset_index(drop=True)
+            prices.loc[rng.random(len(prices)) < missing, 'Close'] = np.nan
+            reference, pivot_time, pivot_peak = _traced(
+                lambda: prices.pivot(index='Date', columns='Ticker', values='Close').corr())
+            path = os.path.join(directory, f'correlation_{n}.npy')
+            matrix, engine_time, engine_peak = _traced(correlation_matrix, prices, path, processes=os.cpu_count())
+            tickers = matrix.tickers[rng.integers(0, len(matrix), lookups)]
+            start = time.perf_counter()
+            for ticker in tickers:
+                matrix.top_k(ticker, 10)
+            top_time = (time.perf_counter() - start) / lookups
+            _, heatmap_time = _timed(heatmap_view, matrix)
+            difference = np.nanmax(np.abs(matrix.to_frame().to_numpy() - reference.to_numpy()))
+            same_missing = (np.isnan(matrix.to_frame().to_numpy()) == np.isnan(reference.to_numpy())).all()
+            if not same_missing:
+                raise AssertionError(f"{n} tickers: NaN pattern differs from DataFrame.corr()")
+            if difference > 1e-5:
+                raise AssertionError(f"{n} tickers: correlations differ from DataFrame.corr() by {difference:.1e}")
+            print(f"{f'{n}x{days}':>12} {len(prices):>11,} {pivot_time:>15.3f} {pivot_peak:>9.1f} {engine_time:>11.3f} "
+                  f"{engine_peak:>10.1f} {os.path.getsize(path) / 2 ** 20:>8.1f} {top_time * 1000:>12.3f} "
+                  f"{heatmap_time:>12.3f} {pivot_time / engine_time:>7.1f}x {difference:>13.1e}")
+            matrix.close()
+
+
+def pandas_indicators(pivot_data, windows):
+    # each indicator and window through pandas rolling, against the tickers' average daily return as the market
+    returns = pivot_data.pct_change()
+    market = returns.mean(axis=1)
+    frames = {}
+    for window in windows:
+        rolling = returns.rolling(window)
+        frames['sma', window] = pivot_data.rolling(window).mean()
+        frames['volatility', window] = rolling.std()
+        frames['beta', window] = rolling.cov(market).div(market.rolling(window).var(), axis=0)
+        frames['correlation', window] = rolling.corr(market)
+        frames['drawdown', window] = pivot_data / pivot_data.rolling(window).max() - 1
+    return frames
+
+
+def bench_indicators(full=False, sizes=(4, 500, 5_000), days=TRADING_DAYS, windows=INDICATOR_WINDOWS, missing=0.01,
+                     bars=50):
+    # pandas rolling against rolling_indicators for every indicator over the ten window lengths, on synthetic panels
+    # with a share of the rows removed; --full uses two years of days. The live state is built from all but the last
+    # `bars` dates and then appended the rest one bar at a time: mean time per bar, and indicator values updated per
+    # second. 'max diff' is the largest difference to pandas relative to the largest value of the indicator
+    if full:
+        days = 2 * TRADING_DAYS
+    rng = np.random.default_rng(0)
+    print(f"{'panel':>12} {'pandas (s)':>11} {'pandas MB':>10} {'batch (s)':>10} {'batch MB':>9} {'speedup':>8} "
+          f"{'max diff':>9} {'append (ms)':>12} {'updates/s':>10} {'live diff':>10}")
+    for n in sizes:
+        prices = make_synthetic_prices(n, days)
+        prices = prices[rng.random(len(prices)) >= missing]
+        pivot_data = prices.pivot(index='Date', columns='Ticker', values='Close')
+        reference, pandas_time, pandas_peak = _traced(pandas_indicators, pivot_data, windows)
+        result, batch_time, batch_peak = _traced(rolling_indicators, pivot_data, windows)
+        difference = 0.0
+        for (name, window), frame in reference.items():
+            expected, actual = frame.to_numpy(), result[name][window].to_numpy()
+            if not (np.isnan(expected) == np.isnan(actual)).all():
+                raise AssertionError(f"{n} tickers: NaN pattern of {name} over {window} days differs from pandas")
+            if np.isfinite(expected).any():
+                difference = max(difference, np.nanmax(np.abs(actual - expected)) / np.nanmax(np.abs(expected)))
+        del reference
+
+        live = LiveIndicators.from_history(pivot_data.iloc[:-bars], windows)
+        rows = pivot_data.iloc[-bars:].to_numpy()
+        start = time.perf_counter()
+        for row in rows:
+            live.append(row)
+        append_time = (time.perf_counter() - start) / bars
+        last = result.iloc[-1].unstack('Ticker').reindex(live.latest().index).to_numpy()
+        live_difference = np.nanmax(np.abs(live.latest().to_numpy() - last) / np.maximum(np.abs(last), 1.0))
+        updates = n * len(windows) * len(INDICATORS) / append_time
+        print(f"{f'{n}x{days}':>12} {pandas_time:>11.3f} {pandas_peak:>10.1f} {batch_time:>10.3f} {batch_peak:>9.1f} "
+              f"{pandas_time / batch_time:>7.1f}x {difference:>9.1e} {append_time * 1000:>12.3f} {updates:>10.2e} "
+              f"{live_difference:>10.1e}")
+
+
+BENCHMARKS = {
+    'risk': bench_risk,
+    'correlation': bench_correlation,
+    'indicators': bench_indicators,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks for the stock market analysis.')
+    parser.add_argument('names', nargs='*', help=f"benchmarks to run, any of {', '.join(BENCHMARKS)}")
+    parser.add_argument('--full', action='store_true', help='also run the largest panels')
+    args = parser.parse_args()
+
+    for name in args.names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark {name!r}")
+        print(f"# {name}")
+        BENCHMARKS[name](full=args.full)
@@ -0,0 +1,215 @@
+# coding: utf-8
+
+# * Blocked, out-of-core Pearson correlation of many tickers, with pairwise-complete handling of missing dates as in
+#   DataFrame.corr().
+# * The long price rows are written once into a Ticker x Date panel on disk. Each ticker's row holds its values
+#   standardized over its own observations, with NaN on dates it did not trade. Standardizing leaves every correlation
+#   unchanged and keeps the sums below well conditioned.
+# * The matrix is filled in stripes of BLOCK_TICKERS rows, spread over a process pool. A stripe is correlated against
+#   the tickers from its own first row onwards, BLOCK_TICKERS at a time, and written to both halves of the symmetric
+#   output, so no two stripes write the same cells. For a block pair where neither side is missing any date, the
+#   correlation is a single matrix product of the standardized rows. Otherwise the pairwise counts and sums over the
+#   common dates come from six products with the observation masks.
+# * The result is a .npy file (np.load(path, mmap_mode='r') works) with the tickers and observation counts in a JSON
+#   file beside it. CorrelationMatrix reads single rows for pairs and top-k lookups, so the matrix is never loaded
+#   whole. heatmap_view orders the tickers by hierarchical clustering and averages the matrix into a small grid for
+#   plotting.
+
+import json
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from risk_engine import PRICE_COLUMN, TickerBlocks, segment_mean_std
+
+BLOCK_TICKERS = 256
+MATRIX_DTYPE = np.float32
+HEATMAP_SIZE = 100
+
+_worker_state = None
+
+
+def _init_worker(panel_path, matrix_path, min_periods):
+    global _worker_state
+    _worker_state = (np.load(panel_path, mmap_mode='r'), np.load(matrix_path, mmap_mode='r+'), min_periods)
+
+
+def _sidecar(path):
+    return f'{path}.json'
+
+
+def _panel(prices, value, path):
+    # Ticker x Date panel of standardized values (NaN where a ticker has no row), tickers in sorted order
+    blocks = TickerBlocks(prices, value)
+    order = np.argsort(blocks.tickers.to_numpy(), kind='stable')
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    dates = np.unique(blocks.dates)
+    means, stds = segment_mean_std(blocks.prices, blocks.counts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scale = np.where(stds > 0, 1 / stds, np.nan)
+    values = (blocks.prices - np.repeat(means, blocks.counts)) * np.repeat(scale, blocks.counts)
+    panel = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=(len(order), len(dates)))
+    panel[:] = np.nan
+    panel[np.repeat(rank, blocks.counts), np.searchsorted(dates, blocks.dates)] = values
+    panel.flush()
+    return blocks.tickers[order], blocks.counts[order]
+
+
+def _block_correlation(x, y, min_periods):
+    # pairwise-complete Pearson correlation between the rows of two standardized panel blocks
+    x_mask, y_mask = ~np.isnan(x), ~np.isnan(y)
+    if x_mask.all() and y_mask.all():
+        return x @ y.T / (x.shape[1] - 1)
+    x_mask, y_mask = x_mask.astype(np.float64), y_mask.astype(np.float64)
+    x, y = np.where(x_mask > 0, x, 0.0), np.where(y_mask > 0, y, 0.0)
+    count = x_mask @ y_mask.T
+    sum_x, sum_y = x @ y_mask.T, x_mask @ y.T
+    sum_xx, sum_yy = (x * x) @ y_mask.T, x_mask @ (y * y).T
+    sum_xy = x @ y.T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = count * sum_xy - sum_x * sum_y
+        variance = (count * sum_xx - sum_x * sum_x) * (count * sum_yy - sum_y * sum_y)
+        correlation = covariance / np.sqrt(variance)
+    correlation[(count < max(min_periods, 2)) | ~(variance > 0)] = np.nan
+    return np.clip(correlation, -1.0, 1.0)
+
+
+def _correlate_stripe(start, stop, block=BLOCK_TICKERS, state=None):
+    panel, matrix, min_periods = _worker_state if state is None else state
+    rows = np.asarray(panel[start:stop])
+    for column in range(start, len(panel), block):
+        columns = rows if column == start else np.asarray(panel[column:column + block])
+        correlation = _block_correlation(rows, columns, min_periods)
+        matrix[start:stop, column:column + len(columns)] = correlation
+        matrix[column:column + len(columns), start:stop] = correlation.T
+    matrix.flush()
+    return stop - start
+
+
+def correlation_matrix(prices, path, value=PRICE_COLUMN, block=BLOCK_TICKERS, processes=None, min_periods=1,
+                       dtype=MATRIX_DTYPE):
+    """Write the ticker x ticker correlation of `value` in long-format `prices` to `path` (.npy) and open it.
+
+    With `processes` > 1 the stripes are spread across a process pool. Pairs with fewer than `min_periods` common
+    dates, and tickers with a constant value, get NaN, as in DataFrame.corr().
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.TemporaryDirectory(dir=directory) as scratch:
+        panel_path = os.path.join(scratch, 'panel.npy')
+        tickers, observations = _panel(prices, value, panel_path)
+        n = len(tickers)
+        matrix = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(n, n))
+        del matrix
+        stripes = [(start, min(start + block, n)) for start in range(0, n, block)]
+        if processes is not None and processes > 1 and len(stripes) > 1:
+            with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                     initargs=(panel_path, path, min_periods)) as pool:
+                list(pool.map(_correlate_stripe, *zip(*stripes), [block] * len(stripes)))
+        else:
+            state = (np.load(panel_path, mmap_mode='r'), np.load(path, mmap_mode='r+'), min_periods)
+            for start, stop in stripes:
+                _correlate_stripe(start, stop, block, state)
+            del state
+    with open(_sidecar(path), 'w') as file:
+        json.dump({'value': value, 'tickers': tickers.tolist(), 'observations': observations.tolist()}, file)
+    return CorrelationMatrix(path)
+
+
+class CorrelationMatrix:
+    """Read-only, memory-mapped correlation matrix written by correlation_matrix()."""
+
+    def __init__(self, path):
+        self.path = path
+        self.values = np.load(path, mmap_mode='r')
+        with open(_sidecar(path)) as file:
+            header = json.load(file)
+        self.value = header['value']
+        self.tickers = pd.Index(header['tickers'], name='Ticker')
+        self.observations = pd.Series(header['observations'], index=self.tickers, name='Observations')
+        if self.values.shape != (len(self.tickers),) * 2:
+            raise ValueError(f"{path} does not match the {len(self.tickers)} tickers of {_sidecar(path)}")
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def close(self):
+        del self.values
+
+    def _position(self, ticker):
+        return self.tickers.get_loc(ticker)
+
+    def row(self, ticker):
+        """Correlations of one ticker with every ticker (one row of the file)."""
+        return pd.Series(np.asarray(self.values[self._position(ticker)], dtype=np.float64), index=self.tickers,
+                         name=ticker)
+
+    def pair(self, first, second):
+        return float(self.values[self._position(first), self._position(second)])
+
+    def top_k(self, ticker, k=10, absolute=False):
+        """The `k` tickers most correlated with `ticker` (by |correlation| when `absolute`), strongest first."""
+        position = self._position(ticker)
+        row = np.asarray(self.values[position], dtype=np.float64)
+        score = np.abs(row) if absolute else row.copy()
+        score[position] = np.nan
+        score = np.where(np.isnan(score), -np.inf, score)
+        k = min(k, int(np.isfinite(score).sum()))
+        if k <= 0:
+            return pd.Series([], index=self.tickers[:0], name=ticker, dtype=np.float64)
+        best = np.argpartition(-score, k - 1)[:k]
+        best = best[np.lexsort((best, -score[best]))]
+        return pd.Series(row[best], index=self.tickers[best], name=ticker)
+
+    def submatrix(self, tickers):
+        positions = self.tickers.get_indexer(tickers)
+        if (positions < 0).any():
+            raise KeyError(f"unknown tickers {list(pd.Index(tickers)[positions < 0])}")
+        values = np.asarray(self.values[positions][:, positions], dtype=np.float64)
+        return pd.DataFrame(values, index=self.tickers[positions], columns=self.tickers[positions])
+
+    def to_frame(self):
+        return self.submatrix(self.tickers)
+
+
+def cluster_order(matrix, block=BLOCK_TICKERS):
+    """Positions of the tickers in the leaf order of an average-linkage clustering on 1 - correlation (NaN counts as
+    uncorrelated)."""
+    from scipy.cluster.hierarchy import leaves_list, linkage
+
+    n = len(matrix)
+    if n < 3:
+        return np.arange(n)
+    # condensed upper triangle, filled one stripe of rows at a time
+    distances = np.empty(n * (n - 1) // 2)
+    offset = 0
+    for start in range(0, n, block):
+        rows = np.asarray(matrix.values[start:start + block], dtype=np.float64)
+        for i, row in enumerate(rows, start):
+            tail = 1 - np.nan_to_num(row[i + 1:], nan=0.0)
+            distances[offset:offset + len(tail)] = tail
+            offset += len(tail)
+    return leaves_list(linkage(np.clip(distances, 0, 2), method='average'))
+
+
+def heatmap_view(matrix, max_size=HEATMAP_SIZE, cluster=True, block=BLOCK_TICKERS):
+    """At most max_size x max_size frame for a heatmap: tickers in cluster order (or sorted), averaged over groups of
+    consecutive tickers when there are more than `max_size`. A group is labelled by its first ticker and its size."""
+    order = cluster_order(matrix, block) if cluster else np.arange(len(matrix))
+    groups = np.array_split(np.arange(len(order)), min(max_size, len(order)))
+    sizes = np.array([len(group) for group in groups])
+    starts = np.cumsum(sizes) - sizes
+    view = np.empty((len(groups), len(groups)))
+    for g, group in enumerate(groups):
+        rows = np.asarray(matrix.values[np.sort(order[group])], dtype=np.float64)[:, order]
+        valid = ~np.isnan(rows)
+        sums = np.add.reduceat(np.where(valid, rows, 0.0).sum(axis=0), starts)
+        counts = np.add.reduceat(valid.sum(axis=0), starts)
+        with np.errstate(invalid='ignore'):
+            view[g] = sums / counts
+    labels = [matrix.tickers[order[group[0]]] if len(group) == 1
+              else f'{matrix.tickers[order[group[0]]]} (+{len(group) - 1})' for group in groups]
+    return pd.DataFrame(view, index=labels, columns=labels)
@@ -0,0 +1,268 @@
+# coding: utf-8
+
+# * Rolling indicators of a Date x Ticker price frame (the notebook's pivot_data) over many window lengths at once:
+#   moving average of the price, volatility of the daily returns, beta and correlation of the daily returns against a
+#   market return, and drawdown from the highest price in the window.
+# * Every indicator except the drawdown is a function of a few window sums: the number of observations, and the sums,
+#   squares and cross products of prices and returns. _terms gives the contribution of each row to those sums. The
+#   batch path takes one cumulative sum of the terms, so the sums over every window length come from differences of
+#   the same array. LiveIndicators keeps the sums of each window and, for each new bar, adds its terms and removes
+#   those of the bar leaving the window. That is O(1) work per ticker, window and indicator.
+# * Prices are summed relative to each ticker's first price, so the variances are not lost to cancellation. The live
+#   sums are recomputed from the buffered bars once every max(windows) + 1 bars, which bounds the rounding drift of
+#   the running updates.
+# * The rolling maximum behind the drawdown uses the van Herk / Gil-Werman scheme. Rows are cut into blocks of the
+#   window length. The maximum over a window is the larger of a suffix maximum of one block and a prefix maximum of
+#   the next. The batch path takes both with np.maximum.accumulate. The live path keeps a running prefix and computes
+#   the suffixes of a block once it is complete.
+# * The results follow pandas rolling: a window needs `min_periods` observations (the window length by default),
+#   standard deviations are sample ones (ddof=1), and beta and correlation use the dates where both the ticker and the
+#   market have a return.
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+INDICATORS = ('sma', 'volatility', 'beta', 'correlation', 'drawdown')
+WINDOWS = (5, 21, 63, 126, 252)
+
+# rows of the _terms stack
+(_PRICE_COUNT, _PRICE_SUM, _RETURN_COUNT, _RETURN_SUM, _RETURN_SQUARES, _PAIR_COUNT, _PAIR_SUM, _MARKET_SUM,
+ _PAIR_SQUARES, _MARKET_SQUARES, _CROSS) = range(11)
+
+
+def _terms(price, previous, market, shift):
+    """Contribution of each row to the window sums, stacked along a new first axis; the arguments broadcast."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = price / previous - 1
+    has_price, has_return = ~np.isnan(price), ~np.isnan(returns)
+    pair = has_return & ~np.isnan(market)
+    shifted = np.where(has_price, price - shift, 0.0)
+    returns = np.where(has_return, returns, 0.0)
+    x, y = np.where(pair, returns, 0.0), np.where(pair, market, 0.0)
+    return np.stack([has_price, shifted, has_return, returns, returns * returns, pair, x, y, x * x, y * y, x * y])
+
+
+def _indicators(sums, price, window_max, shift, min_periods, names):
+    """The named indicators from the window sums of _terms; NaN with fewer than `min_periods` observations."""
+    values = []
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for name in names:
+            if name == 'sma':
+                count = sums[_PRICE_COUNT]
+                value = shift + sums[_PRICE_SUM] / count
+            elif name == 'volatility':
+                count = sums[_RETURN_COUNT]
+                variance = (sums[_RETURN_SQUARES] - sums[_RETURN_SUM] ** 2 / count) / (count - 1)
+                value = np.sqrt(np.maximum(variance, 0.0))
+            elif name in ('beta', 'correlation'):
+                count = sums[_PAIR_COUNT]
+                covariance = sums[_CROSS] - sums[_PAIR_SUM] * sums[_MARKET_SUM] / count
+                market_variance = sums[_MARKET_SQUARES] - sums[_MARKET_SUM] ** 2 / count
+                if name == 'beta':
+                    value = covariance / market_variance
+                else:
+                    variance = np.maximum(sums[_PAIR_SQUARES] - sums[_PAIR_SUM] ** 2 / count, 0.0)
+                    value = covariance / np.sqrt(variance * np.maximum(market_variance, 0.0))
+            elif name == 'drawdown':
+                count = sums[_PRICE_COUNT]
+                value = price / window_max - 1
+            else:
+                raise ValueError(f"unknown indicator {name!r}, expected one of {INDICATORS}")
+            needed = min_periods if name in ('sma', 'drawdown') else np.maximum(min_periods, 2)
+            values.append(np.where(count >= needed, value, np.nan))
+    return values
+
+
+def _check(windows, indicators, min_periods):
+    windows = tuple(int(window) for window in windows)
+    if not windows or min(windows) < 1:
+        raise ValueError("windows must be positive lengths")
+    unknown = [name for name in indicators if name not in INDICATORS]
+    if unknown:
+        raise ValueError(f"unknown indicators {unknown}, expected any of {INDICATORS}")
+    if min_periods is None:
+        min_periods = np.array(windows)
+    else:
+        min_periods = np.minimum(np.array(windows), min_periods)
+    return windows, tuple(indicators), min_periods
+
+
+def _first_prices(prices):
+    # each ticker's first price (NaN for a ticker without one), the reference the price sums are taken from
+    has_price = ~np.isnan(prices)
+    first = prices[np.argmax(has_price, axis=0), np.arange(prices.shape[1])]
+    return np.where(has_price.any(axis=0), first, np.nan)
+
+
+def _market_returns(returns, market, pivot_data):
+    # per-date market return: the tickers' average by default, a ticker's own returns, or a given return series
+    if market is None:
+        with warnings.catch_warnings():
+            # dates on which no ticker has a return get NaN
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return np.nanmean(returns, axis=1)
+    if isinstance(market, str):
+        return returns[:, pivot_data.columns.get_loc(market)]
+    return pd.Series(market).reindex(pivot_data.index).to_numpy(dtype=np.float64)
+
+
+def rolling_maximum(values, window):
+    """Maximum of each trailing `window` of rows of a 2-d array, NaN ignored (-inf where a window has no values)."""
+    values = np.where(np.isnan(values), -np.inf, values)
+    rows = len(values)
+    padded = np.concatenate([values, np.full((-rows % window,) + values.shape[1:], -np.inf)])
+    blocks = padded.reshape((-1, window) + values.shape[1:])
+    prefix = np.maximum.accumulate(blocks, axis=1).reshape(padded.shape)[:rows]
+    suffix = np.maximum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(padded.shape)[:rows]
+    maximum = prefix.copy()
+    if rows >= window:
+        maximum[window - 1:] = np.maximum(suffix[:rows - window + 1], prefix[window - 1:])
+    return maximum
+
+
+def rolling_indicators(pivot_data, windows=WINDOWS, indicators=INDICATORS, market=None, min_periods=None):
+    """Rolling indicators of a Date x Ticker price frame for every window length, as a frame with the columns
+    (Indicator, Window, Ticker), so that result['volatility'][21] is a Date x Ticker frame.
+
+    `market` is the market's daily return for beta and correlation: a Series indexed by date, the name of a column
+    of `pivot_data`, or None for the average daily return of all the tickers.
+    """
+    windows, indicators, min_periods = _check(windows, indicators, min_periods)
+    prices = pivot_data.to_numpy(dtype=np.float64)
+    previous = np.vstack([np.full((1, prices.shape[1]), np.nan), prices[:-1]])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = prices / previous - 1
+    market_returns = _market_returns(returns, market, pivot_data)[:, None]
+    shift = _first_prices(prices)
+
+    cumulative = _terms(prices, previous, market_returns, np.nan_to_num(shift))
+    np.cumsum(cumulative, axis=1, out=cumulative)
+    result = np.empty((len(prices), len(indicators), len(windows), prices.shape[1]))
+    sums = np.empty_like(cumulative)
+    for position, window in enumerate(windows):
+        sums[:, :window] = cumulative[:, :window]
+        np.subtract(cumulative[:, window:], cumulative[:, :-window], out=sums[:, window:])
+        window_max = rolling_maximum(prices, window) if 'drawdown' in indicators else None
+        values = _indicators(sums, prices, window_max, shift, min_periods[position], indicators)
+        for which, value in enumerate(values):
+            result[:, which, position] = value
+    columns = pd.MultiIndex.from_product([list(indicators), list(windows), pivot_data.columns],
+                                         names=['Indicator', 'Window', 'Ticker'])
+    return pd.DataFrame(result.reshape(len(prices), -1), index=pivot_data.index, columns=columns, copy=False)
+
+
+class LiveIndicators:
+    """Rolling indicators kept up to date one bar at a time.
+
+    append() takes one price per ticker (NaN for a ticker without a bar) and updates every window with O(1) work per
+    ticker and indicator; latest() returns the indicators as of the last bar, equal to the last row of
+    rolling_indicators() over the same bars.
+    """
+
+    def __init__(self, tickers, windows=WINDOWS, indicators=INDICATORS, market=None, min_periods=None):
+        self.windows, self.indicators, self._min_periods = _check(windows, indicators, min_periods)
+        self.tickers = pd.Index(tickers, name='Ticker')
+        self.market = market
+        self._market_column = self.tickers.get_loc(market) if isinstance(market, str) else None
+        self.steps = 0
+        n, size = len(self.tickers), max(self.windows) + 1
+        self._window_array = np.array(self.windows)
+        # the last max(windows) + 1 bars: a return needs the bar before the oldest one in a window
+        self._prices = np.full((size, n), np.nan)
+        self._market = np.full(size, np.nan)
+        self._shift = np.full(n, np.nan)
+        self._sums = np.zeros((11, len(self.windows), n))
+        self._prefix = np.full((len(self.windows), n), -np.inf)
+        self._suffix = [np.full((window, n), -np.inf) for window in self.windows]
+        self._latest = np.full((len(self.indicators), len(self.windows), n), np.nan)
+
+    @classmethod
+    def from_history(cls, pivot_data, windows=WINDOWS, indicators=INDICATORS, market=None, min_periods=None):
+        """State after the bars of a Date x Ticker price frame (only the last 2 * max(windows) + 1 are replayed).
+
+        A `market` Series supplies the returns of the history; a column name or None is used as in append().
+        """
+        live = cls(pivot_data.columns, windows, indicators, None if isinstance(market, pd.Series) else market,
+                   min_periods)
+        replay = min(len(pivot_data), 2 * max(live.windows) + 1)
+        # the blocks of the rolling maximum are counted from the first bar of the history
+        live.steps = len(pivot_data) - replay
+        market_returns = market.reindex(pivot_data.index) if isinstance(market, pd.Series) else None
+        for position in range(len(pivot_data) - replay, len(pivot_data)):
+            live.append(pivot_data.iloc[position].to_numpy(dtype=np.float64),
+                        None if market_returns is None else market_returns.iloc[position])
+        return live
+
+    def _row(self, prices):
+        if isinstance(prices, pd.Series):
+            prices = prices.reindex(self.tickers)
+        prices = np.asarray(prices, dtype=np.float64)
+        if prices.shape != (len(self.tickers),):
+            raise ValueError(f"expected one price for each of the {len(self.tickers)} tickers")
+        return prices
+
+    def append(self, prices, market_return=None):
+        """Add one bar: a price per ticker (a Series indexed by ticker, or an array in ticker order), and the market
+        return of the bar when the indicators were set up with market=None and should not use the average."""
+        price = self._row(prices)
+        step, size = self.steps, len(self._prices)
+        previous = self._prices[(step - 1) % size]
+        if market_return is None:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                returns = price / previous - 1
+            if self._market_column is not None:
+                market_return = returns[self._market_column]
+            elif np.isnan(returns).all():
+                market_return = np.nan
+            else:
+                market_return = np.nanmean(returns)
+        new_tickers = np.isnan(self._shift) & ~np.isnan(price)
+        self._shift[new_tickers] = price[new_tickers]
+        shift = np.nan_to_num(self._shift)
+
+        # bar `step - window` leaves each window; its slot is read before the new bar overwrites the oldest one
+        leaving = (step - self._window_array) % size
+        removed = _terms(self._prices[leaving], self._prices[(leaving - 1) % size], self._market[leaving][:, None],
+                         shift)
+        added = _terms(price, previous, np.float64(market_return), shift)
+        self._prices[step % size] = price
+        self._market[step % size] = market_return
+        self.steps = step + 1
+        if self.steps % size == 0:
+            self._resync(shift)
+        else:
+            self._sums += added[:, None] - removed
+
+        window_max = None
+        if 'drawdown' in self.indicators:
+            window_max = np.empty_like(self._prefix)
+            bounded = np.where(np.isnan(price), -np.inf, price)
+            for position, window in enumerate(self.windows):
+                offset = step % window
+                if offset == 0:
+                    # the block that just ended: its suffix maxima cover the older part of the next windows
+                    block = self._prices[(step - window + np.arange(window)) % size]
+                    block = np.where(np.isnan(block), -np.inf, block)
+                    self._suffix[position] = np.maximum.accumulate(block[::-1], axis=0)[::-1]
+                    self._prefix[position] = -np.inf
+                np.maximum(self._prefix[position], bounded, out=self._prefix[position])
+                older = self._suffix[position][offset + 1] if offset + 1 < window else -np.inf
+                window_max[position] = np.maximum(older, self._prefix[position])
+        self._latest[:] = _indicators(self._sums, price, window_max, self._shift, self._min_periods[:, None],
+                                      self.indicators)
+
+    def _resync(self, shift):
+        # window sums recomputed from the buffered bars, dropping the rounding drift of the running updates
+        size = len(self._prices)
+        steps = self.steps - 1 - np.arange(size - 1)
+        terms = _terms(self._prices[steps % size], self._prices[(steps - 1) % size],
+                       self._market[steps % size][:, None], shift)
+        np.cumsum(terms, axis=1, out=terms)
+        self._sums = terms[:, self._window_array - 1]
+
+    def latest(self):
+        """Indicators as of the last bar: rows (Indicator, Window), one column per ticker."""
+        index = pd.MultiIndex.from_product([list(self.indicators), list(self.windows)], names=['Indicator', 'Window'])
+        return pd.DataFrame(self._latest.reshape(-1, len(self.tickers)), index=index, columns=self.tickers)
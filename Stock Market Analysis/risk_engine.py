@@ -0,0 +1,159 @@
+# coding: utf-8
+
+# * Per-ticker returns and risk computed straight from long-format price rows (Ticker, Date, ..., Close), without
+#   pivoting them into a dense Date x Ticker matrix.
+# * Rows are arranged as one contiguous block per ticker in date order: the layout of a price export sorted by ticker.
+#   The layout is checked, and restored with one stable sort when it does not hold. A daily return is then the ratio of
+#   neighbouring rows of the same block, and every per-ticker statistic is a segment sum (np.add.reduceat) over the
+#   blocks, so all tickers are handled in one vectorized pass.
+# * Rows without a price (NaN) are dropped before the blocks are built, as pandas' statistics skip NaN: a missing
+#   Close neither blanks its ticker's figures nor splits its returns, which run from the observation before the gap
+#   to the one after it.
+# * Standard deviations are two-pass (squared deviations from the block mean) with ddof=1, as in pandas.
+# * Returns are taken between consecutive observations of a ticker. On a complete panel, where every ticker trades on
+#   every date, this reproduces the pivot path exactly. With gaps, the pivot path's pct_change().dropna() would drop
+#   every date that any one ticker missed.
+# * stream_risk reads a CSV sorted by ticker in chunks and carries the last, possibly incomplete, ticker of each chunk
+#   over to the next. Memory is bounded by the chunk size plus the longest single history.
+
+import numpy as np
+import pandas as pd
+
+PRICE_COLUMN = 'Close'
+RISK_COLUMNS = ['Observations', 'First Date', 'Last Date', 'Mean Price', 'Price Volatility', 'Average Daily Return',
+                'Risk', 'Percentage Change']
+
+
+class TickerBlocks:
+    """Price rows arranged as one date-ordered block per ticker.
+
+    `tickers` names the blocks in order, `counts` holds their lengths, and `dates` and `prices` are the rows in block
+    order. Rows with a NaN price are left out, so a ticker without any price has no block.
+    """
+
+    def __init__(self, prices, price=PRICE_COLUMN):
+        missing = [column for column in ('Ticker', 'Date', price) if column not in prices.columns]
+        if missing:
+            raise KeyError(f"price rows need the columns {missing}")
+        # the stored ticker array without a copy (to_numpy would convert a string column element by element)
+        tickers = np.asarray(prices['Ticker'].array)
+        dates = prices['Date']
+        dates = (dates if pd.api.types.is_datetime64_dtype(dates) else pd.to_datetime(dates)).to_numpy()
+        values = prices[price].to_numpy(dtype=np.float64)
+        priced = ~np.isnan(values)
+        if not priced.all():
+            tickers, dates, values = tickers[priced], dates[priced], values[priced]
+
+        # grouped input is recognised from neighbouring rows alone; anything else is factorized and sorted once
+        new_block = np.empty(len(tickers), dtype=bool)
+        new_block[:1] = True
+        np.not_equal(tickers[1:], tickers[:-1], out=new_block[1:])
+        starts = np.flatnonzero(new_block)
+        step = np.diff(dates)[~new_block[1:]]
+        if not pd.Index(tickers[starts]).is_unique or (step <= np.timedelta64(0)).any():
+            codes = pd.factorize(tickers)[0]
+            order = np.lexsort((dates, codes))
+            tickers, dates, values = tickers[order], dates[order], values[order]
+            np.not_equal(tickers[1:], tickers[:-1], out=new_block[1:])
+            starts = np.flatnonzero(new_block)
+            step = np.diff(dates)[~new_block[1:]]
+        if (step == np.timedelta64(0)).any():
+            raise ValueError("a ticker has more than one row for the same date")
+        if pd.isna(tickers[starts]).any():
+            raise ValueError("'Ticker' must not be missing")
+
+        self.tickers = pd.Index(tickers[starts], name='Ticker')
+        self.counts = np.diff(np.append(starts, len(tickers)))
+        self.starts = starts
+        self.dates = dates
+        self.prices = values
+        self._continues = ~new_block[1:]
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def returns(self):
+        """(returns in block order, returns per ticker): one return per row after the first of its block."""
+        returns = self.prices[1:] / self.prices[:-1] - 1
+        return returns[self._continues], self.counts - 1
+
+
+def segment_sums(values, counts):
+    """Sums of consecutive segments of `values` with the given lengths (0 for an empty segment)."""
+    starts = np.cumsum(counts) - counts
+    # the appended zero keeps the start of a trailing empty segment inside the array
+    sums = np.add.reduceat(np.append(values, 0.0), np.minimum(starts, len(values)))
+    return np.where(counts > 0, sums, 0.0)
+
+
+def segment_mean_std(values, counts):
+    """Mean and sample standard deviation (ddof=1) of each segment; NaN where a segment is too short."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = segment_sums(values, counts) / counts
+        deviations = values - np.repeat(means, counts)
+        variances = segment_sums(deviations * deviations, counts) / (counts - 1)
+    means = np.where(counts > 0, means, np.nan)
+    return means, np.sqrt(np.where(counts > 1, variances, np.nan))
+
+
+def daily_returns(prices, price=PRICE_COLUMN):
+    """Long table of daily returns: one row per (ticker, date) after each ticker's first observation."""
+    blocks = prices if isinstance(prices, TickerBlocks) else TickerBlocks(prices, price)
+    returns, counts = blocks.returns()
+    later = np.ones(len(blocks.dates), dtype=bool)
+    later[blocks.starts] = False
+    return pd.DataFrame({
+        'Ticker': np.repeat(blocks.tickers.to_numpy(), counts),
+        'Date': blocks.dates[later],
+        'Return': returns,
+    })
+
+
+def risk_table(prices, price=PRICE_COLUMN):
+    """Per-ticker observations, price level and volatility, mean and standard deviation of daily returns, and the
+    first-to-last percentage change, indexed by ticker in sorted order."""
+    blocks = prices if isinstance(prices, TickerBlocks) else TickerBlocks(prices, price)
+    counts = blocks.counts
+    ends = blocks.starts + counts - 1
+    mean_price, price_volatility = segment_mean_std(blocks.prices, counts)
+    returns, return_counts = blocks.returns()
+    mean_return, risk = segment_mean_std(returns, return_counts)
+    first, last = blocks.prices[blocks.starts], blocks.prices[ends]
+    table = pd.DataFrame({
+        'Observations': counts,
+        'First Date': blocks.dates[blocks.starts],
+        'Last Date': blocks.dates[ends],
+        'Mean Price': mean_price,
+        'Price Volatility': price_volatility,
+        'Average Daily Return': mean_return,
+        'Risk': risk,
+        'Percentage Change': (last - first) / first * 100,
+    }, index=blocks.tickers)
+    return table.sort_index()
+
+
+def stream_risk(path, chunksize=1_000_000, price=PRICE_COLUMN):
+    """risk_table of a long-format CSV whose rows are grouped by ticker, read `chunksize` rows at a time."""
+    tables = []
+    finished = set()
+    carry = None
+    for chunk in pd.read_csv(path, usecols=['Ticker', 'Date', price], chunksize=chunksize):
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        tickers = np.asarray(chunk['Ticker'].array)
+        # the rows of the last ticker may continue in the next chunk
+        tail = len(tickers) - np.argmax(tickers[::-1] != tickers[-1]) if (tickers != tickers[-1]).any() else 0
+        carry = chunk.iloc[tail:]
+        if tail:
+            table = risk_table(chunk.iloc[:tail], price)
+            if finished.intersection(table.index):
+                raise ValueError(f"{path} is not grouped by ticker")
+            finished.update(table.index)
+            tables.append(table)
+    if carry is not None and len(carry):
+        if carry['Ticker'].iloc[0] in finished:
+            raise ValueError(f"{path} is not grouped by ticker")
+        tables.append(risk_table(carry, price))
+    if not tables:
+        return pd.DataFrame(columns=RISK_COLUMNS, index=pd.Index([], name='Ticker'))
+    return pd.concat(tables).sort_index()
@@ -11,7 +11,6 @@
 
 
 import pandas as pd
-import yfinance as yf
 import plotly.io as pio
 import plotly.graph_objects as go
 pio.templates.default = "plotly_white"
@@ -29,9 +28,16 @@ google_ticker = 'GOOGL'
 start_date = '2023-07-01'
 end_date = '2023-09-30'
 
-# Fetch historical stock price data using yfinance
-apple_data = yf.download(apple_ticker, start=start_date, end=end_date)
-google_data = yf.download(google_ticker, start=start_date, end=end_date)
+# Fetch historical stock price data through the local market-data store: the first run downloads the two stocks and
+# the S&P 500 benchmark in one batched yfinance request, later runs read them from disk (.market_data, or the
+# directory named by MARKET_DATA_STORE). Set MARKET_DATA_FILE to a stocks.csv-style file to read that instead of the
+# network
+from market_data import MarketDataStore
+
+store = MarketDataStore()
+histories = store.histories([apple_ticker, google_ticker, '^GSPC'], start_date, end_date)
+apple_data = histories[apple_ticker]
+google_data = histories[google_ticker]
 
 
 # In[3]:
@@ -131,7 +137,7 @@ fig.show()
 # In[22]:
 
 
-market_data = yf.download('^GSPC', start=start_date, end=end_date)  # S&P 500 index as the market benchmark
+market_data = store.history('^GSPC', start=start_date, end=end_date)  # S&P 500 index as the market benchmark
 
 
 # In[23]:
@@ -150,14 +156,41 @@ market_data.head()
 # In[25]:
 
 
-# Calculate Beta for Apple and Google
-cov_apple = apple_data['Daily_Return'].cov(market_data['Daily_Return'])
-var_market = market_data['Daily_Return'].var()
+# Calculate Beta for Apple and Google: all the stocks are put on the S&P 500's trading dates once and regressed on it
+# together, which also gives the alpha, R squared and residual volatility of each (any number of stocks or benchmarks)
+from factor_regression import aligned_returns, capm_table, rolling_capm
+
+stock_returns, benchmark_returns = aligned_returns(store.get([apple_ticker, google_ticker, '^GSPC'], start_date,
+                                                             end_date), '^GSPC')
+capm = capm_table(stock_returns, benchmark_returns).loc['^GSPC']
+
+beta_apple = capm.loc[apple_ticker, 'Beta']
+beta_google = capm.loc[google_ticker, 'Beta']
+
+
+# In[26]:
+
+
+capm
+
+
+# In[28]:
 
-beta_apple = cov_apple / var_market
 
-cov_google = google_data['Daily_Return'].cov(market_data['Daily_Return'])
-beta_google = cov_google / var_market
+# Beta of each stock over a rolling window of 21 trading days (about one month)
+rolling_beta = rolling_capm(stock_returns, benchmark_returns, window=21)['^GSPC']['Beta']
+
+fig = go.Figure()
+fig.add_trace(go.Scatter(x=rolling_beta.index, y=rolling_beta[apple_ticker],
+                         mode='lines', name='Apple', line=dict(color='blue')))
+fig.add_trace(go.Scatter(x=rolling_beta.index, y=rolling_beta[google_ticker],
+                         mode='lines', name='Google', line=dict(color='green')))
+
+fig.update_layout(title='21-Day Rolling Beta against the S&P 500',
+                  xaxis_title='Date', yaxis_title='Beta',
+                  legend=dict(x=0.02, y=0.95))
+
+fig.show()
 
 
 # In[27]:
@@ -0,0 +1,198 @@
+# coding: utf-8
+
+# * Benchmarks for the stock market comparison, run against a local fixture file (no network): a synthetic price
+#   file in the long layout of stocks.csv, read through FileSource.
+# * Run one benchmark with `python benchmarks.py <name>`, or all of them with `python benchmarks.py`.
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from factor_regression import aligned_returns, capm_table, rolling_capm
+from market_data import COLUMNS, FileSource, MarketDataStore
+
+TRADING_DAYS = 252
+BENCHMARK_TICKERS = ('^GSPC', '^NDX')
+
+
+def make_price_file(path, n_tickers, n_days, start='2019-01-02', seed=0):
+    # one geometric random walk per ticker over business days, written like stocks.csv (sorted by ticker)
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start, periods=n_days)
+    log_returns = rng.normal(0.0003, 0.02, (n_tickers, n_days))
+    close = rng.uniform(20, 500, (n_tickers, 1)) * np.exp(np.cumsum(log_returns, axis=1))
+    open_ = close * (1 + rng.normal(0, 0.005, close.shape))
+    spread = np.abs(rng.normal(0, 0.01, close.shape)) * close
+    prices = pd.DataFrame({
+        'Ticker': np.repeat([f'T{i:05d}' for i in range(n_tickers)], n_days),
+        'Date': np.tile(dates.strftime('%Y-%m-%d'), n_tickers),
+        'Open': open_.ravel(),
+        'High': (np.maximum(open_, close) + spread).ravel(),
+        'Low': (np.minimum(open_, close) - spread).ravel(),
+        'Close': close.ravel(),
+        'Adj Close': close.ravel(),
+        'Volume': rng.integers(100_000, 50_000_000, close.size),
+    })
+    prices.to_csv(path, index=False)
+    return dates
+
+
+class CountingSource:
+    """A source wrapper that counts the fetch calls and the rows they return."""
+
+    def __init__(self, source):
+        self.source = source
+        self.calls = 0
+        self.rows = 0
+
+    def fetch(self, tickers, start, end):
+        rows = self.source.fetch(tickers, start, end)
+        self.calls += 1
+        self.rows += len(rows)
+        return rows
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def bench_store(full=False, sizes=(3, 500, 5_000), days=2 * TRADING_DAYS, lookups=100):
+    # per panel: reading the fixture file for the first year (what every run pays without a store), then the store
+    # filled for the first year, the same request again from disk with a new store object, the request extended to
+    # both years (only the second year is fetched), and single-ticker reads. The calls and rows columns count what
+    # reached the source and must be one call cold, none warm and one call for exactly the second year's rows when
+    # extending; the result is checked against the file itself. --full uses five years of days
+    if full:
+        days = 5 * TRADING_DAYS
+    print(f"{'panel':>12} {'source (s)':>11} {'cold (s)':>9} {'calls':>6} {'warm (s)':>9} {'calls':>6} "
+          f"{'extend (s)':>11} {'calls':>6} {'rows fetched':>13} {'ticker (ms)':>12} {'store MB':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        for n in sizes:
+            path = os.path.join(directory, f'prices_{n}.csv')
+            dates = make_price_file(path, n, days)
+            tickers = [f'T{i:05d}' for i in range(n)]
+            middle, end = dates[len(dates) // 2], dates[-1] + pd.Timedelta(days=1)
+            _, source_time = _timed(lambda: FileSource(path).fetch(tickers, dates[0], middle))
+
+            root = os.path.join(directory, f'store_{n}')
+            source = CountingSource(FileSource(path))
+            _, cold_time = _timed(MarketDataStore(root, source).get, tickers, dates[0], middle)
+            cold_calls = source.calls
+
+            source = CountingSource(FileSource(path))
+            store = MarketDataStore(root, source)
+            _, warm_time = _timed(store.get, tickers, dates[0], middle)
+            warm_calls = source.calls
+            rows, extend_time = _timed(store.get, tickers, dates[0], end)
+
+            expected = FileSource(path).fetch(tickers, dates[0], end).reset_index(drop=True)
+            extended = int((expected['Date'] >= middle).sum())
+            if cold_calls != 1 or warm_calls != 0:
+                raise AssertionError(f"{n} tickers: {cold_calls} cold and {warm_calls} warm source calls, expected 1 "
+                                     f"and 0")
+            if source.calls != 1 or source.rows != extended:
+                raise AssertionError(f"{n} tickers: extending fetched {source.rows} rows in {source.calls} calls, "
+                                     f"expected {extended} rows in 1 call")
+            columns = ['Ticker', 'Date', *COLUMNS]
+            if not rows[columns].equals(expected[columns].astype(rows.dtypes)):
+                raise AssertionError(f"{n} tickers: stored rows differ from the fixture file")
+            chosen = np.random.default_rng(0).choice(tickers, lookups)
+            start = time.perf_counter()
+            for ticker in chosen:
+                store.history(ticker, dates[0], end)
+            ticker_time = (time.perf_counter() - start) / lookups
+            size = sum(os.path.getsize(os.path.join(root, name)) for name in os.listdir(root))
+            print(f"{f'{n}x{days}':>12} {source_time:>11.3f} {cold_time:>9.3f} {cold_calls:>6} {warm_time:>9.3f} "
+                  f"{warm_calls:>6} {extend_time:>11.3f} {source.calls:>6} {source.rows:>13,} "
+                  f"{ticker_time * 1000:>12.3f} {size / 2 ** 20:>9.1f}")
+
+
+def make_factor_prices(n_tickers, n_days, start='2019-01-02', seed=0):
+    # long-format Adj Close rows of two correlated benchmarks and of tickers that follow the first one with known
+    # betas, sorted by ticker as MarketDataStore.get() returns them
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start, periods=n_days)
+    market = rng.normal(0.0003, 0.01, n_days)
+    second = 0.8 * market + rng.normal(0.0002, 0.006, n_days)
+    betas = rng.uniform(0.2, 2.0, n_tickers)
+    noise = rng.normal(0, 0.015, (n_tickers, n_days))
+    returns = rng.normal(0.0001, 0.0002, (n_tickers, 1)) + betas[:, None] * market + noise
+    returns = np.vstack([returns, market, second])
+    prices = rng.uniform(20, 500, (len(returns), 1)) * np.cumprod(1 + returns, axis=1)
+    tickers = [f'T{i:05d}' for i in range(n_tickers)] + list(BENCHMARK_TICKERS)
+    order = np.argsort(tickers)
+    return pd.DataFrame({
+        'Ticker': np.repeat(np.array(tickers)[order], n_days),
+        'Date': np.tile(dates.to_numpy(), len(tickers)),
+        'Adj Close': prices[order].ravel(),
+    })
+
+
+def script_betas(returns, market_returns):
+    # the script's method, one ticker at a time: Series.cov(market) / market.var()
+    variance = market_returns.var()
+    return pd.Series({ticker: returns[ticker].cov(market_returns) / variance for ticker in returns.columns})
+
+
+def bench_regression(full=False, sizes=(2, 500, 5_000), days=5 * TRADING_DAYS, window=TRADING_DAYS, checked=20):
+    # five years of days for universes against two benchmarks: aligning the long rows once, the whole-period table
+    # for both benchmarks, and the rolling statistics over a one-year window; against the script's per-ticker
+    # cov / var loop for the first benchmark. 'loop diff' compares the betas with that loop, 'ols diff' compares beta,
+    # alpha, R squared and residual volatility with statsmodels OLS, and 'rolling diff' the rolling betas with pandas
+    # rolling cov / var, both on `checked` tickers. --full uses ten years of days
+    import statsmodels.api as sm
+
+    if full:
+        days = 10 * TRADING_DAYS
+    print(f"{'panel':>12} {'align (s)':>10} {'table (s)':>10} {'rolling (s)':>12} {'loop (s)':>9} {'speedup':>8} "
+          f"{'loop diff':>10} {'ols diff':>9} {'rolling diff':>13}")
+    for n in sizes:
+        prices = make_factor_prices(n, days)
+        (returns, benchmark_returns), align_time = _timed(aligned_returns, prices, BENCHMARK_TICKERS)
+        table, table_time = _timed(capm_table, returns, benchmark_returns)
+        rolling, rolling_time = _timed(rolling_capm, returns, benchmark_returns, window)
+        market = benchmark_returns[BENCHMARK_TICKERS[0]]
+        loop, loop_time = _timed(script_betas, returns, market)
+        betas = table.loc[BENCHMARK_TICKERS[0], 'Beta']
+        loop_difference = (np.abs(betas - loop) / np.abs(loop)).max()
+
+        ols_difference = rolling_difference = 0.0
+        for ticker in returns.columns[:checked]:
+            pair = pd.concat([returns[ticker], market], axis=1).dropna()
+            fit = sm.OLS(pair.iloc[:, 0], sm.add_constant(pair.iloc[:, 1])).fit()
+            expected = np.array([fit.params.iloc[1], fit.params.iloc[0], fit.rsquared, np.sqrt(fit.scale)])
+            actual = table.loc[(BENCHMARK_TICKERS[0], ticker), ['Beta', 'Alpha', 'R Squared', 'Residual Volatility']]
+            ols_difference = max(ols_difference, (np.abs(actual.to_numpy() - expected) / np.abs(expected)).max())
+            expected = (returns[ticker].rolling(window).cov(market) / market.rolling(window).var()).to_numpy()
+            actual = rolling[BENCHMARK_TICKERS[0]]['Beta'][ticker].to_numpy()
+            if not (np.isnan(actual) == np.isnan(expected)).all():
+                raise AssertionError(f"{ticker}: rolling beta NaN pattern differs from pandas")
+            rolling_difference = max(rolling_difference, np.nanmax(np.abs(actual - expected) / np.abs(expected)))
+        print(f"{f'{n}x{days}':>12} {align_time:>10.3f} {table_time:>10.3f} {rolling_time:>12.3f} {loop_time:>9.3f} "
+              f"{loop_time / table_time:>7.1f}x {loop_difference:>10.1e} {ols_difference:>9.1e} "
+              f"{rolling_difference:>13.1e}")
+
+
+BENCHMARKS = {
+    'store': bench_store,
+    'regression': bench_regression,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks for the stock market comparison.')
+    parser.add_argument('names', nargs='*', help=f"benchmarks to run, any of {', '.join(BENCHMARKS)}")
+    parser.add_argument('--full', action='store_true', help='also run the largest panels')
+    args = parser.parse_args()
+
+    for name in args.names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark {name!r}")
+        print(f"# {name}")
+        BENCHMARKS[name](full=args.full)
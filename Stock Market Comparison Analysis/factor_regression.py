@@ -0,0 +1,139 @@
+# coding: utf-8
+
+# * Single-factor (CAPM) regressions of every ticker's daily returns on one or more benchmarks' daily returns:
+#   r = alpha + beta * r_benchmark + residual, with the beta, alpha, R squared and residual volatility of each
+#   (ticker, benchmark) pair.
+# * aligned_returns puts the long price rows of the universe on the benchmark's trading dates once, as a Date x Ticker
+#   matrix of daily returns, with NaN where a ticker has no price. Every regression is then a function of six sums
+#   over the dates both sides have a return: the count, the two sums, the two sums of squares and the cross product.
+#   For all tickers against all benchmarks those sums are six matrix products of the returns and their observation
+#   masks.
+# * rolling_capm takes the same sums over a trailing window from one cumulative sum along the dates, so every date
+#   costs the same whatever the window length.
+# * Beta is the covariance with the benchmark over its variance on the same dates. On complete data this equals the
+#   script's Series.cov(market) / market.var(). The residual volatility is the standard error of the regression: the
+#   residuals' root mean square with n - 2 degrees of freedom. Alpha and the volatility are per day.
+
+import numpy as np
+import pandas as pd
+
+PRICE_COLUMN = 'Adj Close'
+STATISTICS = ('Observations', 'Beta', 'Alpha', 'R Squared', 'Residual Volatility')
+
+
+def aligned_returns(prices, benchmarks, price=PRICE_COLUMN):
+    """(ticker returns, benchmark returns): Date x Ticker frames of daily returns on the dates where every benchmark
+    has a price, from long-format rows (Ticker, Date, `price`) such as MarketDataStore.get() returns.
+
+    The benchmarks are left out of the ticker returns. A ticker's return on a date is NaN when it has no price on that
+    date or on the date before.
+    """
+    benchmarks = [benchmarks] if isinstance(benchmarks, str) else list(benchmarks)
+    missing = [column for column in ('Ticker', 'Date', price) if column not in prices.columns]
+    if missing:
+        raise KeyError(f"price rows need the columns {missing}")
+    codes, tickers = pd.factorize(np.asarray(prices['Ticker'].array), sort=True)
+    tickers = pd.Index(tickers)
+    absent = [benchmark for benchmark in benchmarks if benchmark not in tickers]
+    if absent:
+        raise KeyError(f"no price rows for the benchmarks {absent}")
+    dates = pd.to_datetime(prices['Date']).to_numpy()
+    values = prices[price].to_numpy(dtype=np.float64)
+
+    # the benchmark index: dates on which every benchmark has a price
+    benchmark_codes = tickers.get_indexer(benchmarks)
+    index = None
+    for code in benchmark_codes:
+        own = np.unique(dates[(codes == code) & ~np.isnan(values)])
+        index = own if index is None else np.intersect1d(index, own)
+    if not len(index):
+        raise ValueError(f"the benchmarks {benchmarks} have no date with a price in common")
+    position = np.minimum(np.searchsorted(index, dates), len(index) - 1)
+    keep = index[position] == dates
+
+    matrix = np.full((len(index), len(tickers)), np.nan)
+    matrix[position[keep], codes[keep]] = values[keep]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = np.vstack([np.full((1, len(tickers)), np.nan), matrix[1:] / matrix[:-1] - 1])
+    index = pd.DatetimeIndex(index, name='Date')
+    universe = np.setdiff1d(np.arange(len(tickers)), benchmark_codes)
+    return (pd.DataFrame(returns[:, universe], index=index, columns=pd.Index(tickers[universe], name='Ticker')),
+            pd.DataFrame(returns[:, benchmark_codes], index=index, columns=pd.Index(benchmarks, name='Benchmark')))
+
+
+def _regression(count, sum_x, sum_y, sum_xx, sum_yy, sum_xy, min_periods):
+    """Regression statistics of x on y from their sums over common observations (arrays of any matching shape)."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covariance = sum_xy - sum_x * sum_y / count
+        variance_x = np.maximum(sum_xx - sum_x * sum_x / count, 0.0)
+        variance_y = sum_yy - sum_y * sum_y / count
+        beta = np.where(variance_y > 0, covariance / variance_y, np.nan)
+        alpha = (sum_x - beta * sum_y) / count
+        r_squared = np.clip(covariance * covariance / (variance_x * variance_y), 0.0, 1.0)
+        residual = np.sqrt(np.maximum(variance_x - beta * covariance, 0.0) / (count - 2))
+    enough = count >= max(min_periods, 2)
+    return {
+        'Observations': count,
+        'Beta': np.where(enough, beta, np.nan),
+        'Alpha': np.where(enough, alpha, np.nan),
+        'R Squared': np.where(enough & (variance_x > 0), r_squared, np.nan),
+        'Residual Volatility': np.where(enough & (count > 2), residual, np.nan),
+    }
+
+
+def _benchmark_frame(benchmark_returns, index):
+    if isinstance(benchmark_returns, pd.Series):
+        benchmark_returns = benchmark_returns.to_frame(benchmark_returns.name or 'Benchmark')
+    return benchmark_returns.reindex(index)
+
+
+def capm_table(returns, benchmark_returns, min_periods=2):
+    """Observations, beta, alpha, R squared and residual volatility of every ticker against every benchmark over the
+    whole period, indexed by (Benchmark, Ticker).
+
+    `returns` is a Date x Ticker frame of daily returns and `benchmark_returns` a frame with one column per
+    benchmark (or a Series) on the same dates. Each pair uses the dates where both have a return.
+    """
+    benchmark_returns = _benchmark_frame(benchmark_returns, returns.index)
+    x, y = returns.to_numpy(dtype=np.float64), benchmark_returns.to_numpy(dtype=np.float64)
+    x_mask, y_mask = ~np.isnan(x), ~np.isnan(y)
+    x, y = np.where(x_mask, x, 0.0), np.where(y_mask, y, 0.0)
+    x_mask, y_mask = x_mask.astype(np.float64), y_mask.astype(np.float64)
+    # Ticker x Benchmark sums over the dates both have a return
+    statistics = _regression(x_mask.T @ y_mask, x.T @ y_mask, x_mask.T @ y, (x * x).T @ y_mask, x_mask.T @ (y * y),
+                             x.T @ y, min_periods)
+    index = pd.MultiIndex.from_product([benchmark_returns.columns, returns.columns], names=['Benchmark', 'Ticker'])
+    table = pd.DataFrame({name: statistics[name].T.ravel() for name in STATISTICS}, index=index)
+    return table.astype({'Observations': np.int64})
+
+
+def rolling_capm(returns, benchmark_returns, window, min_periods=None, statistics=STATISTICS):
+    """The capm_table statistics over every trailing `window` of dates, as a frame with the columns
+    (Benchmark, Statistic, Ticker), so that result['^GSPC']['Beta'] is a Date x Ticker frame of rolling betas.
+
+    A window needs `min_periods` common dates (the window length by default), as in pandas rolling.
+    """
+    unknown = [name for name in statistics if name not in STATISTICS]
+    if unknown:
+        raise ValueError(f"unknown statistics {unknown}, expected any of {STATISTICS}")
+    if window < 2:
+        raise ValueError("window must cover at least 2 dates")
+    min_periods = window if min_periods is None else min(min_periods, window)
+    benchmark_returns = _benchmark_frame(benchmark_returns, returns.index)
+    returns_matrix = returns.to_numpy(dtype=np.float64)
+    x_mask = ~np.isnan(returns_matrix)
+    result = np.empty((len(returns), benchmark_returns.shape[1], len(statistics), returns.shape[1]))
+    for column in range(benchmark_returns.shape[1]):
+        y = benchmark_returns.iloc[:, column].to_numpy(dtype=np.float64)[:, None]
+        pair = x_mask & ~np.isnan(y)
+        x_pair, y_pair = np.where(pair, returns_matrix, 0.0), np.where(pair, y, 0.0)
+        sums = np.stack([pair, x_pair, y_pair, x_pair * x_pair, y_pair * y_pair, x_pair * y_pair]).astype(np.float64)
+        del x_pair, y_pair
+        np.cumsum(sums, axis=1, out=sums)
+        sums[:, window:] -= sums[:, :-window].copy()
+        values = _regression(*sums, min_periods)
+        for position, name in enumerate(statistics):
+            result[:, column, position] = values[name]
+    columns = pd.MultiIndex.from_product([benchmark_returns.columns, list(statistics), returns.columns],
+                                         names=['Benchmark', 'Statistic', 'Ticker'])
+    return pd.DataFrame(result.reshape(len(returns), -1), index=returns.index, columns=columns, copy=False)
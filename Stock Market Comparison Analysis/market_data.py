@@ -0,0 +1,307 @@
+# coding: utf-8
+
+# * Local store of daily price rows (Ticker, Date, Open, High, Low, Close, Adj Close, Volume), filled from a pluggable
+#   source: YFinanceSource downloads from Yahoo Finance, and FileSource reads a long-format CSV or Parquet file such as
+#   stocks.csv, for offline runs and benchmarks. A source is any object with fetch(tickers, start, end) that returns
+#   the rows of those tickers with start <= Date < end.
+# * The store records the date ranges it has fetched for each ticker. A request fetches only the ranges it does not
+#   cover yet, and tickers missing the same range are fetched together in one call to the source. Ranges are only
+#   recorded up to today, so the bar of the current day is fetched again until the day is over.
+# * The store lives under DEFAULT_ROOT in the working directory unless a root is given or MARKET_DATA_STORE names
+#   another directory, e.g. a shared cache.
+# * A source raises when it could not fetch a ticker (YFinanceSource does when yf.download reports a failed download),
+#   so the range is not recorded and the next request fetches it again. An empty result is taken as no rows in the
+#   range (weekends, holidays, dates before a listing).
+# * Rows are partitioned by calendar year. Each year is one .npy file of records sorted by ticker and date, so a ticker
+#   is one contiguous slice of it. A read memory-maps the year file, finds the slices of all the requested tickers with
+#   one binary search, and copies only those rows: a request for many tickers is one read per year. New rows are
+#   merged into the year file, which is rewritten to a .partial file and moved into place. The fetched ranges are
+#   saved after the rows, so an interrupted update is fetched again rather than served incomplete.
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ('Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume')
+SOURCE_VARIABLE = 'MARKET_DATA_FILE'
+STORE_VARIABLE = 'MARKET_DATA_STORE'
+DEFAULT_ROOT = '.market_data'
+FORMAT_VERSION = 1
+
+# the yf.download errors that only mean a ticker has no rows in the range, rather than a failed download
+NO_DATA_ERRORS = ('no price data found', 'no data found')
+
+
+def _dates(values):
+    # dates as timezone-naive datetime64[ns] (yfinance may return exchange-local timestamps)
+    dates = pd.to_datetime(pd.Series(values))
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    return dates.astype('datetime64[ns]').to_numpy()
+
+
+def _record_dtype(width):
+    return np.dtype([('Ticker', f'U{width}'), ('Date', 'M8[ns]')] + [(column, 'f8') for column in COLUMNS])
+
+
+def _records(rows):
+    """Long-format price rows as a record array; columns the rows do not have are NaN."""
+    tickers = rows['Ticker'].astype(str).to_numpy()
+    records = np.empty(len(rows), dtype=_record_dtype(max([1] + [len(ticker) for ticker in set(tickers)])))
+    records['Ticker'] = tickers
+    records['Date'] = _dates(rows['Date'])
+    for column in COLUMNS:
+        records[column] = rows[column].to_numpy(dtype=np.float64) if column in rows.columns else np.nan
+    return records
+
+
+def _frame(records):
+    return pd.DataFrame({name: records[name] for name in records.dtype.names})
+
+
+def _merge(old, new):
+    # union of two record arrays sorted by ticker and date; a (ticker, date) in both keeps the new row
+    width = max(old.dtype['Ticker'].itemsize, new.dtype['Ticker'].itemsize) // 4
+    records = np.concatenate([old.astype(_record_dtype(width)), new.astype(_record_dtype(width))])
+    # lexsort is stable, so the new row of a duplicate comes last
+    records = records[np.lexsort((records['Date'], records['Ticker']))]
+    last = np.ones(len(records), dtype=bool)
+    last[:-1] = (records['Ticker'][1:] != records['Ticker'][:-1]) | (records['Date'][1:] != records['Date'][:-1])
+    return records[last]
+
+
+def _gaps(covered, start, end):
+    """Parts of [start, end) outside the sorted, disjoint ranges `covered`."""
+    gaps = []
+    for first, last in covered:
+        if last <= start:
+            continue
+        if first >= end:
+            break
+        if first > start:
+            gaps.append((start, first))
+        start = max(start, last)
+        if start >= end:
+            break
+    if start < end:
+        gaps.append((start, end))
+    return gaps
+
+
+def _cover(covered, start, end):
+    """`covered` with [start, end) added, overlapping and touching ranges merged."""
+    merged = []
+    for first, last in sorted(covered + [(start, end)]):
+        if merged and first <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+class FileSource:
+    """Price rows from a long-format CSV or Parquet file (Ticker, Date and any of COLUMNS, as in stocks.csv).
+
+    The file is read on the first fetch and kept in memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._rows = None
+
+    def _load(self):
+        if self._rows is None:
+            if os.fspath(self.path).endswith(('.parquet', '.pq')):
+                rows = pd.read_parquet(self.path)
+            else:
+                # round_trip parsing gives back exactly the floats that were written
+                rows = pd.read_csv(self.path, float_precision='round_trip')
+            missing = [column for column in ('Ticker', 'Date') if column not in rows.columns]
+            if missing:
+                raise KeyError(f"{self.path} needs the columns {missing}")
+            rows['Date'] = _dates(rows['Date'])
+            self._rows = rows
+        return self._rows
+
+    def fetch(self, tickers, start, end):
+        rows = self._load()
+        return rows[rows['Ticker'].isin(list(tickers)) & (rows['Date'] >= start) & (rows['Date'] < end)]
+
+
+class YFinanceSource:
+    """Daily prices from Yahoo Finance; every ticker of a fetch is one yf.download call.
+
+    yfinance is imported on the first fetch. `options` are passed on to yf.download. Tickers yf.download failed to
+    fetch raise OSError, apart from those it reports as having no data in the range.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+
+    def fetch(self, tickers, start, end):
+        import yfinance as yf
+
+        tickers = list(tickers)
+        frame = yf.download(tickers, start=start, end=end, group_by='ticker', auto_adjust=False, progress=False,
+                            **self.options)
+        # yf.download logs its failures to yf.shared._ERRORS (ticker -> message) and returns NaN columns for them
+        errors = {ticker.upper(): str(message) for ticker, message in getattr(yf.shared, '_ERRORS', {}).items()}
+        failed = {ticker: errors[ticker.upper()] for ticker in tickers if ticker.upper() in errors
+                  and not any(text in errors[ticker.upper()].lower() for text in NO_DATA_ERRORS)}
+        if failed:
+            raise OSError(f"yfinance could not fetch {list(failed)} for {start} to {end}: {failed}")
+        if frame is None or frame.empty:
+            return pd.DataFrame(columns=['Ticker', 'Date', *COLUMNS])
+        if not isinstance(frame.columns, pd.MultiIndex):
+            # older yfinance versions return flat columns for a single ticker
+            frame.columns = pd.MultiIndex.from_product([tickers, frame.columns])
+        rows = frame.stack(level=0).rename_axis(['Date', 'Ticker']).reset_index()
+        rows.columns.name = None
+        return rows.dropna(subset=[column for column in COLUMNS if column in rows.columns], how='all')
+
+
+def default_source():
+    """FileSource of the file named by MARKET_DATA_FILE when it is set (offline runs), otherwise YFinanceSource."""
+    path = os.environ.get(SOURCE_VARIABLE)
+    return FileSource(path) if path else YFinanceSource()
+
+
+def default_root():
+    """The directory named by MARKET_DATA_STORE when it is set, otherwise DEFAULT_ROOT."""
+    return os.environ.get(STORE_VARIABLE) or DEFAULT_ROOT
+
+
+class MarketDataStore:
+    """Daily price rows kept under the directory `root` (default_root() by default) and filled from `source` for the
+    ranges not fetched before.
+
+    Dates follow yf.download: `start` is included and `end` is not.
+    """
+
+    def __init__(self, root=None, source=None):
+        root = default_root() if root is None else root
+        self.root = root
+        self.source = default_source() if source is None else source
+        os.makedirs(root, exist_ok=True)
+        self._coverage = {}
+        path = self._coverage_path()
+        if os.path.exists(path):
+            with open(path) as file:
+                header = json.load(file)
+            if header.get('version') != FORMAT_VERSION:
+                raise ValueError(f"{path} has format version {header.get('version')}, expected {FORMAT_VERSION}")
+            self._coverage = {ticker: [(pd.Timestamp(first), pd.Timestamp(last)) for first, last in ranges]
+                              for ticker, ranges in header['tickers'].items()}
+
+    def _coverage_path(self):
+        return os.path.join(self.root, 'coverage.json')
+
+    def _partition_path(self, year):
+        return os.path.join(self.root, f'{year}.npy')
+
+    @staticmethod
+    def _years(start, end):
+        return range(start.year, (end - pd.Timedelta(1, 'ns')).year + 1)
+
+    def coverage(self, ticker):
+        """The date ranges fetched for `ticker`, as sorted (start, end) pairs."""
+        return list(self._coverage.get(ticker, []))
+
+    def missing(self, tickers, start, end):
+        """The ranges of [start, end) not fetched yet, each with the tickers that miss it."""
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        gaps = {}
+        for ticker in dict.fromkeys(tickers):
+            for gap in _gaps(self._coverage.get(ticker, []), start, end):
+                gaps.setdefault(gap, []).append(ticker)
+        return gaps
+
+    def update(self, tickers, start, end):
+        """Fetch the ranges of [start, end) the store does not have yet; returns the number of rows fetched.
+
+        When the source raises, nothing is written and no range is recorded.
+        """
+        gaps = self.missing(tickers, start, end)
+        if not gaps:
+            return 0
+        fetched = []
+        for (first, last), missing in gaps.items():
+            rows = self.source.fetch(missing, first, last)
+            if len(rows):
+                rows = rows.assign(Date=_dates(rows['Date']))
+                # only what was asked for, whatever the source returned
+                fetched.append(rows[rows['Ticker'].isin(missing) & (rows['Date'] >= first) & (rows['Date'] < last)])
+        records = _records(pd.concat(fetched, ignore_index=True)) if fetched else np.empty(0, _record_dtype(1))
+        if len(records):
+            self._write(records)
+        today = pd.Timestamp.today().normalize()
+        for (first, last), missing in gaps.items():
+            last = min(last, today)
+            if first < last:
+                for ticker in missing:
+                    self._coverage[ticker] = _cover(self._coverage.get(ticker, []), first, last)
+        self._save_coverage()
+        return len(records)
+
+    def _write(self, records):
+        years = records['Date'].astype('M8[Y]').astype(np.int64) + 1970
+        for year in np.unique(years):
+            path = self._partition_path(year)
+            new = records[years == year]
+            rows = _merge(np.load(path), new) if os.path.exists(path) else _merge(new[:0], new)
+            partial = f'{path}.partial'
+            with open(partial, 'wb') as file:
+                np.save(file, rows)
+            os.replace(partial, path)
+
+    def _save_coverage(self):
+        path = self._coverage_path()
+        header = {'version': FORMAT_VERSION,
+                  'tickers': {ticker: [[first.isoformat(), last.isoformat()] for first, last in ranges]
+                              for ticker, ranges in sorted(self._coverage.items())}}
+        with open(f'{path}.partial', 'w') as file:
+            json.dump(header, file)
+        os.replace(f'{path}.partial', path)
+
+    def _read(self, year, tickers, start, end):
+        # rows of `tickers` in one year file: one binary search for all of them, then only their slices are read
+        path = self._partition_path(year)
+        if not os.path.exists(path):
+            return None
+        records = np.load(path, mmap_mode='r')
+        width = records.dtype['Ticker'].itemsize // 4
+        wanted = np.array(sorted(ticker for ticker in tickers if len(ticker) <= width), dtype=f'U{width}')
+        names = records['Ticker']
+        first, last = np.searchsorted(names, wanted, 'left'), np.searchsorted(names, wanted, 'right')
+        counts = last - first
+        positions = np.repeat(first - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+        rows = records[positions]
+        return rows[(rows['Date'] >= start) & (rows['Date'] < end)]
+
+    def get(self, tickers, start, end, fetch=True):
+        """Long-format rows of `tickers` with start <= Date < end, sorted by ticker and date; the ranges not in the
+        store are fetched first unless `fetch` is False."""
+        tickers = [tickers] if isinstance(tickers, str) else list(dict.fromkeys(tickers))
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        if fetch:
+            self.update(tickers, start, end)
+        parts = [self._read(year, tickers, start.to_datetime64(), end.to_datetime64())
+                 for year in self._years(start, end)]
+        parts = [_frame(part) for part in parts if part is not None and len(part)]
+        if not parts:
+            return _frame(np.empty(0, dtype=_record_dtype(1)))
+        # the years come in date order, so a stable sort by ticker keeps each ticker's dates sorted
+        return pd.concat(parts, ignore_index=True).sort_values('Ticker', kind='stable', ignore_index=True)
+
+    def histories(self, tickers, start, end, fetch=True):
+        """One frame per ticker, indexed by Date with the columns of yf.download, from one batched get()."""
+        rows = self.get(tickers, start, end, fetch)
+        histories = {ticker: rows.iloc[0:0] for ticker in ([tickers] if isinstance(tickers, str) else tickers)}
+        for ticker, frame in rows.groupby('Ticker', sort=False):
+            histories[ticker] = frame
+        return {ticker: frame.drop(columns='Ticker').set_index('Date') for ticker, frame in histories.items()}
+
+    def history(self, ticker, start, end, fetch=True):
+        return self.histories([ticker], start, end, fetch)[ticker]
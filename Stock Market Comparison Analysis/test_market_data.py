@@ -0,0 +1,141 @@
+# coding: utf-8
+
+# * Tests of the market data store against a small price file through FileSource, so they never touch the network.
+#
+#     python -m pytest -q test_market_data.py
+
+import sys
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from market_data import COLUMNS, FileSource, MarketDataStore, YFinanceSource
+
+TICKERS = ['A', '^GSPC']
+
+
+class CountingSource:
+    """FileSource that records the (tickers, start, end) of every fetch."""
+
+    def __init__(self, path):
+        self.source = FileSource(path)
+        self.calls = []
+
+    def fetch(self, tickers, start, end):
+        self.calls.append((sorted(tickers), pd.Timestamp(start), pd.Timestamp(end)))
+        return self.source.fetch(tickers, start, end)
+
+
+@pytest.fixture
+def price_file(tmp_path):
+    # business days from November 2020 to February 2021, so ranges can cross the turn of the year
+    dates = pd.bdate_range('2020-11-02', '2021-02-26')
+    rows = pd.DataFrame({'Ticker': np.repeat(TICKERS, len(dates)), 'Date': np.tile(dates, len(TICKERS))})
+    for number, column in enumerate(COLUMNS):
+        rows[column] = np.arange(len(rows), dtype=np.float64) + number / 10
+    path = tmp_path / 'prices.csv'
+    rows.to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture
+def source(price_file):
+    return CountingSource(price_file)
+
+
+@pytest.fixture
+def store(tmp_path, source):
+    return MarketDataStore(tmp_path / 'store', source)
+
+
+def expected_rows(price_file, tickers, start, end):
+    return FileSource(price_file).fetch(tickers, pd.Timestamp(start), pd.Timestamp(end)).reset_index(drop=True)
+
+
+def assert_rows(rows, expected):
+    pd.testing.assert_frame_equal(rows[['Ticker', 'Date', *COLUMNS]].reset_index(drop=True),
+                                  expected[['Ticker', 'Date', *COLUMNS]], check_dtype=False)
+
+
+def test_fetches_only_the_missing_ranges(store, source, price_file):
+    store.get('A', '2020-11-09', '2020-11-20')
+    rows = store.get(['A', '^GSPC'], '2020-11-02', '2020-12-01')
+    assert source.calls == [
+        (['A'], pd.Timestamp('2020-11-09'), pd.Timestamp('2020-11-20')),
+        # 'A' misses the weeks either side of what it has, '^GSPC' the whole range
+        (['A'], pd.Timestamp('2020-11-02'), pd.Timestamp('2020-11-09')),
+        (['A'], pd.Timestamp('2020-11-20'), pd.Timestamp('2020-12-01')),
+        (['^GSPC'], pd.Timestamp('2020-11-02'), pd.Timestamp('2020-12-01')),
+    ]
+    assert_rows(rows, expected_rows(price_file, TICKERS, '2020-11-02', '2020-12-01'))
+
+
+def test_range_across_two_years(store, price_file, tmp_path):
+    rows = store.get(TICKERS, '2020-12-15', '2021-01-15')
+    assert sorted(path.name for path in (tmp_path / 'store').glob('*.npy')) == ['2020.npy', '2021.npy']
+    assert rows['Date'].dt.year.unique().tolist() == [2020, 2021]
+    assert_rows(rows, expected_rows(price_file, TICKERS, '2020-12-15', '2021-01-15'))
+
+
+def test_warm_read_makes_no_source_calls(store, tmp_path, price_file):
+    store.get(TICKERS, '2020-11-02', '2021-02-01')
+    source = CountingSource(price_file)
+    rows = MarketDataStore(tmp_path / 'store', source).get(TICKERS, '2020-12-01', '2021-01-20')
+    assert source.calls == []
+    assert_rows(rows, expected_rows(price_file, TICKERS, '2020-12-01', '2021-01-20'))
+
+
+def test_longer_ticker_after_shorter(store, price_file):
+    # the year files are first written with 1-character tickers, so adding '^GSPC' has to widen them
+    store.get('A', '2020-12-01', '2021-01-15')
+    store.get('^GSPC', '2020-12-01', '2021-01-15')
+    rows = store.get(TICKERS, '2020-12-01', '2021-01-15', fetch=False)
+    assert_rows(rows, expected_rows(price_file, TICKERS, '2020-12-01', '2021-01-15'))
+
+
+def test_histories_of_an_unknown_ticker(store):
+    histories = store.histories(['A', 'ZZZ'], '2020-11-02', '2020-12-01')
+    assert len(histories['A']) == len(pd.bdate_range('2020-11-02', '2020-11-30'))
+    assert histories['ZZZ'].empty
+    assert list(histories['ZZZ'].columns) == list(COLUMNS)
+    assert store.coverage('ZZZ') == [(pd.Timestamp('2020-11-02'), pd.Timestamp('2020-12-01'))]
+
+
+def test_empty_range(store, source):
+    rows = store.get(TICKERS, '2020-12-01', '2020-12-01')
+    assert rows.empty
+    assert source.calls == []
+    assert store.coverage('A') == []
+
+
+def test_failed_fetch_records_no_range(store, source):
+    def fail(tickers, start, end):
+        raise OSError('network down')
+
+    source.fetch = fail
+    with pytest.raises(OSError):
+        store.get('A', '2020-11-02', '2020-12-01')
+    assert store.coverage('A') == []
+    assert MarketDataStore(store.root, source).coverage('A') == []
+
+
+def _fake_yfinance(errors):
+    # stands in for yfinance: no rows, and the given per-ticker errors in yf.shared._ERRORS
+    def download(tickers, **options):
+        return pd.DataFrame()
+
+    return types.SimpleNamespace(download=download, shared=types.SimpleNamespace(_ERRORS=errors))
+
+
+def test_yfinance_failures_raise(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'yfinance', _fake_yfinance({'AAPL': "ConnectionError('timed out')"}))
+    with pytest.raises(OSError, match='AAPL'):
+        YFinanceSource().fetch(['AAPL', 'MSFT'], '2020-11-02', '2020-12-01')
+
+
+def test_yfinance_empty_range_is_not_a_failure(monkeypatch):
+    message = "YFPricesMissingError('$AAPL: possibly delisted; no price data found')"
+    monkeypatch.setitem(sys.modules, 'yfinance', _fake_yfinance({'AAPL': message}))
+    assert YFinanceSource().fetch(['AAPL'], '2020-11-07', '2020-11-09').empty
@@ -0,0 +1,133 @@
+# coding: utf-8
+
+# * Headless execution and result capture shared by the analysis scripts.
+# * Plotting libraries are requested through `output.module('plotly.express')` (or `output.function(...)` for a
+#   single callable) and only imported on first use, so a run that draws nothing never pays for them. Figure code sits
+#   under `if output.plots:`, which is False when ANALYSIS_HEADLESS=1 (or headless=True).
+# * `output.result('name', table)` records each table with the time it was ready and returns it unchanged, so a
+#   notebook cell still displays it; `finish()` pickles the recorded results to ANALYSIS_RESULTS when that is set.
+#   The tables are computed outside the figure code, so both modes record identical results.
+#
+# The scripts live one folder below this file, so they import it with:
+#     import os, sys
+#     sys.path.append(os.path.abspath(os.pardir))
+#     from script_output import ScriptOutput
+
+import importlib
+import os
+import pickle
+import sys
+import time
+import types
+
+HEADLESS_VARIABLE = 'ANALYSIS_HEADLESS'
+RESULTS_VARIABLE = 'ANALYSIS_RESULTS'
+
+
+class LazyModule(types.ModuleType):
+    """Stand-in for a module that imports it on first attribute access; `on_import` is then called with it once."""
+
+    def __init__(self, name, on_import=None):
+        super().__init__(name)
+        self._on_import = on_import
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self.__name__)
+            if self._on_import is not None:
+                self._on_import(self._module)
+        return self._module
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, attribute):
+        # only reached for attributes the stand-in itself does not have
+        if attribute.startswith('__') and attribute.endswith('__'):
+            raise AttributeError(attribute)
+        return getattr(self._load(), attribute)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+class ScriptOutput:
+    """Lazy plotting imports, the headless switch and the recorded results of one script run.
+
+    `headless=None` reads the ANALYSIS_HEADLESS environment variable. `plotly_template` becomes the default plotly
+    template as soon as any plotly module is imported.
+    """
+
+    def __init__(self, name='analysis', headless=None, plotly_template=None):
+        if headless is None:
+            headless = os.environ.get(HEADLESS_VARIABLE, '').lower() in ('1', 'true', 'yes', 'on')
+        self.name = name
+        self.headless = headless
+        self.plotly_template = plotly_template
+        self.results = {}
+        self.times = {}
+        self._modules = {}
+        self._started = time.perf_counter()
+
+    @property
+    def plots(self):
+        return not self.headless
+
+    def module(self, name):
+        """Lazily imported module `name`; the same stand-in is returned for repeated requests."""
+        if name not in self._modules:
+            on_import = self._set_plotly_template if name.split('.')[0] == 'plotly' else None
+            self._modules[name] = LazyModule(name, on_import)
+        return self._modules[name]
+
+    def function(self, module, name):
+        """Callable `module.name` that imports its module on the first call."""
+        lazy = self.module(module)
+
+        def call(*args, **kwargs):
+            return getattr(lazy, name)(*args, **kwargs)
+
+        call.__name__ = call.__qualname__ = name
+        return call
+
+    def _set_plotly_template(self, module):
+        if self.plotly_template is not None:
+            importlib.import_module('plotly.io').templates.default = self.plotly_template
+
+    def imported(self):
+        """Names of the requested modules that have actually been imported."""
+        return [name for name, module in self._modules.items() if module.loaded]
+
+    def result(self, name, value):
+        """Record a result under `name` with the seconds since start-up, and return it unchanged."""
+        if name in self.results:
+            raise KeyError(f"result {name!r} was already recorded")
+        self.results[name] = value
+        self.times[name] = time.perf_counter() - self._started
+        return value
+
+    def report(self):
+        return {
+            'name': self.name,
+            'headless': self.headless,
+            'imported': self.imported(),
+            'plotting_modules_loaded': sorted(name for name in sys.modules
+                                              if name.split('.')[0] in ('plotly', 'folium', 'matplotlib', 'seaborn')
+                                              and '.' not in name),
+            'started': time.time() - (time.perf_counter() - self._started),
+            'times': dict(self.times),
+            'results': self.results,
+        }
+
+    def finish(self, path=None):
+        """Pickle the report to ANALYSIS_RESULTS (or `path`); returns the report, or None when there is nowhere to
+        write it."""
+        path = os.environ.get(RESULTS_VARIABLE, path)
+        if not path:
+            return None
+        report = self.report()
+        with open(path, 'wb') as file:
+            pickle.dump(report, file)
+        return report
@@ -0,0 +1,175 @@
+# coding: utf-8
+
+# * Lightweight stage instrumentation shared by the analysis scripts.
+# * Wrap each named step in `with profiler.stage('csv load') as stage:` and optionally set `stage.rows`; wall time,
+#   CPU time, peak traced memory and row counts are recorded per stage, and `finish()` prints a summary table and
+#   writes a JSON report.
+# * Profiling is off unless ANALYSIS_PROFILE=1 (or enabled=True); a disabled profiler hands out one shared no-op
+#   stage, so instrumented code pays a method call per stage and nothing else.
+#
+# The scripts live one folder below this file, so they import it with:
+#     import os, sys
+#     sys.path.append(os.path.abspath(os.pardir))
+#     from stage_profiler import StageProfiler
+
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from functools import wraps
+
+ENABLE_VARIABLE = 'ANALYSIS_PROFILE'
+REPORT_VARIABLE = 'ANALYSIS_PROFILE_REPORT'
+
+
+class _NullStage:
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class StageRecord:
+
+    def __init__(self, profiler, name, rows=None):
+        self.profiler = profiler
+        self.name = name
+        self.rows = rows
+        self.depth = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_memory_bytes = None
+        self.memory_delta_bytes = None
+        self.max_rss_bytes = None
+        self.error = None
+
+    def __enter__(self):
+        self.profiler._enter(self)
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.wall_seconds = time.perf_counter() - self._wall
+        self.cpu_seconds = time.process_time() - self._cpu
+        if exc_type is not None:
+            self.error = exc_type.__name__
+        self.profiler._exit(self)
+        return False
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'depth': self.depth,
+            'rows': self.rows,
+            'wall_seconds': self.wall_seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'peak_memory_bytes': self.peak_memory_bytes,
+            'memory_delta_bytes': self.memory_delta_bytes,
+            'max_rss_bytes': self.max_rss_bytes,
+            'error': self.error,
+        }
+
+
+class StageProfiler:
+    """Records named stages; `enabled=None` reads the ANALYSIS_PROFILE environment variable."""
+
+    def __init__(self, name='analysis', enabled=None, trace_memory=True):
+        if enabled is None:
+            enabled = os.environ.get(ENABLE_VARIABLE, '').lower() in ('1', 'true', 'yes', 'on')
+        self.name = name
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.records = []
+        self._stack = []
+        self._started = time.perf_counter()
+
+    def stage(self, name, rows=None):
+        """Context manager for one stage; set `.rows` on the yielded record to report a row count."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return StageRecord(self, name, rows)
+
+    def wrap(self, name=None):
+        """Decorator form of stage(); rows are taken from len() of the result when it has one."""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name or func.__name__) as stage:
+                    result = func(*args, **kwargs)
+                    if stage is not _NULL_STAGE and hasattr(result, '__len__'):
+                        stage.rows = len(result)
+                    return result
+            return wrapper if self.enabled else func
+        return decorator
+
+    def _enter(self, record):
+        record.depth = len(self._stack)
+        self.records.append(record)
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            current, peak = tracemalloc.get_traced_memory()
+            # hand the peak seen so far to the enclosing stage before resetting it for this one
+            if self._stack:
+                parent = self._stack[-1]
+                parent._peak = max(parent._peak, peak)
+            tracemalloc.reset_peak()
+            record._start_memory = current
+            record._peak = current
+        self._stack.append(record)
+
+    def _exit(self, record):
+        self._stack.pop()
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            record._peak = max(record._peak, peak)
+            record.peak_memory_bytes = record._peak
+            record.memory_delta_bytes = current - record._start_memory
+            if self._stack:
+                parent = self._stack[-1]
+                parent._peak = max(parent._peak, record._peak)
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        record.max_rss_bytes = max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+    def report(self):
+        return {
+            'name': self.name,
+            'total_wall_seconds': time.perf_counter() - self._started,
+            'stages': [record.as_dict() for record in self.records],
+        }
+
+    def write_json(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.report(), file, indent=2)
+
+    def summary(self):
+        lines = [f"{'stage':<40} {'rows':>12} {'wall (s)':>9} {'cpu (s)':>9} {'peak MB':>9} {'delta MB':>9}"]
+        for record in self.records:
+            rows = '' if record.rows is None else f'{record.rows:,}'
+            peak = '' if record.peak_memory_bytes is None else f'{record.peak_memory_bytes / 2 ** 20:.1f}'
+            delta = '' if record.memory_delta_bytes is None else f'{record.memory_delta_bytes / 2 ** 20:+.1f}'
+            name = '  ' * record.depth + record.name + (f' [{record.error}]' if record.error else '')
+            lines.append(f"{name:<40} {rows:>12} {record.wall_seconds:>9.3f} {record.cpu_seconds:>9.3f} "
+                         f"{peak:>9} {delta:>9}")
+        lines.append(f"{'total':<40} {'':>12} {time.perf_counter() - self._started:>9.3f}")
+        return '\n'.join(lines)
+
+    def finish(self, json_path=None):
+        """Print the summary and write the JSON report (to ANALYSIS_PROFILE_REPORT if set); no-op when disabled."""
+        if not self.enabled:
+            return None
+        json_path = os.environ.get(REPORT_VARIABLE, json_path)
+        print(self.summary())
+        if json_path:
+            self.write_json(json_path)
+        return self.report()
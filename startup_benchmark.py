@@ -0,0 +1,126 @@
+# coding: utf-8
+
+# * Start-up benchmark of the analysis scripts: every script runs in a fresh interpreter, once headless
+#   (ANALYSIS_HEADLESS=1) and once drawing its figures, and reports the time from launch to its first recorded result
+#   and to the end of the run, and which plotting libraries it imported.
+# * Each mode pickles the tables it recorded (ScriptOutput.finish, via ANALYSIS_RESULTS) and the two sets are
+#   compared table by table; any difference fails the run.
+# * Scripts run from a scratch folder of links to their project files, where the data files also get the names the
+#   scripts read them by, so caches and exports they write never land in the repository. A first untimed run warms
+#   those caches.
+#
+#     python startup_benchmark.py                   # all scripts, best of 3 runs per mode
+#     python startup_benchmark.py metro --repeat 1
+
+import argparse
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SHARED_MODULES = ['script_output.py', 'stage_profiler.py']
+
+# name: (project folder, script, {name the script reads: file in the folder})
+SCRIPTS = {
+    'metro': ('Delhi Metro Network Analysis', 'Delhi Metro Network Analysis.py',
+              {'Delhi Metro Network': 'Delhi-Metro-Network.csv'}),
+    'fitness': ('Fitness Watch Data Analysis', 'Fitness Watch Data Analysis.py',
+                {'Apple Fitness Data': 'Apple-Fitness-Data.csv'}),
+    'stock': ('Stock Market Analysis', 'Quantitative Analysis of Stock Market.py', {'stocks': 'stocks.csv'}),
+    'food': ('Food Delivery and Profit Analysis', 'Food Delivery Cost and Profitability Analysis.py',
+             {'food_orders_new_delhi': 'food_orders_new_delhi.csv'}),
+}
+MODES = {'headless': '1', 'plots': '0'}
+
+
+def _scratch_project(scratch, folder, aliases):
+    for module in SHARED_MODULES:
+        os.symlink(os.path.join(ROOT, module), os.path.join(scratch, module))
+    source = os.path.join(ROOT, folder)
+    project = os.path.join(scratch, folder)
+    os.mkdir(project)
+    for entry in os.listdir(source):
+        os.symlink(os.path.join(source, entry), os.path.join(project, entry))
+    for alias, entry in aliases.items():
+        os.symlink(os.path.join(source, entry), os.path.join(project, alias))
+    return project
+
+
+def run_script(project, script, headless, results_path):
+    """Run one script in a fresh interpreter: (seconds to the first result, total seconds, report)."""
+    environment = dict(os.environ, ANALYSIS_HEADLESS=headless, ANALYSIS_RESULTS=results_path, MPLBACKEND='Agg')
+    launched = time.time()
+    completed = subprocess.run([sys.executable, script], cwd=project, env=environment,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    total = time.time() - launched
+    if completed.returncode != 0:
+        raise RuntimeError(f"{script} failed:\n{completed.stderr}")
+    with open(results_path, 'rb') as file:
+        report = pickle.load(file)
+    first = report['started'] + min(report['times'].values()) - launched if report['times'] else np.nan
+    return first, total, report
+
+
+def same_result(a, b):
+    if isinstance(a, (pd.DataFrame, pd.Series, pd.Index)):
+        return type(a) is type(b) and a.equals(b) and (isinstance(a, pd.Index) or a.index.equals(b.index))
+    if isinstance(a, np.ndarray):
+        return isinstance(b, np.ndarray) and a.dtype == b.dtype and np.array_equal(a, b, equal_nan=a.dtype.kind == 'f')
+    if isinstance(a, (tuple, list)):
+        return type(a) is type(b) and len(a) == len(b) and all(same_result(x, y) for x, y in zip(a, b))
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(same_result(a[key], b[key]) for key in a)
+    return bool(a == b) or (a != a and b != b)
+
+
+def compare_results(first, second):
+    """Names of the results that differ between two reports (including results only one of them has)."""
+    names = list(dict.fromkeys([*first['results'], *second['results']]))
+    return [name for name in names if name not in first['results'] or name not in second['results']
+            or not same_result(first['results'][name], second['results'][name])]
+
+
+def bench_script(name, repeat=3):
+    folder, script, aliases = SCRIPTS[name]
+    with tempfile.TemporaryDirectory() as scratch:
+        project = _scratch_project(scratch, folder, aliases)
+        results_path = os.path.join(scratch, 'results.pkl')
+        run_script(project, script, MODES['headless'], results_path)
+        rows, reports = [], {}
+        for mode, headless in MODES.items():
+            runs = [run_script(project, script, headless, results_path) for _ in range(repeat)]
+            first, total = min(run[0] for run in runs), min(run[1] for run in runs)
+            reports[mode] = runs[-1][2]
+            rows.append({'Script': name, 'Mode': mode, 'First Result (s)': first, 'Total (s)': total,
+                         'Results': len(reports[mode]['results']),
+                         'Plotting Modules': ', '.join(reports[mode]['plotting_modules_loaded']) or '-'})
+    differences = compare_results(reports['headless'], reports['plots'])
+    if differences:
+        raise AssertionError(f"{name}: results differ between modes: {', '.join(differences)}")
+    return pd.DataFrame(rows)
+
+
+BENCHMARKS = {name: bench_script for name in SCRIPTS}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Start-up benchmark of the analysis scripts.')
+    parser.add_argument('names', nargs='*', help=f"scripts to run, any of {', '.join(SCRIPTS)}")
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per mode, the best is reported')
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in SCRIPTS]
+    if unknown:
+        parser.error(f"unknown scripts {unknown}, expected some of {list(SCRIPTS)}")
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+
+    with pd.option_context('display.width', 160, 'display.max_columns', None):
+        for name in args.names or SCRIPTS:
+            print(BENCHMARKS[name](name, args.repeat).to_string(index=False, float_format='{:.3f}'.format))
+            print()